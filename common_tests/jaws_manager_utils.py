@@ -8,6 +8,19 @@ UNDERLYING_CENT_SP = "MOT:JAWS{}:{}CENT:SP"
 MOD_GAP = "JAWMAN:MOD:{}GAP:SP"
 
 
+def within_tolerance(expected, tolerance):
+    """
+    Args:
+        expected: the expected value
+        tolerance: the allowable deviation from the expected value
+    Returns:
+        a predicate which is True for a value within the tolerance of the expected value
+    """
+    def _within_tolerance(val):
+        return abs(float(val) - expected) <= tolerance
+    return _within_tolerance
+
+
 @six.add_metaclass(abc.ABCMeta)
 class JawsManagerBase(object):
     """
@@ -33,9 +46,11 @@ class JawsManagerBase(object):
         expected_gaps = [self.ca.get_pv_value(UNDERLYING_GAP_SP.format(jaw, direction)) for jaw in range(1, self.get_num_of_jaws() + 1)]
 
         self.ca.set_pv_value(self.get_sample_pv() + ":{}CENT:SP".format(direction), 10)
+        expected = {}
         for jaw in range(1, self.get_num_of_jaws() + 1):
-            self.ca.assert_that_pv_is_number(UNDERLYING_CENT_SP.format(jaw, direction), 10, 0.1)
-            self.ca.assert_that_pv_is_number(UNDERLYING_GAP_SP.format(jaw, direction), expected_gaps[jaw - 1], 0.1)
+            expected[UNDERLYING_CENT_SP.format(jaw, direction)] = within_tolerance(10, 0.1)
+            expected[UNDERLYING_GAP_SP.format(jaw, direction)] = within_tolerance(expected_gaps[jaw - 1], 0.1)
+        self.ca.assert_pvs_satisfy(expected)
 
     def _test_WHEN_sizes_at_moderator_and_sample_changed_THEN_centres_of_all_jaws_unchanged(self, direction):
         # Set up jaws initially to have "custom" centre.
@@ -50,10 +65,10 @@ class JawsManagerBase(object):
         self.ca.set_pv_value(MOD_GAP.format(direction), 22.222)
 
         # Assert that centres are unchanged
-        for jaw in range(1, self.get_num_of_jaws() + 1):
-            self.ca.assert_that_pv_is_number(UNDERLYING_CENT_SP.format(jaw, direction), centre * jaw, 0.001)
+        self.ca.assert_pvs_satisfy({UNDERLYING_CENT_SP.format(jaw, direction): within_tolerance(centre * jaw, 0.001)
+                                    for jaw in range(1, self.get_num_of_jaws() + 1)})
 
     def _test_WHEN_sample_gap_set_THEN_other_jaws_as_expected(self, direction, sample_gap, expected):
         self.ca.set_pv_value(self.get_sample_pv() + ":{}GAP:SP".format(direction), sample_gap)
-        for i, exp in enumerate(expected):
-            self.ca.assert_that_pv_is_number(UNDERLYING_GAP_SP.format(i + 1, direction), exp, 0.1, timeout=1)
+        self.ca.assert_pvs_satisfy({UNDERLYING_GAP_SP.format(i + 1, direction): within_tolerance(exp, 0.1)
+                                    for i, exp in enumerate(expected)}, timeout=1)
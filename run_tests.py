@@ -3,31 +3,57 @@ Run the tests.
 """
 
 import argparse
+import functools
+import importlib.util
+import multiprocessing
+import multiprocessing.util
 import os
 import sys
+import time
 import traceback
 import unittest
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import six
 import xmlrunner
 import glob
 
-from run_utils import package_contents, modified_environment
+from run_utils import package_contents, modified_environment, merge_report_directories
 from run_utils import ModuleTests
 
-from utils.device_launcher import device_launcher, device_collection_launcher
-from utils.emulator_launcher import LewisLauncher, NullEmulatorLauncher
+from utils.channel_pool import ChannelPool
+from utils.device_launcher import device_launcher, device_collection_launcher, launch_dependencies, \
+    device_fingerprint, RunningDevicePool
+from utils.emulator_launcher import LewisLauncher, NullEmulatorLauncher, LewisHost, HostedLewisLauncher
+from utils.job_pipeline import JobPipeline, device_claims, CLAIM_KEYS
 from utils.ioc_launcher import IocLauncher, EPICS_TOP
 from utils.free_ports import get_free_ports
+from utils.liveness import LivenessWatcher, short_circuiting, DEFAULT_CA_FAILURE_LIMIT
+from utils.module_manifest import build_manifest
+from utils.result_cache import ResultCache, RESULT_CACHE_DIRECTORY_NAME
+from utils.process_register import ProcessRegister
+from utils.phase_timing import PhaseTimingTestResult, take_phases, write_phase_report, print_slowest_phases
+from utils.job_history import JobHistory, RemainingTimeEstimate, HISTORY_FILE_NAME, durations_of_tests, job_key
+from utils.sharding import parse_shard, assign_shards
 from utils.test_modes import TestModes
 
+# Directory the JUnit XML reports are written to
+REPORTS_DIRECTORY = "test-reports"
 
-def clean_environment():
+
+def clean_environment(ioc_names=None):
     """
     Cleans up the test environment between tests.
+
+    Args:
+        ioc_names: names of the IOCs to remove the autosave files of; None to remove the autosave files of all IOCs
     """
     autosave_directory = os.path.join(var_dir, "autosave")
-    files = glob.glob('{}/*SIM/*'.format(autosave_directory))
+    if ioc_names is None:
+        files = glob.glob('{}/*SIM/*'.format(autosave_directory))
+    else:
+        files = [autosave_file for ioc_name in ioc_names
+                 for autosave_file in glob.glob('{}/{}_*SIM/*'.format(autosave_directory, ioc_name))]
     for autosave_file in files:
         try:
             os.remove(autosave_file)
@@ -49,15 +75,36 @@ def check_and_do_pre_ioc_launch_hook(ioc):
         raise ValueError("Pre IOC launch hook not callable, so nothing has been done for it.")
 
 
-def make_device_launchers_from_module(test_module, mode):
+def hosted_lewis_emulators(iocs, mode):
+    """
+    Returns the names of the IOCs whose Lewis emulators are run in one Lewis host rather than a Lewis process each.
+    These are the IOCs with a Lewis emulator, launched by the default launcher, which do not set "lewis_host" to
+    False, as long as a module has more than one of them.
+    Args:
+        iocs: the IOC entries of a module
+        mode (TestModes): The mode to run in.
+
+    Returns:
+        set of IOC names
+    """
+    if mode == TestModes.RECSIM:
+        return set()
+    hosted = {ioc["name"] for ioc in iocs if "emulator" in ioc and "emulator_launcher_class" not in ioc
+              and ioc.get("lewis_host", True)}
+    return hosted if len(hosted) > 1 else set()
+
+
+def make_device_launchers_from_module(test_module, mode, device_pool=None):
     """
     Returns a list of device launchers for the given test module.
     Args:
         test_module: module containing IOC tests
         mode (TestModes): The mode to run in.
+        device_pool (RunningDevicePool): pool of devices left running by earlier modules to reuse and to keep the
+            devices of this module running in; None to launch and stop every device with the module
 
     Returns:
-        list of device launchers (context managers which launch ioc + emulator pairs)
+        dictionary of ioc name to device launcher (context managers which launch ioc + emulator pairs)
 
     """
     try:
@@ -73,11 +120,21 @@ def make_device_launchers_from_module(test_module, mode):
             raise ValueError("IOC entry must have a 'name' attribute which should give the IOC name")
         if "directory" not in ioc:
             raise ValueError("IOC entry must have a 'directory' attribute which should give the path to the IOC")
+    if len({ioc["name"] for ioc in iocs}) != len(iocs):
+        raise ValueError("IOC entries must have different names")
 
     print("Testing module {} in {} mode.".format(test_module.__name__, TestModes.name(mode)))
 
-    device_launchers = []
+    hosted_emulators = hosted_lewis_emulators(iocs, mode)
+    lewis_hosts = {}
+    device_launchers = {}
     for ioc in iocs:
+        fingerprint = device_fingerprint(ioc, mode) if device_pool is not None else None
+        if fingerprint is not None:
+            reused_device = device_pool.reused_device(fingerprint, ioc)
+            if reused_device is not None:
+                device_launchers[ioc["name"]] = reused_device
+                continue
 
         check_and_do_pre_ioc_launch_hook(ioc)
 
@@ -94,7 +151,14 @@ def make_device_launchers_from_module(test_module, mode):
         ioc_launcher_class = ioc.get("ioc_launcher_class", IocLauncher)
         ioc_launcher = ioc_launcher_class(test_module.__name__, ioc, mode, var_dir)
 
-        if "emulator" in ioc and mode != TestModes.RECSIM:
+        if ioc["name"] in hosted_emulators:
+            # Emulators run with a different Python or path to devices need a host of their own
+            host_key = (ioc.get("python_path"), ioc.get("lewis_additional_path"))
+            if host_key not in lewis_hosts:
+                lewis_hosts[host_key] = LewisHost(test_module.__name__, var_dir, ioc)
+            emulator_launcher = HostedLewisLauncher(test_module.__name__, ioc["emulator"], var_dir, emmulator_port,
+                                                    ioc, lewis_hosts[host_key])
+        elif "emulator" in ioc and mode != TestModes.RECSIM:
             emulator_launcher_class = ioc.get("emulator_launcher_class", LewisLauncher)
             emulator_launcher = emulator_launcher_class(test_module.__name__, ioc["emulator"], var_dir,
                                                         emmulator_port, ioc)
@@ -103,12 +167,17 @@ def make_device_launchers_from_module(test_module, mode):
         else:
             emulator_launcher = None
 
-        device_launchers.append(device_launcher(ioc_launcher, emulator_launcher))
+        device = device_launcher(ioc_launcher, emulator_launcher)
+        if fingerprint is not None:
+            device = device_pool.keep_running(fingerprint, ioc_launcher, device)
+        device_launchers[ioc["name"]] = device
 
     return device_launchers
 
 
-def load_and_run_tests(test_names, failfast, ask_before_running_tests, tests_mode=None):
+def load_and_run_tests(test_names, failfast, ask_before_running_tests, tests_mode=None, jobs=1, reuse_iocs=True,
+                       history_file=None, slowest_phases=20, shard=None, shard_history_file=None,
+                       skip_unchanged=False, pipeline_jobs=True):
     """
     Loads and runs the dotted unit tests to be run.
 
@@ -117,37 +186,634 @@ def load_and_run_tests(test_names, failfast, ask_before_running_tests, tests_mod
         failfast: Determines if tests abort after first failure.
         ask_before_running_tests: ask whether to run the tests before running them
         tests_mode: test mode to run (default: both RECSIM and DEVSIM)
+        jobs: number of worker processes to run (module, mode) pairs in; 1 runs them in this process
+        reuse_iocs: keep IOCs running between modules which launch them in the same way (only when jobs is 1)
+        history_file: file of job timings used to run the longest jobs first; None for the default in the var dir
+        slowest_phases: number of the slowest phases of the run to print at the end
+        shard: tuple of the index (from 1) and number of shards to run only this shard's share of the jobs; None to
+            run all the jobs
+        shard_history_file: file of job timings to balance the shards by; it must be the same for every shard. None to
+            split the jobs by a hash of their names
+        skip_unchanged: skip jobs which passed when last run with the same inputs (the test module, the modules it
+            imports, its test data and the IOCs and emulators it launches), reporting the results of that run
+        pipeline_jobs: launch the IOCs of the next module while the tests of the current module run and stop the IOCs
+            of finished modules in the background (only when jobs is 1)
 
     Returns:
         boolean: True if all tests pass and false otherwise.
     """
 
     modules_to_be_loaded = sorted({test.split(".")[0].strip() for test in test_names})
-    modules_to_be_tested = [ModuleTests(module) for module in modules_to_be_loaded]
+    manifest = build_manifest(tests_package_directory(arguments.tests_path))
+    modules_to_be_tested = []
+    failed_modules = []
 
     modes = set()
 
-    for module in modules_to_be_tested:
+    for module_name in modules_to_be_loaded:
+        module = ModuleTests(module_name, manifest.get(module_name), arguments.tests_path)
         # Add tests that are either the module or a subset of the module i.e. module.TestClass
         module.tests = [test for test in test_names if test == module.name or test.startswith(module.name + ".")]
-        modes.update(module.modes)
+        try:
+            modes.update(module.modes)
+        except Exception:
+            failed_modules.append((module.name, traceback.format_exc()))
+            continue
+        modules_to_be_tested.append(module)
 
-    test_results = []
+    test_jobs = []
 
     for mode in modes:
         if tests_mode is not None and mode != tests_mode:
             continue
 
-        modules_to_be_tested_in_current_mode = [module for module in modules_to_be_tested if mode in module.modes]
+        test_jobs.extend((module, mode) for module in modules_to_be_tested if mode in module.modes)
+
+    history = JobHistory(history_file if history_file is not None else os.path.join(var_dir, HISTORY_FILE_NAME))
+
+    if shard is not None:
+        # Every shard must split the jobs the same way, so only balance by time using a history file they all share
+        shard_history = JobHistory(shard_history_file) if shard_history_file is not None else None
+        test_jobs = jobs_in_shard(test_jobs, shard, shard_history)
+        failed_modules = [(name, msg) for name, msg in failed_modules
+                          if assign_shards([name], shard[1])[name] == shard[0]]
+        print("Running shard {} of {}: {} jobs".format(shard[0], shard[1], len(test_jobs)))
+
+    failed_to_load = [report_module_load_failure(name, msg) for name, msg in failed_modules]
+    test_jobs = order_jobs_longest_first(test_jobs, history)
+
+    result_cache_directory = os.path.join(var_dir, RESULT_CACHE_DIRECTORY_NAME) if skip_unchanged else None
+
+    run_phases = {}
+    if jobs > 1:
+        test_results = run_jobs_in_parallel(test_jobs, jobs, failfast, history, run_phases, result_cache_directory)
+    else:
+        result_cache = ResultCache(result_cache_directory) if skip_unchanged else None
+        test_results = run_jobs_in_series(test_jobs, failfast, ask_before_running_tests, reuse_iocs, history,
+                                          run_phases, result_cache, pipeline_jobs and not ask_before_running_tests)
+
+    print("Phase timings written to {}".format(write_phase_report(run_phases, REPORTS_DIRECTORY)))
+    print_slowest_phases(run_phases, slowest_phases)
+
+    return all(test_result is True for test_result in failed_to_load + test_results)
+
+
+def tests_package_directory(package_name):
+    """
+    Args:
+        package_name: name of the package containing the test modules
+    Returns:
+        str: the directory of the package
+    """
+    return importlib.util.find_spec(package_name).submodule_search_locations[0]
+
+
+def report_module_load_failure(module_name, msg, report_directory=REPORTS_DIRECTORY):
+    """
+    Report that a module could not be loaded as a failing test, so that it appears in the test reports.
+
+    Args:
+        module_name: Name of the module that failed to load.
+        msg: Message explaining the failure.
+        report_directory: Directory to write the JUnit XML report to.
+
+    Returns:
+        bool: False, the result of the module
+    """
+    print("Error loading module {}: {}".format(module_name, msg))
+    runner = xmlrunner.XMLTestRunner(output=report_directory, stream=sys.stdout)
+    runner.run(ReportFailLoadTestsuiteTestCase(module_name, msg))
+    return False
+
+
+def jobs_in_shard(test_jobs, shard, history=None):
+    """
+    Select the jobs one shard of the run is to run.
+
+    Args:
+        test_jobs: list of (ModuleTests, TestModes) pairs of the whole run
+        shard: tuple of the index (from 1) and number of shards
+        history (JobHistory): timings to balance the shards by time with; None to split the jobs by a hash of their
+            names
+    Returns:
+        list: the jobs of the shard
+    """
+    index, count = shard
+    keys = {job: job_key(job[0].name, TestModes.name(job[1])) for job in test_jobs}
+    durations = None
+    if history is not None:
+        durations = {key: history.estimate(job[0].name, TestModes.name(job[1])) for job, key in keys.items()}
+    shards = assign_shards(keys.values(), count, durations)
+    return [job for job in test_jobs if shards[keys[job]] == index]
+
+
+def order_jobs_longest_first(test_jobs, history):
+    """
+    Order (module, mode) jobs so that the jobs which took longest when they were last run start first; jobs which have
+    not been run before are expected to take the mean time of those that have.
+
+    Args:
+        test_jobs: list of (ModuleTests, TestModes) pairs
+        history (JobHistory): timings of earlier runs
+    Returns:
+        list: the jobs in the order to run them
+    """
+    return sorted(test_jobs, key=lambda job: -history.estimate(job[0].name, TestModes.name(job[1])))
+
+
+def record_job(history, remaining_time, module, mode, timings, run_phases):
+    """
+    Record the timings of a finished job in the history and phases of the run, and print the estimated time left in
+    the run.
+
+    Args:
+        history (JobHistory): history to record the timings in; it is saved so timings are kept if the run stops
+        remaining_time (RemainingTimeEstimate): estimate of the time left in the run
+        module (ModuleTests): module of the job
+        mode (TestModes): mode of the job
+        timings: the job's timings from run_tests
+        run_phases: dictionary of job name to the phases of the job, to add the job's phases to
+    """
+    run_phases["{} ({})".format(module.name, TestModes.name(mode))] = timings.get("phases", [])
+    if "tests" in timings:
+        history.record(module.name, TestModes.name(mode), timings)
+        try:
+            history.save()
+        except (IOError, OSError) as e:
+            print("Unable to save test history to {}: {}".format(history.path, e))
+    remaining_time.job_finished((module.name, mode))
+
+
+def estimate_jobs(test_jobs, history):
+    """
+    Args:
+        test_jobs: list of (ModuleTests, TestModes) pairs
+        history (JobHistory): timings of earlier runs
+    Returns:
+        dict: (module name, mode) to the expected duration of each job
+    """
+    return {(module.name, mode): history.estimate(module.name, TestModes.name(mode)) for module, mode in test_jobs}
+
+
+def job_fingerprints(module, mode):
+    """
+    Fingerprints of a job's devices from its manifest entry, to compare with those of other jobs when planning the run
+    without importing their modules. Values which are not literals are fingerprinted as their source text, so these
+    are not the fingerprints of the devices as launched; see launch_fingerprints.
+
+    Args:
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+    Returns:
+        set: fingerprints of the reusable devices the job launches; empty if the module has no manifest entry
+    """
+    fingerprints = {device_fingerprint(ioc, mode) for ioc in module.manifest_entry.get("iocs") or []}
+    fingerprints.discard(None)
+    return fingerprints
+
+
+def launch_fingerprints(module, mode):
+    """
+    Args:
+        module (ModuleTests): the module of a job which is about to run, which is imported if it has not been
+        mode (TestModes): the mode of the job
+    Returns:
+        set: fingerprints of the reusable devices the job launches, as the running device pool has them
+    """
+    try:
+        iocs = getattr(module.file, "IOCS", [])
+    except Exception:
+        return set()  # reported when the job is run
+    fingerprints = {device_fingerprint(ioc, mode) for ioc in iocs}
+    fingerprints.discard(None)
+    return fingerprints
+
+
+def job_device_keys(module, mode):
+    """
+    Args:
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+    Returns:
+        set: the IOC name, directory, emulator and mode of each device the job launches, from the module's manifest
+    """
+    return {(ioc["name"], ioc["directory"], ioc["emulator"], mode) for ioc in module.iocs}
+
+
+def order_jobs_for_device_reuse(test_jobs):
+    """
+    Order (module, mode) jobs so that jobs launching the same devices run one after another. Each job is followed by
+    the remaining job of the same mode which shares the most devices with it, so the order is otherwise kept. Devices
+    are compared using the manifest so that modules are not imported to plan the run.
+
+    Args:
+        test_jobs: list of (ModuleTests, TestModes) pairs
+    Returns:
+        list: the jobs in the order to run them
+    """
+    remaining = list(test_jobs)
+    ordered = []
+    running = set()
+    while remaining:
+        current_mode = ordered[-1][1] if ordered else remaining[0][1]
+        candidates = [job for job in remaining if job[1] == current_mode] or remaining
+        next_job = max(candidates, key=lambda job: len(job_device_keys(*job) & running))
+        remaining.remove(next_job)
+        ordered.append(next_job)
+        running = job_device_keys(*next_job)
+    return ordered
+
+
+def job_claims(module):
+    """
+    Args:
+        module (ModuleTests): the module of a job which is being launched or has run, so is imported
+    Returns:
+        set: the claims of the devices the job launches (see device_claims)
+    """
+    try:
+        iocs = getattr(module.file, "IOCS", [])
+    except Exception:
+        return set()  # reported when the job is run
+    return device_claims(iocs)
+
+
+def planned_job_claims(module):
+    """
+    Args:
+        module (ModuleTests): the module of the job
+    Returns:
+        set: the claims of the devices the job launches from its manifest entry (see device_claims); None if the
+            module has no manifest entry or a value its claims depend on is not a literal
+    """
+    iocs = module.manifest_entry.get("iocs")
+    if iocs is None:
+        return None
+    for unresolved_keys in module.manifest_entry["unresolved_ioc_keys"]:
+        if set(unresolved_keys) & set(CLAIM_KEYS):
+            return None
+    return device_claims(iocs)
+
+
+def job_is_cached(result_cache, module, mode):
+    """
+    Args:
+        result_cache (ResultCache): the result cache; None if it is not used
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+    Returns:
+        bool: True if the reports of the job are likely to be restored from the result cache rather than the job being
+            run (see ResultCache.holds_unchanged)
+    """
+    if result_cache is None:
+        return False
+    return result_cache.holds_unchanged(result_cache_key(module, mode))
+
+
+def job_to_launch_ahead(job, pending_jobs, device_pool, result_cache):
+    """
+    Choose the job whose devices to launch while the tests of a job run: the first pending job of the same mode (the
+    mode of the IOCs is shared by the whole process) whose devices claim none of the IOC names, PV prefixes, existence
+    PVs, macros names or emulators of the running job's devices (see device_claims). Nothing is launched ahead if the
+    next job reuses devices of the running job, as it has little to launch. Jobs with a pre IOC launch hook are not
+    launched ahead, as the hook could change something the running tests use, nor are jobs whose reports will be
+    restored from the result cache. Pending jobs are planned from their manifest entries, so their modules are only
+    imported when they run; jobs whose claims can not be worked out from the manifest are not launched ahead.
+
+    Args:
+        job: the running (ModuleTests, TestModes) job
+        pending_jobs: list of the jobs still to run, in order
+        device_pool (RunningDevicePool): pool of devices kept running between jobs; None if devices are not reused
+        result_cache (ResultCache): the result cache; None if it is not used
+    Returns:
+        the job to launch the devices of; None to launch nothing ahead
+    """
+    if not pending_jobs:
+        return None
+    if device_pool is not None and job_fingerprints(*pending_jobs[0]) & job_fingerprints(*job):
+        return None
+    running_claims = job_claims(job[0])
+    for module, mode in pending_jobs:
+        if mode != job[1]:
+            continue
+        claims = planned_job_claims(module)
+        if claims is None or claims & running_claims:
+            continue
+        if any("pre_ioc_launch_hook" in ioc for ioc in module.manifest_entry["iocs"]):
+            continue
+        if job_is_cached(result_cache, module, mode):
+            continue
+        return module, mode
+    return None
+
+
+def run_jobs_in_series(test_jobs, failfast, ask_before_running_tests, reuse_iocs, history, run_phases,
+                       result_cache=None, pipeline_jobs=False):
+    """
+    Runs (module, mode) jobs one after another in this process.
+
+    If IOCs are reused, a device is kept running at the end of a job when the next job launches a device with the
+    same fingerprint, and that job uses the running device instead of launching its own.
+
+    If jobs are pipelined, once the devices of a job are running the devices of a later job which do not clash with
+    them are launched in the background (see job_to_launch_ahead), and that job is run next. The devices of finished
+    jobs are stopped in the background; devices are only launched once any device with the same claims has stopped.
+    Args:
+        test_jobs: list of (ModuleTests, TestModes) pairs
+        failfast: Determines if test suit aborts after first failure.
+        ask_before_running_tests: ask whether to run the tests before running them
+        reuse_iocs: True to keep devices running between jobs which launch the same devices
+        history (JobHistory): history to record the timings of each job in
+        run_phases: dictionary to add the phases of each job to
+        result_cache (ResultCache): cache of the reports of jobs which passed, to skip jobs whose inputs have not
+            changed; None to run every job
+        pipeline_jobs: True to launch the devices of the next job while a job runs and stop devices in the background
+
+    Returns:
+        list: result of each job; True if all its tests passed
+    """
+    device_pool = RunningDevicePool() if reuse_iocs else None
+    if reuse_iocs:
+        test_jobs = order_jobs_for_device_reuse(test_jobs)
+    remaining_time = RemainingTimeEstimate(estimate_jobs(test_jobs, history))
+    pipeline = JobPipeline(lambda job: (make_job_devices(job[0], job[1], device_pool), job_claims(job[0]))) \
+        if pipeline_jobs else None
 
-        for module in modules_to_be_tested_in_current_mode:
-            clean_environment()
-            device_launchers = make_device_launchers_from_module(module.file, mode)
-            test_results.append(
-                run_tests(arguments.prefix, module.name, module.tests, device_collection_launcher(device_launchers),
-                          failfast, ask_before_running_tests))
+    test_results = []
+    pending_jobs = list(test_jobs)
+    try:
+        while pending_jobs:
+            job = module, mode = pending_jobs.pop(0)
+            timings = {}
+
+            def launch_next_job():
+                next_job = job_to_launch_ahead(job, pending_jobs, device_pool, result_cache)
+                if next_job is None:
+                    return
+                print("Launching the IOCs of {} in {} mode while the tests of {} run".format(
+                    next_job[0].name, TestModes.name(next_job[1]), module.name))
+                if pipeline.launch_ahead(next_job):
+                    pending_jobs.remove(next_job)
+                    pending_jobs.insert(0, next_job)
+
+            test_results.append(run_job_using_result_cache(
+                result_cache, module, mode, REPORTS_DIRECTORY,
+                lambda job_report_directory: run_job_in_series(module, mode, failfast, ask_before_running_tests,
+                                                               device_pool, job_report_directory, timings, pipeline,
+                                                               launch_next_job)))
+            if device_pool is not None:
+                # Devices which are not reused are stopped here rather than at the end of run_tests
+                teardown_start = time.time()
+                next_fingerprints = launch_fingerprints(*pending_jobs[0]) if pending_jobs else set()
+                if pipeline is not None:
+                    pipeline.stop_in_background(job, job_claims(module),
+                                                functools.partial(RunningDevicePool.stop,
+                                                                  device_pool.detach(keep=next_fingerprints)))
+                else:
+                    device_pool.release(keep=next_fingerprints)
+                timings["teardown"] = timings.get("teardown", 0.0) + time.time() - teardown_start
+                timings["phases"] = timings.get("phases", []) + take_phases()
+            record_job(history, remaining_time, module, mode, timings, run_phases)
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+            for (module, mode), phases in pipeline.teardown_phases.items():
+                run_phases.setdefault("{} ({})".format(module.name, TestModes.name(mode)), []).extend(phases)
+        if device_pool is not None:
+            device_pool.close()
+
+    return test_results
+
+
+def make_job_devices(module, mode, device_pool):
+    """
+    Args:
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+        device_pool (RunningDevicePool): pool of devices to reuse and keep devices running in; None to not reuse them
+    Returns:
+        context manager which launches the devices of the job
+    """
+    clean_environment([ioc["name"] for ioc in getattr(module.file, "IOCS", [])])
+    device_launchers = make_device_launchers_from_module(module.file, mode, device_pool)
+    return device_collection_launcher(device_launchers, launch_dependencies(module.file.IOCS))
 
-    return all(test_result is True for test_result in test_results)
+
+def run_job_in_series(module, mode, failfast, ask_before_running_tests, device_pool, report_directory, timings,
+                      pipeline=None, on_launched=None):
+    """
+    Runs the tests in a module in the given mode in this process.
+
+    Args:
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+        failfast: Determines if test suit aborts after first failure.
+        ask_before_running_tests: ask whether to run the tests before running them
+        device_pool (RunningDevicePool): pool of devices to reuse and keep devices running in; None to not reuse them
+        report_directory: Directory to write the JUnit XML reports to.
+        timings: Dictionary to add the timings of the job to.
+        pipeline (JobPipeline): pipeline to take the job's devices from, if they were launched ahead, and to stop them
+            in; None to launch and stop them with the job
+        on_launched: function to call once the job's devices are running (only if pipelined); None for nothing
+
+    Returns:
+        bool: True if all tests pass and false otherwise.
+    """
+    try:
+        if pipeline is not None:
+            device_collection = pipeline.devices((module, mode), on_launched)
+        else:
+            device_collection = make_job_devices(module, mode, device_pool)
+    except Exception:
+        return report_module_load_failure(module.name, traceback.format_exc(), report_directory)
+    return run_tests(arguments.prefix, module.name, module.tests, device_collection, failfast,
+                     ask_before_running_tests, report_directory=report_directory, timings=timings,
+                     iocs=module.file.IOCS)
+
+
+def result_cache_key(module, mode):
+    """
+    Args:
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+    Returns:
+        str: key of the job in the result cache, which includes the tests run so that running part of a module does not
+            stand for running all of it
+    """
+    return "{}:{}".format(job_key(module.name, TestModes.name(mode)), ",".join(sorted(module.tests)))
+
+
+def run_job_using_result_cache(result_cache, module, mode, report_directory, run_job):
+    """
+    Run a job, unless the result cache holds the reports of a run which passed with the same inputs, in which case
+    those reports are copied to the report directory instead.
+
+    The reports of a job which is run are written to a staging directory so that only its own reports are stored in
+    the cache if it passes, then moved into the report directory.
+
+    Args:
+        result_cache (ResultCache): the result cache; None to always run the job
+        module (ModuleTests): the module of the job
+        mode (TestModes): the mode of the job
+        report_directory: directory to write or copy the job's JUnit XML reports to
+        run_job: function which runs the job given the directory to write its reports to and returns its result
+
+    Returns:
+        bool: True if all tests pass and false otherwise.
+    """
+    if result_cache is None:
+        return run_job(report_directory)
+
+    key = result_cache_key(module, mode)
+    try:
+        inputs_hash = result_cache.inputs_hash(key, module.file.__file__, getattr(module.file, "IOCS", []))
+    except Exception:
+        # A module which can not be imported is reported when the job is run
+        return run_job(report_directory)
+
+    try:
+        if result_cache.restore(key, inputs_hash, report_directory):
+            print("Skipping {} in {} mode: unchanged since it last passed".format(module.name, TestModes.name(mode)))
+            return True
+    except (IOError, OSError) as e:
+        print("Unable to read cached reports of {} in {} mode: {}".format(module.name, TestModes.name(mode), e))
+
+    staging_directory = os.path.join(report_directory, "staging_{}".format(os.getpid()))
+    result = run_job(staging_directory)
+    try:
+        if result is True:
+            result_cache.store(key, inputs_hash, staging_directory)
+        result_cache.save()
+    except (IOError, OSError) as e:
+        print("Unable to cache reports of {} in {} mode: {}".format(module.name, TestModes.name(mode), e))
+    merge_report_directories([staging_directory], report_directory, remove_sources=True)
+    return result
+
+
+def run_jobs_in_parallel(test_jobs, number_of_workers, failfast, history, run_phases, result_cache_directory=None):
+    """
+    Runs (module, mode) jobs in a pool of worker processes.
+
+    Each worker launches its own IOCs and emulators with its own PV prefix, var dir and report directory so that
+    workers do not interfere with each other. The reports of all the workers are merged into the reports directory
+    once every job has finished.
+
+    Args:
+        test_jobs: List of (ModuleTests, TestModes) pairs to run.
+        number_of_workers: The number of worker processes to use.
+        failfast: Determines if no more jobs are started after the first failure.
+        history (JobHistory): History to record the timings of each job in. Jobs are started in the order given, so
+            putting the longest first keeps workers busy until the end of the run.
+        run_phases: Dictionary to add the phases of each job to.
+        result_cache_directory: Directory of the cache of the reports of jobs which passed, to skip jobs whose inputs
+            have not changed; None to run every job.
+
+    Returns:
+        list: the result of each job that was run; True if all of its tests passed. Jobs which were not started because
+            of a failure under failfast are listed as not run rather than given a result.
+    """
+    remaining_time = RemainingTimeEstimate(estimate_jobs(test_jobs, history), number_of_workers)
+    worker_ids = multiprocessing.Queue()
+    for worker_id in range(1, number_of_workers + 1):
+        worker_ids.put(worker_id)
+
+    test_results = []
+    not_run = []
+    with ProcessPoolExecutor(max_workers=number_of_workers, initializer=initialise_worker,
+                             initargs=(worker_ids, arguments, var_dir, sys.path)) as executor:
+        futures = {executor.submit(run_job_in_worker, module.name, module.tests, mode, failfast,
+                                   result_cache_directory): (module, mode)
+                   for module, mode in test_jobs}
+
+        for future in as_completed(futures):
+            module, mode = futures[future]
+            if future.cancelled():
+                not_run.append("{} ({})".format(module.name, TestModes.name(mode)))
+                continue
+            try:
+                result, timings = future.result()
+            except Exception:
+                print("Error running module {} in {} mode: {}".format(
+                    module.name, TestModes.name(mode), traceback.format_exc()))
+                result, timings = False, {}
+            test_results.append(result)
+            record_job(history, remaining_time, module, mode, timings, run_phases)
+
+            if failfast and result is not True:
+                for pending_future in futures:
+                    pending_future.cancel()
+
+    merge_report_directories(
+        [worker_report_directory(worker_id) for worker_id in range(1, number_of_workers + 1)], REPORTS_DIRECTORY,
+        remove_sources=True)
+
+    if not_run:
+        print("Not run after a failure (failfast): {}".format(", ".join(sorted(not_run))))
+    return test_results
+
+
+def worker_report_directory(worker_id):
+    """
+    Args:
+        worker_id: the id of the worker process
+
+    Returns:
+        str: the directory the worker process writes its reports to
+    """
+    return os.path.join(REPORTS_DIRECTORY, "worker_{:02d}".format(worker_id))
+
+
+def initialise_worker(worker_ids, parent_arguments, parent_var_dir, parent_sys_path):
+    """
+    Set up a worker process so that its IOCs and emulators do not clash with those of the other workers.
+
+    Args:
+        worker_ids: Queue of worker ids; the worker takes one of them.
+        parent_arguments: The command line arguments given to the parent process.
+        parent_var_dir: The var dir of the parent process; the worker uses a sub directory of it.
+        parent_sys_path: The python path of the parent process, which may include a custom tests path.
+    """
+    global arguments, var_dir, report_directory
+
+    worker_id = worker_ids.get()
+    sys.path = parent_sys_path
+
+    arguments = parent_arguments
+    arguments.prefix = "{}W{:02d}:".format(parent_arguments.prefix, worker_id)
+    var_dir = os.path.join(parent_var_dir, "worker_{:02d}".format(worker_id))
+    report_directory = worker_report_directory(worker_id)
+
+    # IOCs pick up their prefix and var dir (autosave, macros file) from the environment
+    os.environ["MYPVPREFIX"] = arguments.prefix
+    os.environ["ICPVARDIR"] = var_dir
+
+    # Worker processes do not run atexit functions, so stop anything the worker left running when it exits
+    multiprocessing.util.Finalize(None, ProcessRegister.stop_all, exitpriority=0)
+
+
+def run_job_in_worker(module_name, tests, mode, failfast, result_cache_directory=None):
+    """
+    Runs the tests in a module in the given mode inside a worker process.
+
+    Args:
+        module_name: Name of the module containing the tests.
+        tests: List of dotted unit tests to be run from the module.
+        mode (TestModes): The mode to run in.
+        failfast: Determines if test suit aborts after first failure.
+        result_cache_directory: Directory of the result cache shared by the workers; None to not use it.
+
+    Returns:
+        tuple: True if all tests pass and false otherwise; the timings of the job
+    """
+    module = ModuleTests(module_name, package_name=arguments.tests_path)
+    module.tests = tests
+    result_cache = ResultCache(result_cache_directory) if result_cache_directory is not None else None
+    timings = {}
+    result = run_job_using_result_cache(
+        result_cache, module, mode, report_directory,
+        lambda job_report_directory: run_job_in_series(module, mode, failfast, False, None, job_report_directory,
+                                                       timings))
+    return result, timings
 
 
 def prompt_user_to_run_tests(test_names):
@@ -200,7 +866,8 @@ class ReportFailLoadTestsuiteTestCase(unittest.TestCase):
         self.fail(self.msg)
 
 
-def run_tests(prefix, module_name, tests_to_run, device_launchers, failfast_switch, ask_before_running_tests=False):
+def run_tests(prefix, module_name, tests_to_run, device_launchers, failfast_switch, ask_before_running_tests=False,
+              report_directory=REPORTS_DIRECTORY, timings=None, iocs=None):
     """
     Runs dotted unit tests.
 
@@ -211,10 +878,17 @@ def run_tests(prefix, module_name, tests_to_run, device_launchers, failfast_swit
         device_launchers: Context manager that launches the necessary iocs and associated emulators.
         failfast_switch: Determines if test suit aborts after first failure.
         ask_before_running_tests: ask whether to run the tests before running them
+        report_directory: Directory to write the JUnit XML reports to.
+        timings: Dictionary to add the boot, tests and teardown times and the time of each test (test_durations) to;
+            None to not record them.
+        iocs: The IOCS attribute of the module, whose IOCs and emulators are watched while the tests run so that the
+            remaining tests error straight away if one of them goes; None to not watch them.
 
     Returns:
         bool: True if all tests pass and false otherwise.
     """
+    if timings is None:
+        timings = {}
     os.environ["testing_prefix"] = prefix
 
     # Need to set epics address list to local broadcast otherwise channel access won't work
@@ -224,17 +898,32 @@ def run_tests(prefix, module_name, tests_to_run, device_launchers, failfast_swit
 
     test_names = ["{}.{}".format(arguments.tests_path, test) for test in tests_to_run]
 
-    runner = xmlrunner.XMLTestRunner(output='test-reports', stream=sys.stdout, failfast=failfast_switch)
+    liveness_watcher = LivenessWatcher(iocs if iocs is not None else [], ca_failure_limit=arguments.ca_failure_limit)
+    runner = xmlrunner.XMLTestRunner(output=report_directory, stream=sys.stdout, failfast=failfast_switch,
+                                     resultclass=short_circuiting(PhaseTimingTestResult, liveness_watcher))
     test_suite = unittest.TestLoader().loadTestsFromNames(test_names)
 
     try:
-        with modified_environment(**settings), device_launchers:
-            if ask_before_running_tests:
-                prompt_user_to_run_tests(test_names)
-            result = runner.run(test_suite).wasSuccessful()
+        with modified_environment(**settings):
+            boot_start = time.time()
+            with device_launchers:
+                timings["boot"] = time.time() - boot_start
+                if ask_before_running_tests:
+                    prompt_user_to_run_tests(test_names)
+                tests_start = time.time()
+                with liveness_watcher:
+                    test_result = runner.run(test_suite)
+                timings["tests"] = time.time() - tests_start
+                timings["test_durations"] = durations_of_tests(test_result)
+                result = test_result.wasSuccessful()
+                teardown_start = time.time()
+            timings["teardown"] = time.time() - teardown_start
     except Exception:
         msg = "Error while attempting to load test suite: {}".format(traceback.format_exc())
         result = runner.run(ReportFailLoadTestsuiteTestCase(module_name, msg)).wasSuccessful()
+    timings["phases"] = take_phases()
+    ChannelPool.release_disconnected()
+    print(ChannelPool.take_statistics())
     return result
 
 
@@ -279,6 +968,45 @@ if __name__ == '__main__':
                         emulator/IOC or attach debugger for tests""")
     parser.add_argument('-tm', '--tests-mode', default=None, choices=['DEVSIM', 'RECSIM'],
                         help="""Tests mode to run e.g. DEVSIM or RECSIM (default: both).""")
+    parser.add_argument('--no-ioc-reuse', action='store_true',
+                        help="""Launch and stop the IOCs of every module instead of keeping IOCs running into the
+                        next module when it launches them in the same way.""")
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help="""Launch the IOCs of each module only once the previous module has finished and wait
+                        for them to stop, instead of launching the IOCs of the next module while the tests of the
+                        current module run (when they do not share IOC names, PV prefixes or emulators) and stopping
+                        them in the background.""")
+    parser.add_argument('--history-file', default=None,
+                        help="""File to record how long each module took in, used to run the longest modules first
+                        and estimate the time left. Defaults to {} in the var dir.""".format(HISTORY_FILE_NAME))
+    parser.add_argument('--slowest-phases', type=int, default=20,
+                        help="""Number of the slowest phases of the run (IOC and emulator start and stop, test setUp,
+                        body and tearDown) to print at the end of the run (default: 20).""")
+    parser.add_argument('--shard', default=None,
+                        help="""Run only one share of the (module, mode) jobs, given as i/n for the i-th of n shards
+                        (e.g. 2/4), so that the suite can be split between n agents. Jobs are split by a hash of their
+                        names unless --shard-history is given.""")
+    parser.add_argument('--shard-history', default=None,
+                        help="""History file (see --history-file) to balance shards by the time each job took. It is
+                        only read, and every shard must be given the same file, e.g. a copy archived by an earlier
+                        run.""")
+    parser.add_argument('--merge-reports', default=None, nargs="+",
+                        help="""Copy the reports in the given report directories (e.g. those of each shard) into
+                        the reports directory and exit without running any tests.""")
+    parser.add_argument('--skip-unchanged', action='store_true',
+                        help="""Skip (module, mode) jobs which passed when last run with the same inputs: the test
+                        module and the common_tests and utils modules it imports, the test_config and test_data files
+                        it names and the IOCs and emulators it launches. The reports of the earlier run are copied
+                        to the reports directory, marked as cached. The cache is kept in {} in the var dir.""".format(
+                            RESULT_CACHE_DIRECTORY_NAME))
+    parser.add_argument('--ca-failure-limit', type=int, default=DEFAULT_CA_FAILURE_LIMIT,
+                        help="""Number of checks in a row (one every few seconds while a module's tests run) in which
+                        an IOC's existence PV is not found after which the IOC is taken to have gone and the remaining
+                        tests of the module error straight away, as they do if an IOC or emulator process exits. 0 to
+                        only watch the processes (default: {}).""".format(DEFAULT_CA_FAILURE_LIMIT))
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="""Number of worker processes to run modules in (default: 1). Each worker launches its
+                        IOCs with its own PV prefix, var dir and report directory.""")
 
     arguments = parser.parse_args()
 
@@ -291,6 +1019,15 @@ if __name__ == '__main__':
         sys.path.insert(0, tests_module_path)
         arguments.tests_path = os.path.basename(arguments.tests_path)
 
+    if arguments.merge_reports is not None:
+        try:
+            merge_report_directories(arguments.merge_reports, REPORTS_DIRECTORY)
+        except ValueError as e:
+            print(e)
+            sys.exit(-1)
+        print("Merged {} into {}".format(", ".join(arguments.merge_reports), REPORTS_DIRECTORY))
+        sys.exit(0)
+
     if arguments.list_devices:
         print("Available tests:")
         print('\n'.join(sorted(package_contents(arguments.tests_path))))
@@ -311,6 +1048,22 @@ if __name__ == '__main__':
     failfast = arguments.failfast
     ask_before_running_tests = arguments.ask_before_running
 
+    if arguments.jobs < 1:
+        print("Number of jobs must be at least 1")
+        sys.exit(-1)
+
+    if ask_before_running_tests and arguments.jobs > 1:
+        print("Cannot ask before running tests when running with more than one job")
+        sys.exit(-1)
+
+    shard = None
+    if arguments.shard is not None:
+        try:
+            shard = parse_shard(arguments.shard)
+        except ValueError as e:
+            print(e)
+            sys.exit(-1)
+
     tests_mode = None
     if arguments.tests_mode == "RECSIM":
         tests_mode = TestModes.RECSIM
@@ -318,7 +1071,10 @@ if __name__ == '__main__':
         tests_mode = TestModes.DEVSIM
 
     try:
-        success = load_and_run_tests(tests, failfast, ask_before_running_tests, tests_mode)
+        success = load_and_run_tests(tests, failfast, ask_before_running_tests, tests_mode, arguments.jobs,
+                                      not arguments.no_ioc_reuse, arguments.history_file, arguments.slowest_phases,
+                                      shard, arguments.shard_history, arguments.skip_unchanged,
+                                      not arguments.no_pipeline)
     except Exception as e:
         print("---\n---\n---\nAn Error occurred loading the tests: ")
         traceback.print_exc()
@@ -1,7 +1,10 @@
 import importlib
 import os
+import shutil
 from contextlib import contextmanager
 
+from utils.test_modes import TestModes
+
 
 def package_contents(package_name):
     """
@@ -33,23 +36,83 @@ def modified_environment(**kwargs):
     os.environ.update(old_env)
 
 
+def _is_same_or_inside(path, directory):
+    """
+    :return: True if the path is the directory or inside it
+    """
+    real_directory = os.path.realpath(directory)
+    try:
+        return os.path.commonpath([os.path.realpath(path), real_directory]) == real_directory
+    except ValueError:
+        return False  # the paths are on different drives
+
+
+def merge_report_directories(source_directories, destination, remove_sources=False):
+    """
+    Copies the report files from several report directories into one report directory tree.
+
+    Files keep their path relative to the source directory they came from. If a file of the same name already exists
+    in the destination a numeric suffix is added so that no report is overwritten.
+
+    :param source_directories: the report directories to merge
+    :param destination: the report directory to merge into
+    :param remove_sources: True to move the files and remove the source directories once they have been merged, e.g.
+        for directories written by this run; False to leave the source directories as they are
+    :raises ValueError: if a source directory is the destination or contains it, so merging it would copy reports into
+        itself or remove the destination
+    """
+    for source_directory in source_directories:
+        if _is_same_or_inside(destination, source_directory):
+            raise ValueError("Report directory {} can not be merged into {}, which is or is inside it".format(
+                source_directory, destination))
+
+    for source_directory in source_directories:
+        if not os.path.isdir(source_directory):
+            continue
+        for root, _, files in os.walk(source_directory):
+            target_dir = os.path.join(destination, os.path.relpath(root, source_directory))
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir)
+            for report_file in files:
+                name, extension = os.path.splitext(report_file)
+                target = os.path.join(target_dir, report_file)
+                suffix = 1
+                while os.path.exists(target):
+                    target = os.path.join(target_dir, "{}-{}{}".format(name, suffix, extension))
+                    suffix += 1
+                if remove_sources:
+                    shutil.move(os.path.join(root, report_file), target)
+                else:
+                    shutil.copy2(os.path.join(root, report_file), target)
+        if remove_sources:
+            shutil.rmtree(source_directory, ignore_errors=True)
+
+
 class ModuleTests(object):
     """
     Object which contains information about tests in a module to be run.
 
+    The module is only imported when its file is first asked for; if it has a manifest entry its modes and IOCs are
+    taken from that instead.
+
     Attributes:
         name: Name of the module where the tests are.
         tests: List of "dotted" test names. E.g. SampleTests.SampleTestCase.test_two runs
             test_two in SampleTestCase class in the SampleTests module.
         file: Reference to the module.
         modes: Modes to run the tests in.
+        iocs: List of dictionaries with the name, directory and emulator of each IOC the module launches.
+        manifest_entry: The module's entry in the manifest of the tests package (see utils.module_manifest); empty if
+            it has none.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, manifest_entry=None, package_name="tests"):
         self.__name = name
         self.tests = None
-        self.__file = self.__get_file_reference()
-        self.__modes = self.__get_modes()
+        self.__package_name = package_name
+        self.__manifest_entry = manifest_entry if manifest_entry is not None else {}
+        self.__file = None
+        self.__modes = None
 
     @property
     def name(self):
@@ -59,21 +122,40 @@ class ModuleTests(object):
     @property
     def modes(self):
         """ Returns the modes to run the tests in. """
+        if self.__modes is None:
+            self.__modes = self.__get_modes()
         return self.__modes
 
     @property
     def file(self):
         """ Returns a reference to the module file. """
+        if self.__file is None:
+            self.__file = self.__get_file_reference()
         return self.__file
 
+    @property
+    def manifest_entry(self):
+        """ Returns the module's manifest entry, read from its source without importing it; empty if it has none. """
+        return self.__manifest_entry
+
+    @property
+    def iocs(self):
+        """ Returns the name, directory and emulator of each IOC the module launches. """
+        iocs = self.__manifest_entry.get("iocs")
+        if iocs is None:
+            iocs = [{key: ioc.get(key) for key in ("name", "directory", "emulator")}
+                    for ioc in getattr(self.file, "IOCS", [])]
+        return iocs
+
     def __get_file_reference(self):
-        module = load_module("tests.{}".format(self.__name))
+        module = load_module("{}.{}".format(self.__package_name, self.__name))
         return module
 
     def __get_modes(self):
-        if not self.__file:
-            self.__get_file_reference()
-        return check_test_modes(self.__file)
+        test_modes = self.__manifest_entry.get("test_modes")
+        if test_modes is not None:
+            return {TestModes[mode] for mode in test_modes}
+        return check_test_modes(self.file)
 
 
 def load_module(name):
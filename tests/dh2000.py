@@ -27,13 +27,21 @@ class Dh2000Tests(unittest.TestCase):
     """
     Tests for the Dh2000 IOC.
     """
+    # State of the emulator at the start of each test, taken by the first setUp
+    initial_state = None
+
     def setUp(self):
         self._lewis, self._ioc = get_running_lewis_and_ioc("dh2000", DEVICE_PREFIX)
         self.ca = ChannelAccess(device_prefix=DEVICE_PREFIX)
 
-        self._lewis.backdoor_set_on_device("shutter_is_open", False)
-        self._lewis.backdoor_set_on_device("interlock_is_triggered", False)
-        self._lewis.backdoor_set_on_device("is_connected", True)
+        if Dh2000Tests.initial_state is not None:
+            self._lewis.restore(Dh2000Tests.initial_state)
+        else:
+            self._lewis.backdoor_set_on_device("shutter_is_open", False)
+            self._lewis.backdoor_set_on_device("interlock_is_triggered", False)
+            self._lewis.backdoor_set_on_device("is_connected", True)
+            if self._lewis.supports_snapshot():
+                Dh2000Tests.initial_state = self._lewis.snapshot()
 
         self.ca.assert_that_pv_is("SHUTTER:A", "Closed")
         self.ca.assert_that_pv_is("INTERLOCK", "OK")
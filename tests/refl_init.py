@@ -48,6 +48,8 @@ IOCS = [
         "ioc_launcher_class": ProcServLauncher,
         "name": DEVICE_PREFIX,
         "directory": get_default_ioc_dir("REFL", iocnum=ioc_number),
+        # The reflectometry server reads the initial motor positions when it starts
+        "depends_on": [GALIL_PREFIX],
         "started_text": "Reflectometry IOC started",
         "pv_for_existence": "STAT",
         "environment_vars": {
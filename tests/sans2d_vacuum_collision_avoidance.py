@@ -95,14 +95,22 @@ class Sans2dVacCollisionAvoidanceTests(unittest.TestCase):
         with ManagerMode(ChannelAccess()):
             self._disable_collision_avoidance()
 
+            # The motor record limits VELO to VMAX, so VMAX is written, and processed, before the speeds are
+            self.ca.set_pv_values({"{}:MTR.VMAX".format(axis): TEST_SPEED
+                                   for axis in BAFFLES_AND_DETECTORS_Z_AXES}).assert_succeeded()
+            motor_settings = {}
             for axis in BAFFLES_AND_DETECTORS_Z_AXES:
-                current_position = self.ca.get_pv_value("{}".format(axis))
+                motor_settings["{}:MTR.VELO".format(axis)] = TEST_SPEED
+                motor_settings["{}:MTR.ACCL".format(axis)] = TEST_ACCELERATION
+            self.ca.set_pv_values(motor_settings).assert_succeeded()
 
-                new_position = self._get_axis_default_position("{}".format(axis))
+            current_positions = self.ca.get_pv_values(BAFFLES_AND_DETECTORS_Z_AXES)
+            current_positions.assert_succeeded()
+
+            for axis in BAFFLES_AND_DETECTORS_Z_AXES:
+                current_position = current_positions.values[axis]
 
-                self.ca.set_pv_value("{}:MTR.VMAX".format(axis), TEST_SPEED, sleep_after_set=0)
-                self.ca.set_pv_value("{}:MTR.VELO".format(axis), TEST_SPEED, sleep_after_set=0)
-                self.ca.set_pv_value("{}:MTR.ACCL".format(axis), TEST_ACCELERATION, sleep_after_set=0)
+                new_position = self._get_axis_default_position("{}".format(axis))
 
                 if current_position != new_position:
                     self.ca.set_pv_value("{}:SP".format(axis), new_position, sleep_after_set=0)
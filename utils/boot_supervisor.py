@@ -0,0 +1,152 @@
+"""
+Supervision of an IOC while it boots: the boot is abandoned as soon as the IOC process exits or its output shows a
+fatal error, rather than when the boot timeout runs out, and the timeout itself is based on how long the IOC has taken
+to boot before.
+"""
+import json
+import os
+import re
+import threading
+from time import monotonic
+
+# Patterns in IOC output which mean the IOC will not boot properly. They are kept to messages which are never printed
+# by an IOC which boots, as a match stops the boot; IOCs can add their own with the fatal_boot_patterns option. The
+# optional [...] is the time stamp procServ puts at the start of each line; without it the iocsh message for a missing
+# file would also match autosave's message for a missing save file, which is expected after the environment is cleaned.
+DEFAULT_FATAL_BOOT_PATTERNS = [
+    r"^(\[[^\]]*\] )?Can't open [^:]+: ",
+    r"dbLoadRecords failed",
+    r"dbLoadDatabase failed",
+    r"iocInit: Database not loaded",
+    r"is not recognized as an internal or external command",
+    r"The system cannot find the path specified",
+]
+
+# How often to check whether the IOC process has exited while waiting for it to boot (seconds)
+BOOT_PROCESS_POLL_INTERVAL = 0.05
+
+# Number of lines of IOC output to include in the message when a boot fails
+BOOT_FAILURE_OUTPUT_LINES = 20
+
+# Name of the file of recent boot times, in the var dir
+BOOT_TIMES_FILE_NAME = "ioc_boot_times.json"
+
+# Number of recent boot times of each IOC to base its boot timeout on
+BOOT_TIMES_KEPT = 5
+
+# The boot timeout of an IOC is this many times its longest recent boot time, but at least the minimum boot timeout
+BOOT_TIMEOUT_FACTOR = 3
+MINIMUM_BOOT_TIMEOUT = 30
+
+
+class IocBootError(AssertionError):
+    """
+    The IOC failed to boot. This is an AssertionError like the timeout waiting for the IOC to start, so that it is
+    reported in the same way.
+    """
+
+
+def _failure_message(reason, log_file_manager, log_position):
+    output = log_file_manager.lines_since(log_position)[0][-BOOT_FAILURE_OUTPUT_LINES:]
+    return "{}\nLast IOC output:\n{}".format(reason, "".join("    {}".format(line) for line in output))
+
+
+def wait_for_boot(log_file_manager, process, started_text, timeout, fatal_patterns=DEFAULT_FATAL_BOOT_PATTERNS):
+    """
+    Wait for an IOC to boot, stopping as soon as it is clear that it will not.
+
+    Args:
+        log_file_manager (utils.log_file.LogFileManager): the manager following the IOC output
+        process (subprocess.Popen): the IOC process; None to not watch the process
+        started_text: text in the IOC output which shows that the IOC has started
+        timeout: time to wait for the IOC to start (seconds)
+        fatal_patterns: regular expressions which mean that the IOC will not boot if a line of output matches one
+    Raises:
+        IocBootError: if the process exits, a line of output matches a fatal pattern or the IOC does not start in time
+    """
+    deadline = monotonic() + timeout
+    patterns = [re.compile(pattern) for pattern in fatal_patterns]
+    boot_output_start = log_file_manager.reading_from
+    scanned_to = boot_output_start
+
+    while True:
+        seen_to = log_file_manager.position()
+        if log_file_manager.wait_for_text(started_text, 0):
+            return
+
+        lines, scanned_to = log_file_manager.lines_since(scanned_to)
+        for line in lines:
+            for pattern in patterns:
+                if pattern.search(line):
+                    raise IocBootError(_failure_message(
+                        "IOC failed to boot: output '{}' matches fatal pattern '{}'".format(
+                            line.strip(), pattern.pattern), log_file_manager, boot_output_start))
+
+        exit_code = process.poll() if process is not None else None
+        if exit_code is not None or log_file_manager.output_ended:
+            raise IocBootError(_failure_message(
+                "IOC process exited{} before '{}' appeared in its output".format(
+                    "" if exit_code is None else " with code {}".format(exit_code), started_text),
+                log_file_manager, boot_output_start))
+
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise IocBootError(_failure_message(
+                "IOC appears not to have started after {:.0f} seconds. Looking for '{}'".format(timeout, started_text),
+                log_file_manager, boot_output_start))
+        log_file_manager.wait_for_output(seen_to, min(remaining, BOOT_PROCESS_POLL_INTERVAL))
+
+
+class BootTimes(object):
+    """
+    Recent boot times of each IOC, kept in a file so that boot timeouts can be based on them.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        """
+        Args:
+            path: path of the boot times file
+        """
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path) as boot_times_file:
+                return json.load(boot_times_file)
+        except (IOError, ValueError):
+            return {}
+
+    def timeout(self, key, maximum):
+        """
+        Args:
+            key: key of the IOC, e.g. its name and mode
+            maximum: the longest timeout to give, used when the IOC has not booted before
+        Returns:
+            the time to wait for the IOC to boot (seconds)
+        """
+        with self._lock:
+            times = self._load().get(key)
+        if not times:
+            return maximum
+        return min(maximum, max(MINIMUM_BOOT_TIMEOUT, BOOT_TIMEOUT_FACTOR * max(times)))
+
+    def record(self, key, seconds):
+        """
+        Record how long an IOC took to boot, saving the file straight away.
+
+        Args:
+            key: key of the IOC, e.g. its name and mode
+            seconds: the boot time
+        """
+        with self._lock:
+            boot_times = self._load()
+            boot_times[key] = (boot_times.get(key, []) + [seconds])[-BOOT_TIMES_KEPT:]
+            try:
+                temporary_path = "{}.{}".format(self.path, os.getpid())
+                with open(temporary_path, "w") as boot_times_file:
+                    json.dump(boot_times, boot_times_file, indent=1, sort_keys=True)
+                os.replace(temporary_path, self.path)
+            except (IOError, OSError) as e:
+                print("Unable to save IOC boot times to {}: {}".format(self.path, e))
@@ -5,11 +5,17 @@ import os
 import time
 import operator
 import ctypes
-from contextlib import contextmanager
+import threading
+from contextlib import contextmanager, ExitStack
 from genie_python.genie_cachannel_wrapper import CaChannelWrapper, UnableToConnectToPVException
+from genie_python.channel_access_exceptions import WriteAccessException, ReadAccessException, \
+    InvalidEnumStringException
+from genie_python.utilities import waveform_to_string
+from CaChannel import CaChannelException, ca
 
 from functools import partial
 
+from utils.channel_pool import ChannelPool
 from utils.formatters import format_value
 
 try:
@@ -26,6 +32,34 @@ except ImportError:
             return partial(self.func, instance, *(self.args or ()), **(self.keywords or {}))
 
 
+# Time to wait for a monitor event on a pv before checking it anyway; some fields do not post monitors when they change
+MONITOR_REFRESH_INTERVAL = 0.2
+
+# Time to wait to read the DISP fields of the PVs written. A PV whose DISP field can not be read in this time is
+# written, as genie_python writes to a PV without a DISP field (seconds)
+DISP_CHECK_TIMEOUT = 1.0
+
+
+def _silence_ca_errors():
+    """
+    Silence CA errors. Only done once per process however many ChannelAccess objects are created.
+    """
+    global _ca_errors_silenced
+    if _ca_errors_silenced:
+        return
+    _ca_errors_silenced = True
+
+    CaChannelWrapper.errorLogFunc = lambda *a, **kw: None
+    try:
+        hcom = ctypes.cdll.LoadLibrary("COM.DLL")
+        hcom.eltc(ctypes.c_int(0))
+    except Exception as e:
+        print("Unable to disable CA errors: ", e)
+
+
+_ca_errors_silenced = False
+
+
 class _MonitorAssertion:
     """
     This is used to assert the value based on a pv monitor event. It will sign up to the monitor call backs and
@@ -58,6 +92,36 @@ class _MonitorAssertion:
         return self.latest_value
 
 
+class PvBatchResult(object):
+    """
+    The outcome of a batched get or set on several PVs.
+
+    Attributes:
+        values: dictionary of PV name to value read (for a get) or written (for a set) for each PV which succeeded
+        errors: dictionary of PV name to exception for each PV which failed
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.errors = {}
+
+    @property
+    def succeeded(self):
+        """
+        Returns: True if the operation succeeded for every PV
+        """
+        return not self.errors
+
+    def assert_succeeded(self):
+        """
+        Raises:
+            AssertionError: listing every PV the operation failed for, if it failed for any
+        """
+        if self.errors:
+            raise AssertionError("Channel access failed for PVs:\n{}".format(
+                "\n".join("{}: {}".format(pv, error) for pv, error in sorted(self.errors.items()))))
+
+
 class ChannelAccess(object):
     """
     Provides the required channel access commands.
@@ -73,27 +137,39 @@ class ChannelAccess(object):
         INVALID = "INVALID"  # Alarm value if the record has a calc alarm
         DISABLE = "DISABLE"  # Alarm stat value if the record has been disabled
 
-    def __init__(self, default_timeout=5, device_prefix=None, default_wait_time=1.0):
+    class Settle(object):
+        """
+        Ways in which set_pv_value can wait for a write to take effect before returning.
+        """
+        CALLBACK = "CALLBACK"  # Wait for the put callback, i.e. until the IOC has finished processing the write
+        READBACK = "READBACK"  # Wait for a monitor update on a readback PV
+        LEARNED = "LEARNED"  # Sleep for as long as a put callback on the PV has previously been seen to take
+        SLEEP = "SLEEP"  # Sleep for the default wait time
+
+    # Longest time seen for the put callback of each PV (keyed on full PV name), used by Settle.LEARNED
+    _learned_settle_times = {}
+
+    # Full names of the records whose DISP field could not be read, e.g. those served by a pcaspy server, which are not
+    # waited for again
+    _records_without_disp = set()
+
+    def __init__(self, default_timeout=5, device_prefix=None, default_wait_time=1.0, default_settle=Settle.CALLBACK):
         """
         Initializes this ChannelAccess object.
 
         Args:
             device_prefix: The device prefix which will be added to the start of all pvs.
             default_timeout: The default time out to wait for an assertion on a PV to become true.
-            default_wait_time: The default time to wait after a set_pv_value
+            default_wait_time: The longest time to wait after a set_pv_value for the write to settle
+            default_settle: The default way to wait for a write to settle (see ChannelAccess.Settle)
         Returns:
             None.
         """
         self.ca = CaChannelWrapper()
         self.default_wait_time = default_wait_time
+        self.default_settle = default_settle
 
-        # Silence CA errors
-        CaChannelWrapper.errorLogFunc = lambda *a, **kw: None
-        try:
-            hcom = ctypes.cdll.LoadLibrary("COM.DLL")
-            hcom.eltc(ctypes.c_int(0))
-        except Exception as e:
-            print("Unable to disable CA errors: ", e)
+        _silence_ca_errors()
 
         self.prefix = os.environ["testing_prefix"]
         self._default_timeout = default_timeout
@@ -102,31 +178,135 @@ class ChannelAccess(object):
         if device_prefix is not None:
             self.prefix += "{}:".format(device_prefix)
 
-    def set_pv_value(self, pv, value, wait=False, sleep_after_set=None):
+    def set_pv_value(self, pv, value, wait=False, sleep_after_set=None, settle=None, readback_pv=None):
         """
         Sets the specified PV to the supplied value.
 
+        By default this returns as soon as the IOC has processed the write. If it has not done so within
+        default_wait_time, e.g. because the write starts a move, it returns once there is an update to the readback PV
+        (or the PV itself if no readback PV is given), showing that the write has taken effect.
+
         Args:
             pv: the EPICS PV name
             value: the value to set
-            wait: wait for completion callback (default: False)
-            sleep_after_set: before a sleep after setting pv value
+            wait: wait for completion callback with no time limit (default: False)
+            sleep_after_set: if given, sleep for this long after setting the pv value instead of settling
+            settle: how to wait for the write to settle (see ChannelAccess.Settle); None for the default_settle
+            readback_pv: the PV to wait for a monitor update on when settling with ChannelAccess.Settle.READBACK, or when
+                the IOC has not processed the write within default_wait_time with ChannelAccess.Settle.CALLBACK or
+                ChannelAccess.Settle.LEARNED
+        Raises:
+            WriteAccessException: if the IOC rejected the write
+            UnableToConnectToPVException: if, settling with a put callback, the IOC neither finished processing the write
+                nor sent an update to the readback PV within the default timeout
         """
-        if sleep_after_set is None:
-            sleep_after_set = self.default_wait_time
+        if sleep_after_set is not None:
+            settle = self.Settle.SLEEP
+        elif settle is None:
+            settle = self.default_settle
+        if settle == self.Settle.READBACK and readback_pv is None:
+            raise ValueError("A readback PV must be given to settle on a readback")
+
         # Wait for the PV to exist before writing to it. If this is not here sometimes the tests try to jump the gun
         # and attempt to write to a PV that doesn't exist yet
         self.assert_that_pv_exists(pv)
+        full_pv_name = self.create_pv_with_prefix(pv)
+
+        if wait:
+            # Waits for completion with no time limit, so will hang if the value never gets set
+            self.ca.set_pv_value(full_pv_name, value, wait=True, timeout=self._default_timeout)
+            if settle == self.Settle.SLEEP:
+                self._sleep_after_set(sleep_after_set)
+        elif settle == self.Settle.CALLBACK:
+            self._put_and_wait_for_callback(pv, value, self.default_wait_time,
+                                            readback_pv if readback_pv is not None else pv)
+        elif settle == self.Settle.LEARNED and full_pv_name in self._learned_settle_times:
+            self.ca.set_pv_value(full_pv_name, value, timeout=self._default_timeout)
+            self._sleep_after_set(self._learned_settle_times[full_pv_name])
+        elif settle == self.Settle.LEARNED:
+            start_time = time.time()
+            if self._put_and_wait_for_callback(pv, value, self.default_wait_time,
+                                               readback_pv if readback_pv is not None else pv):
+                self._learned_settle_times[full_pv_name] = time.time() - start_time
+        elif settle == self.Settle.READBACK:
+            notifier = ChannelPool.get(self.create_pv_with_prefix(readback_pv))
+            if notifier is not None:
+                notifier.subscribe()
+            seen_update_count = notifier.update_count if notifier is not None else None
+            self.ca.set_pv_value(full_pv_name, value, timeout=self._default_timeout)
+            if notifier is not None:
+                notifier.wait_for_update(seen_update_count, self.default_wait_time)
+            else:
+                self._sleep_after_set(self.default_wait_time)
+        elif settle == self.Settle.SLEEP:
+            self.ca.set_pv_value(full_pv_name, value, timeout=self._default_timeout)
+            self._sleep_after_set(self.default_wait_time if sleep_after_set is None else sleep_after_set)
+        else:
+            raise ValueError("Unknown settle strategy {}".format(settle))
 
-        # Don't use wait=True because it will cause an infinite wait if the value never gets set successfully
-        # In that case the test should fail (because the correct value is not set)
-        # but it should not hold up all the other tests
-        self.ca.set_pv_value(self.create_pv_with_prefix(pv), value, wait=wait, timeout=self._default_timeout)
-
+    @staticmethod
+    def _sleep_after_set(sleep_after_set):
         # Give lewis time to process - avoid sleep(0) in case it might do am implicit thread yield
         if sleep_after_set > 0.0:
             time.sleep(sleep_after_set)
 
+    def _put_and_wait_for_callback(self, pv, value, timeout, readback_pv):
+        """
+        Write to a pv with a put callback and wait a bounded time for the IOC to finish processing the write. The pv is
+        checked as genie_python checks it before a write, including that DISP is not set.
+
+        Don't use the unbounded wait in genie_python because it will cause an infinite wait if the value never gets set
+        successfully. In that case the test should fail (because the correct value is not set) but it should not hold
+        up all the other tests.
+
+        Args:
+            pv: the pv name (without prefix)
+            value: the value to set
+            timeout: the longest time to wait for the callback
+            readback_pv: pv (without prefix) to wait for an update on, up to the default timeout, if the callback has
+                not arrived within the timeout
+        Returns:
+            True if the write completed within the timeout; False if it did not but the readback pv was updated
+        Raises:
+            WriteAccessException: if the pv can not be written to or the IOC rejected the write (e.g. DISP is set)
+            UnableToConnectToPVException: if neither the callback nor an update to the readback pv arrived in time
+        """
+        full_pv_name = self.create_pv_with_prefix(pv)
+        chan = CaChannelWrapper.get_chan(full_pv_name)
+        chan.setTimeout(self._default_timeout)
+        value = CaChannelWrapper.check_for_enum_value(value, chan, full_pv_name)
+        if not chan.write_access():
+            raise WriteAccessException(full_pv_name)
+        if self._disabled_pvs([pv]):
+            raise WriteAccessException("{} (DISP is set)".format(full_pv_name))
+
+        # Subscribe before the write so that an update made by it is not missed
+        notifier = ChannelPool.get(self.create_pv_with_prefix(readback_pv))
+        if notifier is not None:
+            notifier.subscribe()
+        seen_update_count = notifier.update_count if notifier is not None else None
+
+        completed = threading.Event()
+        put_status = []
+
+        def _put_callback(epics_args, _):
+            put_status.append(epics_args["status"])
+            completed.set()
+
+        chan.array_put_callback(value, chan.field_type(), chan.element_count(), _put_callback)
+        chan.flush_io()
+
+        if not completed.wait(timeout):
+            # The IOC may still be processing the write, e.g. a motor moving to a setpoint, so check that the write has
+            # taken effect by waiting for the readback instead
+            if notifier is not None and notifier.wait_for_update(seen_update_count, self._default_timeout):
+                return False
+            if not completed.is_set():
+                raise UnableToConnectToPVException(full_pv_name, "Put timeout")
+        if put_status[0] != ca.ECA_NORMAL:
+            raise WriteAccessException("{} (put failed: {})".format(full_pv_name, ca.message(put_status[0])))
+        return True
+
     def get_pv_value(self, pv):
         """
         Gets the current value for the specified PV.
@@ -138,6 +318,227 @@ class ChannelAccess(object):
         """
         return self.ca.get_pv_value(self.create_pv_with_prefix(pv))
 
+    def set_pv_values(self, pvs_and_values, timeout=None):
+        """
+        Sets several PVs. All the writes are sent together and then waited on with one deadline, so this takes about
+        one round trip however many PVs are set. The writes may be processed in any order, so PVs which must be
+        written in order, e.g. setpoints and the PV which moves to them, should not be set in the same batch.
+
+        The PVs are checked as genie_python checks a PV before a write, including that DISP is not set. A write has
+        succeeded once the IOC has finished processing it.
+
+        Args:
+            pvs_and_values: dictionary of PV name (without prefix) to the value to set
+            timeout: time to wait for the PVs to connect and for the IOC to process the writes; None for the default
+                timeout
+        Returns:
+            PvBatchResult: the values written and the errors for PVs which could not be written
+        """
+        if timeout is None:
+            timeout = self._default_timeout
+        start_time = time.time()
+
+        result = PvBatchResult()
+        channels = self._connect_pooled_channels(pvs_and_values.keys(), timeout, result)
+
+        for pv, channel in list(channels.items()):
+            if not channel.write_access():
+                result.errors[pv] = WriteAccessException(self.create_pv_with_prefix(pv))
+                del channels[pv]
+        for pv in self._disabled_pvs(channels):
+            result.errors[pv] = WriteAccessException("{} (DISP is set)".format(self.create_pv_with_prefix(pv)))
+            del channels[pv]
+        values = self._convert_enum_strings(
+            {pv: pvs_and_values[pv] for pv in channels}, {pv: channel for pv, channel in channels.items()}, result)
+
+        outstanding = set(values.keys())
+        put_statuses = {}
+        completed = threading.Condition()
+
+        def _put_callback(epics_args, user_args):
+            with completed:
+                put_statuses[user_args[0]] = epics_args["status"]
+                outstanding.discard(user_args[0])
+                completed.notify_all()
+
+        for pv, value in values.items():
+            channel = channels[pv]
+            try:
+                channel.array_put_callback(value, channel.field_type(), channel.element_count(), _put_callback, pv)
+            except CaChannelException as e:
+                result.errors[pv] = e
+                outstanding.discard(pv)
+        if channels:
+            next(iter(channels.values())).flush_io()
+
+        with completed:
+            completed.wait_for(lambda: not outstanding, max(0.0, timeout - (time.time() - start_time)))
+            for pv, status in put_statuses.items():
+                if status == ca.ECA_NORMAL:
+                    result.values[pv] = values[pv]
+                else:
+                    result.errors[pv] = WriteAccessException("{} (put failed: {})".format(
+                        self.create_pv_with_prefix(pv), ca.message(status)))
+            for pv in outstanding:
+                result.errors[pv] = UnableToConnectToPVException(self.create_pv_with_prefix(pv), "Put timeout")
+        return result
+
+    def _disabled_pvs(self, pvs):
+        """
+        Find the PVs whose record has DISP set, which genie_python refuses to write to. The DISP fields of all the PVs
+        are read together.
+
+        Args:
+            pvs: iterable of PV names (without prefix)
+        Returns:
+            list: the PVs with DISP set
+        """
+        # As in genie_python, DISP is not checked when writing to it, and a field is disabled by the DISP of its record
+        disp_pvs = {pv: "{}.DISP".format(pv.split(".")[0]) for pv in pvs if ".DISP" not in pv}
+        disp_pvs = {pv: disp_pv for pv, disp_pv in disp_pvs.items()
+                    if self.create_pv_with_prefix(disp_pv) not in self._records_without_disp}
+        if not disp_pvs:
+            return []
+        disp = self.get_pv_values(set(disp_pvs.values()), timeout=DISP_CHECK_TIMEOUT)
+        for disp_pv in disp.errors:
+            self._records_without_disp.add(self.create_pv_with_prefix(disp_pv))
+        return [pv for pv, disp_pv in disp_pvs.items() if disp.values.get(disp_pv, "0") != "0"]
+
+    def get_pv_values(self, pvs, timeout=None):
+        """
+        Gets the current values of several PVs. All the reads are sent together and then waited on with one deadline,
+        so this takes about one round trip however many PVs are read. Values are returned as get_pv_value would
+        return them.
+
+        Args:
+            pvs: iterable of PV names (without prefix)
+            timeout: time to wait for the PVs to connect and reply; None for the default timeout
+        Returns:
+            PvBatchResult: the values read and the errors for PVs which could not be read
+        """
+        if timeout is None:
+            timeout = self._default_timeout
+        start_time = time.time()
+
+        result = PvBatchResult()
+        channels = self._connect_pooled_channels(pvs, timeout, result)
+
+        for pv, channel in list(channels.items()):
+            if not channel.read_access():
+                result.errors[pv] = ReadAccessException(self.create_pv_with_prefix(pv))
+                del channels[pv]
+
+        outstanding = set(channels.keys())
+        completed = threading.Condition()
+        to_string = {}
+
+        def _get_callback(epics_args, user_args):
+            pv = user_args[0]
+            with completed:
+                if epics_args["status"] == ca.ECA_NORMAL:
+                    value = epics_args["pv_value"]
+                    if to_string[pv]:
+                        value = waveform_to_string(value) if isinstance(value, list) else str(value)
+                    result.values[pv] = value
+                else:
+                    result.errors[pv] = UnableToConnectToPVException(
+                        self.create_pv_with_prefix(pv), ca.message(epics_args["status"]))
+                outstanding.discard(pv)
+                completed.notify_all()
+
+        pooled_channels = [ChannelPool.get(self.create_pv_with_prefix(pv)) for pv in sorted(channels)]
+        with ExitStack() as stack:
+            # Lock in a fixed order so that concurrent batches on the same PVs can not deadlock
+            for pooled_channel in pooled_channels:
+                stack.enter_context(pooled_channel.get_lock)
+
+            for pv, channel in channels.items():
+                field_type = channel.field_type()
+                if ca.dbr_type_is_ENUM(field_type) or ca.dbr_type_is_STRING(field_type):
+                    request_type = ca.DBR_STRING
+                elif ca.dbr_type_is_CHAR(field_type):
+                    request_type = ca.DBR_CHAR
+                else:
+                    request_type = field_type
+                to_string[pv] = request_type in (ca.DBR_STRING, ca.DBR_CHAR)
+                try:
+                    channel.array_get_callback(request_type, None, _get_callback, pv)
+                except CaChannelException as e:
+                    result.errors[pv] = e
+                    outstanding.discard(pv)
+            if channels:
+                next(iter(channels.values())).flush_io()
+
+            with completed:
+                completed.wait_for(lambda: not outstanding, max(0.0, timeout - (time.time() - start_time)))
+                for pv in outstanding:
+                    result.errors[pv] = UnableToConnectToPVException(self.create_pv_with_prefix(pv), "Get timeout")
+        return result
+
+    def _connect_pooled_channels(self, pvs, timeout, result):
+        """
+        Connect to several PVs at once through the channel pool, waiting for all of them with one deadline.
+
+        Args:
+            pvs: iterable of PV names (without prefix)
+            timeout: time to wait for the PVs to connect; None for the default timeout
+            result (PvBatchResult): result to add an error to for each PV which could not be connected
+        Returns:
+            dict: PV name to connected channel, for the PVs which connected
+        """
+        if timeout is None:
+            timeout = self._default_timeout
+        start_time = time.time()
+
+        pooled_channels = {pv: ChannelPool.get(self.create_pv_with_prefix(pv)) for pv in pvs}
+        channels = {}
+        for pv, pooled_channel in pooled_channels.items():
+            time_left = max(0.0, timeout - (time.time() - start_time))
+            if pooled_channel is not None and ChannelPool.is_connected(pooled_channel.full_pv_name, time_left):
+                channels[pv] = pooled_channel.channel
+            else:
+                result.errors[pv] = UnableToConnectToPVException(self.create_pv_with_prefix(pv), "Connection timeout")
+        return channels
+
+    def _convert_enum_strings(self, pvs_and_values, channels, result):
+        """
+        Replace strings written to enum PVs with the index of the matching state (ignoring case), as genie_python does.
+        The state strings of all the enum PVs are read together.
+
+        Args:
+            pvs_and_values: dictionary of PV name to the value to set
+            channels: dictionary of PV name to connected channel
+            result (PvBatchResult): result to add an error to for each PV whose value is not one of its states
+        Returns:
+            dict: PV name to the value to write, for the PVs whose value could be converted
+        """
+        enum_pvs = [pv for pv, value in pvs_and_values.items()
+                    if isinstance(value, str) and ca.dbr_type_is_ENUM(channels[pv].field_type())]
+        if not enum_pvs:
+            return dict(pvs_and_values)
+
+        values = dict(pvs_and_values)
+        try:
+            for pv in enum_pvs:
+                channels[pv].array_get(ca.DBR_CTRL_ENUM)
+            channels[enum_pvs[0]].pend_io(self._default_timeout)
+        except CaChannelException as e:
+            for pv in enum_pvs:
+                result.errors[pv] = e
+                del values[pv]
+            return values
+
+        for pv in enum_pvs:
+            state_strings = channels[pv].getValue()["pv_statestrings"]
+            for index, state_string in enumerate(state_strings):
+                if state_string.lower() == values[pv].lower():
+                    values[pv] = index
+                    break
+            else:
+                result.errors[pv] = InvalidEnumStringException(self.create_pv_with_prefix(pv), state_strings)
+                del values[pv]
+        return values
+
     def process_pv(self, pv):
         """
         Makes the pv process once.
@@ -181,13 +582,17 @@ class ChannelAccess(object):
         """
         return "{prefix}{pv}".format(prefix=self.prefix, pv=pv)
 
-    def _wait_for_pv_lambda(self, wait_for_lambda, timeout):
+    def _wait_for_pv_lambda(self, wait_for_lambda, timeout, pv=None):
         """
         Wait for a lambda containing a pv to become None; return value or timeout and return actual value.
 
+        If a pv is given the lambda is only re-evaluated when a monitor event arrives for it (or at least every
+        MONITOR_REFRESH_INTERVAL), otherwise it is polled.
+
         Args:
             wait_for_lambda: lambda we expect to be None
             timeout: time out period
+            pv: the pv the lambda reads; None if it does not read a pv directly
         Returns:
             final value of lambda
         """
@@ -197,7 +602,12 @@ class ChannelAccess(object):
         if timeout is None:
             timeout = self._default_timeout
 
+        notifier = ChannelPool.get(self.create_pv_with_prefix(pv)) if pv is not None else None
+        if notifier is not None:
+            notifier.subscribe()
+
         while current_time - start_time < timeout:
+            seen_update_count = notifier.update_count if notifier is not None else None
             try:
                 lambda_value = wait_for_lambda()
                 if lambda_value is None:
@@ -205,7 +615,12 @@ class ChannelAccess(object):
             except UnableToConnectToPVException:
                 pass  # try again next loop maybe the PV will be up
 
-            time.sleep(0.01)
+            if notifier is None:
+                time.sleep(0.01)
+            else:
+                time_left = timeout - (time.time() - start_time)
+                notifier.wait_for_update(
+                    seen_update_count, max(0.0, min(time_left, MONITOR_REFRESH_INTERVAL)))
             current_time = time.time()
 
         # last try
@@ -243,7 +658,8 @@ class ChannelAccess(object):
             message = "Expected function '{}' to evaluate to True when reading PV '{}'." \
                 .format(func.__name__, self.create_pv_with_prefix(pv))
 
-        err = self._wait_for_pv_lambda(partial(_wrapper, message), timeout)
+        err = self._wait_for_pv_lambda(partial(_wrapper, message), timeout,
+                                       pv=pv if pv_value_source is None else None)
 
         if err is not None:
             raise AssertionError(err)
@@ -463,6 +879,8 @@ class ChannelAccess(object):
         """
         Wait for pv to be available or timeout and throw UnableToConnectToPVException.
 
+        Uses the process wide channel pool, so a pv which is already connected is not searched for again.
+
         Args:
              pv: pv to wait for
              timeout: time to wait for
@@ -472,15 +890,9 @@ class ChannelAccess(object):
         if timeout is None:
             timeout = self._default_timeout
 
-        start_time = time.time()
         pv = self.create_pv_with_prefix(pv)
-        while time.time() - start_time < timeout:
-            if self.ca.pv_exists(pv, timeout=1.0):
-                break
-        else:
-            # Last try.
-            if not self.ca.pv_exists(pv, timeout=1.0):
-                raise AssertionError("PV {pv} does not exist".format(pv=pv))
+        if not ChannelPool.is_connected(pv, timeout):
+            raise AssertionError("PV {pv} does not exist".format(pv=pv))
 
     def assert_that_pv_does_not_exist(self, pv, timeout=2):
         """
@@ -690,18 +1102,94 @@ class ChannelAccess(object):
             pv=pv_with_prefix, func=lambda val: val == time_before, pv_value_source=PvUpdateTimeValueSource(),
             message="PV {} was processed".format(pv))
 
-    def assert_dict_of_pvs_have_given_values(self, pvs_and_values_dict):
+    def assert_dict_of_pvs_have_given_values(self, pvs_and_values_dict, timeout=None):
         """
         Assert that the pvs (keys of the passed dict) have the given values (values of the dict).
 
         Args:
             pvs_and_values_dict: A dictionary with keys as pvs and expected values as the value.
+            timeout: time to wait for all the pvs to have their values
+        Raises:
+            AssertionError: listing every pv which does not have its value within the timeout
         """
-        error_message = ""
-        for pv, value in pvs_and_values_dict.items():
+        self.assert_pvs_satisfy(
+            {pv: partial(operator.eq, value) for pv, value in pvs_and_values_dict.items()}, timeout=timeout,
+            message="Not all PVs have given values")
+
+    def assert_pvs_satisfy(self, pvs_and_predicates, timeout=None, message=None):
+        """
+        Assert that several pvs each satisfy a predicate, or come to within the timeout.
+
+        All the pvs are watched at once against one deadline, so this returns as soon as the last predicate holds and
+        fails after one timeout however many pvs are checked. A pv is read again only when a monitor event arrives
+        for one of the pvs still being waited for (or at least every MONITOR_REFRESH_INTERVAL). Once a pv has
+        satisfied its predicate it is not checked again.
+
+        Args:
+            pvs_and_predicates: dictionary of pv name to a function which takes the pv value and returns True if it
+                is valid
+            timeout: time to wait for every predicate to hold; None for the default timeout
+            message: custom message to start the failure with
+        Raises:
+            AssertionError: listing every pv whose predicate did not hold within the timeout, with its final value
+        """
+        if timeout is None:
+            timeout = self._default_timeout
+        if message is None:
+            message = "Not all PVs satisfied their conditions"
+        start_time = time.time()
+
+        notifiers = {}
+        for pv in pvs_and_predicates:
+            notifier = ChannelPool.get(self.create_pv_with_prefix(pv))
+            if notifier is not None:
+                notifier.subscribe()
+                notifiers[pv] = notifier
+
+        pending = dict(pvs_and_predicates)
+        failures = {}
+        while True:
+            watched = [notifiers[pv] for pv in pending if pv in notifiers]
+            seen_update_counts = [notifier.update_count for notifier in watched]
+
+            time_left = max(0.0, timeout - (time.time() - start_time))
+            failures = self._evaluate_pv_predicates(pending, time_left)
+            for pv in list(pending):
+                if pv not in failures:
+                    del pending[pv]
+
+            time_left = timeout - (time.time() - start_time)
+            if not pending or time_left <= 0:
+                break
+            wait_time = min(time_left, MONITOR_REFRESH_INTERVAL)
+            if watched:
+                ChannelPool.wait_for_any_update(watched, seen_update_counts, wait_time)
+            else:
+                time.sleep(wait_time)
+
+        if failures:
+            raise AssertionError("{}:{}{}".format(message, os.linesep, os.linesep.join(
+                "{}: {}".format(self.create_pv_with_prefix(pv), failure) for pv, failure in sorted(failures.items()))))
+
+    def _evaluate_pv_predicates(self, pvs_and_predicates, timeout):
+        """
+        Read several pvs together and evaluate a predicate on each value.
+
+        Args:
+            pvs_and_predicates: dictionary of pv name to predicate
+            timeout: time to wait for the pvs to be read
+        Returns:
+            dict: pv name to a description of the failure, for each pv which could not be read or whose predicate
+                did not return True
+        """
+        values = self.get_pv_values(pvs_and_predicates.keys(), timeout=timeout)
+        failures = {pv: "could not be read: {}".format(error) for pv, error in values.errors.items()}
+        for pv, value in values.values.items():
+            func = pvs_and_predicates[pv]
             try:
-                self.assert_that_pv_is(pv, value)
-            except AssertionError as e:
-                error_message += "\n{}".format(e.message)
-        if error_message != "":
-            raise AssertionError("Not all PVs have given values, see errors: {}".format(error_message))
+                if not func(value):
+                    failures[pv] = "final PV value was {}".format(format_value(value))
+            except Exception as e:
+                failures[pv] = "exception was thrown while evaluating function '{}' on pv value {}: {} {}".format(
+                    getattr(func, "__name__", func), format_value(value), e.__class__.__name__, e)
+        return failures
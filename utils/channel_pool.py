@@ -0,0 +1,244 @@
+"""
+A process wide pool of channel access channels.
+"""
+import threading
+
+from CaChannel import CaChannel, CaChannelException, ca
+
+
+class PooledChannel(object):
+    """
+    A channel held in the channel pool.
+
+    It follows the connection state of the pv through connection callbacks and, once subscribed, wakes up threads
+    waiting on the pv when a monitor event or connection change arrives for it. The first monitor event after
+    subscribing only carries the value the pv already had, so it is not counted as an update. The pool uses its own channels rather
+    than the genie_python cached ones because a channel can only hold one subscription and the cached channels are used
+    by _MonitorAssertion.
+    """
+
+    def __init__(self, full_pv_name):
+        """
+        Initialise. The channel connects in the background so this never blocks.
+        Args:
+            full_pv_name: name of the pv, including the prefix
+        """
+        self.full_pv_name = full_pv_name
+        self.connected = False
+        # Whether the channel has ever been connected, so that a channel which lost its connection can be told from
+        # one which is still searching
+        self.was_connected = False
+        self.update_count = 0
+        self._subscribed = False
+        self._initial_event_pending = False
+        self._subscribe_lock = threading.Lock()
+        # A channel can only have one get with a callback outstanding at a time
+        self.get_lock = threading.Lock()
+        self._channel = CaChannel(full_pv_name)
+        self._channel.search_and_connect(None, self._on_connection_change)
+        self._channel.flush_io()
+
+    @property
+    def channel(self):
+        """
+        Returns (CaChannel): the underlying channel; only use it for puts and gets (holding get_lock) once connected
+        """
+        return self._channel
+
+    def _on_connection_change(self, epics_args, _):
+        with ChannelPool.condition:
+            self.connected = epics_args[1] == ca.CA_OP_CONN_UP
+            self.was_connected = self.was_connected or self.connected
+            self.update_count += 1
+            ChannelPool.condition.notify_all()
+
+    def _on_update(self, *_):
+        with ChannelPool.condition:
+            if self._initial_event_pending:
+                self._initial_event_pending = False
+                return
+            self.update_count += 1
+            ChannelPool.condition.notify_all()
+
+    def subscribe(self):
+        """
+        Subscribe to monitor events on the pv, if not already subscribed. The subscription can be made before the
+        channel connects; it is installed by channel access on connection.
+        """
+        with self._subscribe_lock:
+            if self._subscribed:
+                return
+            with ChannelPool.condition:
+                self._initial_event_pending = True
+            # Only the arrival of an event matters so ask for the smallest update the server can send
+            self._channel.add_masked_array_event(ca.DBR_STRING, 1, None, self._on_update)
+            self._channel.flush_io()
+            self._subscribed = True
+
+    def lost_connection(self):
+        """
+        Returns: True if the channel was connected and is not any more, e.g. because its IOC was stopped
+        """
+        with ChannelPool.condition:
+            return self.was_connected and not self.connected
+
+    def close(self):
+        """
+        Remove the subscription and clear the channel. Threads waiting for an update to the channel are woken so that
+        they read the pv again, through a new channel.
+        """
+        with self._subscribe_lock:
+            try:
+                if self._subscribed:
+                    self._channel.clear_event()
+                self._channel.clear_channel()
+                self._channel.flush_io()
+            except CaChannelException:
+                pass
+            self._subscribed = False
+        with ChannelPool.condition:
+            self.connected = False
+            self.update_count += 1
+            ChannelPool.condition.notify_all()
+
+    def wait_for_update(self, seen_update_count, timeout):
+        """
+        Wait for an update to the pv after the one with the given count.
+
+        Args:
+            seen_update_count: update count at the time the pv was last read
+            timeout: maximum time to wait
+        Returns:
+            True if an update arrived; False on timeout
+        """
+        with ChannelPool.condition:
+            return ChannelPool.condition.wait_for(lambda: self.update_count != seen_update_count, timeout)
+
+    def wait_for_connection(self, timeout):
+        """
+        Wait for the channel to be connected.
+
+        Args:
+            timeout: maximum time to wait
+        Returns:
+            True if the channel is connected; False on timeout
+        """
+        with ChannelPool.condition:
+            return ChannelPool.condition.wait_for(lambda: self.connected, timeout)
+
+
+class ChannelPool(object):
+    """
+    Pool of channels keyed by full pv name, shared by all ChannelAccess instances in the process.
+
+    Channels are kept alive while their pvs are connected, so checking that a pv which is already connected exists needs
+    no channel access traffic. A channel which loses its connection, e.g. because its IOC was stopped, is closed and
+    replaced by a new one the next time it is asked for, and is closed by release_disconnected otherwise. The hit and
+    miss counters record how many existence checks were answered from the pool and how many had to wait for a search,
+    the created counter how many channels were added to the pool and the released counter how many were closed, since
+    the statistics were last taken.
+    """
+
+    hits = 0
+    misses = 0
+    created = 0
+    released = 0
+
+    # Notified on every connection change and monitor event of every pooled channel
+    condition = threading.Condition()
+
+    _channels = {}
+    _channels_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, full_pv_name):
+        """
+        Get the pooled channel for a pv, creating it if this is the first time it has been asked for or its channel lost
+        its connection.
+
+        Args:
+            full_pv_name: name of the pv including the prefix
+        Returns:
+            the pooled channel; None if a channel could not be created for the pv
+        """
+        with cls._channels_lock:
+            channel = cls._channels.get(full_pv_name)
+            if channel is not None:
+                if not channel.lost_connection():
+                    return channel
+                cls._release(full_pv_name)
+            try:
+                channel = PooledChannel(full_pv_name)
+            except CaChannelException:
+                return None
+            cls._channels[full_pv_name] = channel
+            cls.created += 1
+            return channel
+
+    @classmethod
+    def _release(cls, full_pv_name):
+        """
+        Close a channel and remove it from the pool; call holding the channels lock.
+        """
+        cls._channels.pop(full_pv_name).close()
+        cls.released += 1
+
+    @classmethod
+    def release_disconnected(cls):
+        """
+        Close the channels which have lost their connection, e.g. those of the IOCs of a module which have been stopped,
+        so that channel access stops searching for their pvs.
+        """
+        with cls._channels_lock:
+            for full_pv_name in [name for name, channel in cls._channels.items() if channel.lost_connection()]:
+                cls._release(full_pv_name)
+
+    @classmethod
+    def is_connected(cls, full_pv_name, timeout):
+        """
+        Check whether a pv exists, waiting for it to connect if it is not already connected.
+
+        Args:
+            full_pv_name: name of the pv including the prefix
+            timeout: maximum time to wait for the pv to connect
+        Returns:
+            True if the pv is connected; False otherwise
+        """
+        channel = cls.get(full_pv_name)
+        if channel is None:
+            return False
+        with cls.condition:
+            if channel.connected:
+                cls.hits += 1
+                return True
+            cls.misses += 1
+        return channel.wait_for_connection(timeout)
+
+    @classmethod
+    def wait_for_any_update(cls, channels, seen_update_counts, timeout):
+        """
+        Wait for an update to any of several pooled channels.
+
+        Args:
+            channels: the pooled channels to watch
+            seen_update_counts: update count of each channel at the time its pv was last read, in the same order
+            timeout: maximum time to wait
+        Returns:
+            True if an update arrived; False on timeout
+        """
+        with cls.condition:
+            return cls.condition.wait_for(
+                lambda: any(channel.update_count != seen for channel, seen in zip(channels, seen_update_counts)),
+                timeout)
+
+    @classmethod
+    def take_statistics(cls):
+        """
+        Returns: a summary for printing of the channel pool usage since this was last called, e.g. by the last module
+        """
+        with cls._channels_lock, cls.condition:
+            statistics = "Channel pool: {} channels ({} new, {} released), {} existence checks answered from the pool, " \
+                         "{} needed a search".format(len(cls._channels), cls.created, cls.released, cls.hits,
+                                                     cls.misses)
+            cls.hits, cls.misses, cls.created, cls.released = 0, 0, 0, 0
+        return statistics
@@ -1,3 +1,8 @@
+import contextvars
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 try:
     from contextlib import ExitStack  # PY3
@@ -20,13 +25,283 @@ def device_launcher(ioc, lewis):
             yield
 
 
+def launch_dependencies(iocs):
+    """
+    Get the dependencies between the iocs of a test module. An ioc with a depends_on entry depends only on the iocs it
+    lists, so is launched at the same time as any others whose dependencies are running. An ioc without one depends on
+    the ioc listed before it, so by default the iocs are launched one at a time in the order they are listed, as an ioc
+    may connect to the PVs of those before it while it boots.
+    :param iocs: list of ioc dictionaries, as in the IOCS attribute of a test module
+    :return: dictionary of ioc name to the list of names of the iocs which must be running before it is launched
+    """
+    dependencies = {}
+    previous = None
+    for ioc in iocs:
+        if "depends_on" in ioc:
+            dependencies[ioc["name"]] = list(ioc["depends_on"])
+        else:
+            dependencies[ioc["name"]] = [previous] if previous is not None else []
+        previous = ioc["name"]
+    return dependencies
+
+
+def launch_waves(names, depends_on):
+    """
+    Group devices into waves which can be launched together; every device is in a later wave than the devices it
+    depends on. Within a wave devices are kept in the order they were given.
+    :param names: names of the devices in the order they are listed
+    :param depends_on: dictionary of device name to the names of the devices it depends on
+    :return: list of waves, each a list of device names
+    :raises ValueError: if a device depends on a device which is not in the list or the dependencies are circular
+    """
+    for name in names:
+        for dependency in depends_on.get(name, []):
+            if dependency not in names:
+                raise ValueError("Device '{}' depends on '{}' which is not launched by this module".format(
+                    name, dependency))
+
+    waves = []
+    launched = set()
+    remaining = list(names)
+    while remaining:
+        wave = [name for name in remaining if all(dependency in launched for dependency in depends_on.get(name, []))]
+        if not wave:
+            raise ValueError("Devices have circular dependencies: {}".format(", ".join(remaining)))
+        waves.append(wave)
+        launched.update(wave)
+        remaining = [name for name in remaining if name not in launched]
+    return waves
+
+
+def _enter_wave(executor, devices):
+    """
+    Enter the context of several devices at once
+    :param executor: executor to run the launches in
+    :param devices: list of context managers to enter
+    :return: tuple of the list of devices which were entered and the first launch error (None if all launched)
+    """
+    # Each launch is run in a copy of the context so that phases are recorded where the caller records them
+    futures = [(device, executor.submit(contextvars.copy_context().run, device.__enter__)) for device in devices]
+    entered = []
+    error = None
+    for device, future in futures:
+        try:
+            future.result()
+            entered.append(device)
+        except Exception as e:
+            if error is None:
+                error = e
+    return entered, error
+
+
+def _exit_waves(executor, waves):
+    """
+    Exit the context of the devices in waves, last wave first; the devices in each wave are stopped at once
+    :param executor: executor to run the teardowns in
+    :param waves: list of waves of context managers, in the order they were entered
+    :raises Exception: the first teardown error, once every device has been stopped
+    """
+    error = None
+    for wave in reversed(waves):
+        futures = [executor.submit(contextvars.copy_context().run, device.__exit__, None, None, None)
+                   for device in wave]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                print("Error stopping device: {}".format(e))
+                if error is None:
+                    error = e
+    if error is not None:
+        raise error
+
+
 @contextmanager
-def device_collection_launcher(devices):
+def device_collection_launcher(devices, depends_on=None):
     """
-    Context manager that launches a list of devices
-    :param devices: list of context managers representing the devices to launch (see device_launcher above)
+    Context manager that launches a collection of devices. Devices are launched in waves, each wave made of the
+    devices whose dependencies have all been launched, with the devices in a wave launched at the same time. The
+    devices are stopped in the reverse order of the waves.
+    :param devices: dictionary of device name to context manager representing the device to launch (see
+        device_launcher above)
+    :param depends_on: dictionary of device name to the names of the devices it depends on; None if no device depends
+        on another
+    """
+    waves = launch_waves(list(devices.keys()), depends_on or {})
+    if len(devices) == 1:
+        with ExitStack() as stack:
+            for device in devices.values():
+                stack.enter_context(device)
+            yield
+        return
+
+    with ThreadPoolExecutor(max_workers=max(len(wave) for wave in waves)) as executor:
+        entered_waves = []
+        try:
+            for wave in waves:
+                entered, error = _enter_wave(executor, [devices[name] for name in wave])
+                entered_waves.append(entered)
+                if error is not None:
+                    raise error
+            yield
+        except BaseException:
+            try:
+                _exit_waves(executor, entered_waves)
+            except Exception:
+                pass  # already reported; the original error is the one to raise
+            raise
+        else:
+            _exit_waves(executor, entered_waves)
+
+
+# Keys of an ioc entry which do not change the running IOC or emulator, so are left out of its fingerprint
+FINGERPRINT_EXCLUDED_KEYS = ["inits", "depends_on"]
+
+# Macros which are given new values each time an IOC is launched, so are left out of its fingerprint
+FINGERPRINT_EXCLUDED_MACROS = ["EMULATOR_PORT", "LOG_PORT"]
+
+
+def device_fingerprint(ioc, mode):
     """
-    with ExitStack() as stack:
-        for device in devices:
-            stack.enter_context(device)
+    Get a fingerprint of the launch configuration of a device; two devices with the same fingerprint launch the same
+    IOC and emulator in the same way, so a running device can be reused in place of the other.
+    :param ioc: the ioc dictionary, as in the IOCS attribute of a test module
+    :param mode: the mode the device is launched in
+    :return: the fingerprint; None if the device can not be reused because it has a pre launch hook or has reuse
+        switched off
+    """
+    if "pre_ioc_launch_hook" in ioc or not ioc.get("reuse", True):
+        return None
+    config = {key: value for key, value in ioc.items() if key not in FINGERPRINT_EXCLUDED_KEYS}
+    config["macros"] = {macro: value for macro, value in ioc.get("macros", {}).items()
+                        if macro not in FINGERPRINT_EXCLUDED_MACROS}
+    config["mode"] = mode
+    description = repr(sorted((key, repr(_sorted_items(value))) for key, value in config.items()))
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+
+def _sorted_items(value):
+    """
+    :param value: a value from an ioc dictionary
+    :return: the value with dictionaries replaced by their sorted items, so that its repr does not depend on order
+    """
+    if isinstance(value, dict):
+        return sorted((key, _sorted_items(item)) for key, item in value.items())
+    return value
+
+
+class _RunningDevice(object):
+    """
+    A device kept running by the running device pool.
+    """
+    def __init__(self, ioc_launcher, stack):
+        """
+        :param ioc_launcher: the launcher of the device's IOC
+        :param stack: exit stack holding the device's launcher; closing it stops the device
+        """
+        self.ioc_launcher = ioc_launcher
+        self.stack = stack
+
+
+class RunningDevicePool(object):
+    """
+    Devices which are kept running at the end of a test module so that a later module which launches a device with
+    the same fingerprint can reuse it instead of booting it again. Devices are only stopped when they are released or
+    the pool is closed.
+    """
+
+    def __init__(self):
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def reused_device(self, fingerprint, ioc):
+        """
+        Get a context manager which reuses the running device with the given fingerprint. Entering it sets the
+        initial values of the ioc on the running IOC.
+        :param fingerprint: fingerprint of the device
+        :param ioc: the ioc dictionary of the module reusing the device; its emulator and log ports are set to the
+            ports of the running device
+        :return: the context manager; None if no device with the fingerprint is running or its IOC has stopped
+        """
+        with self._lock:
+            running = self._devices.get(fingerprint)
+        if running is None:
+            return None
+        if not running.ioc_launcher.is_responding():
+            print("IOC {} is no longer running so will be launched again".format(ioc["name"]))
+            self._close([fingerprint])
+            return None
+
+        macros = ioc.setdefault("macros", {})
+        for macro in FINGERPRINT_EXCLUDED_MACROS:
+            if macro in running.ioc_launcher.macros:
+                macros[macro] = running.ioc_launcher.macros[macro]
+        print("Reusing running IOC {}".format(ioc["name"]))
+        return self._reuse(running, ioc.get("inits", {}))
+
+    @staticmethod
+    @contextmanager
+    def _reuse(running, init_values):
+        running.ioc_launcher.initialise_pvs(init_values)
+        yield
+
+    @contextmanager
+    def keep_running(self, fingerprint, ioc_launcher, device):
+        """
+        Context manager which launches a device and keeps it running in the pool on exit.
+        :param fingerprint: fingerprint of the device
+        :param ioc_launcher: the launcher of the device's IOC
+        :param device: context manager which launches the device (see device_launcher above)
+        """
+        stack = ExitStack()
+        stack.enter_context(device)
+        with self._lock:
+            self._devices[fingerprint] = _RunningDevice(ioc_launcher, stack)
         yield
+
+    def release(self, keep):
+        """
+        Stop the running devices which are not going to be reused. The devices are stopped at the same time.
+        :param keep: fingerprints of the devices to keep running
+        """
+        self.stop(self.detach(keep))
+
+    def detach(self, keep):
+        """
+        Take the running devices which are not going to be reused out of the pool without stopping them, so that they
+        can be stopped later (see stop) while the pool carries on being used.
+        :param keep: fingerprints of the devices to keep running
+        :return: the devices taken out of the pool
+        """
+        with self._lock:
+            fingerprints = [fingerprint for fingerprint in self._devices if fingerprint not in keep]
+        return self._detach(fingerprints)
+
+    def close(self):
+        """
+        Stop all the running devices.
+        """
+        self.release(keep=set())
+
+    def _detach(self, fingerprints):
+        with self._lock:
+            return [self._devices.pop(fingerprint) for fingerprint in reversed(fingerprints)]
+
+    def _close(self, fingerprints):
+        self.stop(self._detach(fingerprints))
+
+    @staticmethod
+    def stop(devices):
+        """
+        Stop devices taken out of the pool. The devices are stopped at the same time.
+        :param devices: the devices, as returned by detach
+        """
+        if not devices:
+            return
+        with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, device.stack.close) for device in devices]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print("Error stopping device: {}".format(e))
@@ -2,27 +2,51 @@
 Lewis emulator interface classes.
 """
 import abc
+import copy
 import os
 import subprocess
 
 import sys
 import datetime
-from time import sleep, time
+import threading
+import uuid
+from time import sleep, time, monotonic
 from functools import partial
 import six
 
-from utils.free_ports import get_free_ports
+from utils.free_ports import get_free_ports, wait_for_ports
 from utils.ioc_launcher import EPICS_TOP
+from utils.lewis_host import DeviceSimulation, HOST_OBJECT_NAME
 from utils.log_file import log_filename
+from utils.phase_timing import timed_phase
+from utils.process_register import ProcessRegister, process_creation_options
 from utils.formatters import format_value
 
 from utils.emulator_exceptions import UnableToConnectToEmulatorException
 
-from lewis.scripts.control import call_method
-from lewis.core.control_client import ControlClient
+import zmq
+from lewis.scripts.control import convert_type
+from lewis.core.control_client import ControlClient, ProtocolException
+from lewis.core.exceptions import LewisException
 
 DEVICE_EMULATOR_PATH = os.path.join(EPICS_TOP, "support", "DeviceEmulator", "master")
 
+# Script run by the Python Lewis is installed in to host the devices of several emulators
+LEWIS_HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lewis_host.py")
+
+# Time between the first reads of an emulator property when waiting for it to have a value, doubled after each read up
+# to the maximum (seconds)
+EMULATOR_POLL_INITIAL_INTERVAL = 0.005
+EMULATOR_POLL_MAX_INTERVAL = 0.5
+
+# Default time to wait for Lewis to answer on its control channel and accept connections on its device port (seconds)
+LEWIS_STARTUP_TIMEOUT = 60
+
+# Kinds of backdoor operation which can be batched (see EmulatorLauncher.backdoor_batch)
+BACKDOOR_SET = "set"
+BACKDOOR_GET = "get"
+BACKDOOR_CALL = "call"
+
 
 
 class EmulatorRegister(object):
@@ -83,17 +107,26 @@ class EmulatorLauncher(object):
         self._test_name = test_name
 
     def __enter__(self):
-        self._open()
+        with timed_phase("emulator start", self._device):
+            self._open()
         EmulatorRegister.add_emulator(self._emulator_id, self)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._close()
+        with timed_phase("emulator stop", self._device):
+            self._close()
         EmulatorRegister.remove_emulator(self._emulator_id)
 
     def _get_device(self):
         return self._device
 
+    def exit_code(self):
+        """
+        Returns: the exit code of the emulator process if it has exited unexpectedly; None if it is running or the
+            launcher does not run a process which should keep running
+        """
+        return None
+
     def _get_var_dir(self):
         return self._var_dir
 
@@ -178,6 +211,69 @@ class EmulatorLauncher(object):
             Nothing.
         """
 
+    def backdoor_batch(self, operations):
+        """
+        Carry out several backdoor operations in order and return the result of each. Launchers which can send the
+        operations to the emulator in one exchange do so; otherwise they are carried out one after another.
+
+        Args:
+            operations: list of operations, each a tuple of one of
+                (BACKDOOR_SET, variable, value) to set a variable on the device,
+                (BACKDOOR_GET, variable) to get a variable from the device or
+                (BACKDOOR_CALL, function_name, arguments) to run a function on the device, where arguments is an
+                iterable of the arguments or None for no arguments (it can be left out)
+
+        Returns:
+            list: the result of each operation; None for a set
+
+        Raises:
+            ValueError: if an operation is not one of the kinds above
+        """
+        results = []
+        for operation in operations:
+            kind = operation[0]
+            if kind == BACKDOOR_SET:
+                results.append(self.backdoor_set_on_device(operation[1], operation[2]))
+            elif kind == BACKDOOR_GET:
+                results.append(self.backdoor_get_from_device(operation[1]))
+            elif kind == BACKDOOR_CALL:
+                results.append(self.backdoor_run_function_on_device(*operation[1:]))
+            else:
+                raise ValueError("Unknown backdoor operation '{}'".format(kind))
+        return results
+
+    def supports_snapshot(self):
+        """
+        Returns: True if the launcher can take a snapshot of its device and restore it; False otherwise. Callers should
+            check this before using snapshot and restore, and reset the device with backdoor calls if it is False.
+        """
+        return False
+
+    def snapshot(self):
+        """
+        Get the state of the device, e.g. in setUpClass, so that it can be put back before each test with restore rather
+        than by a sequence of backdoor calls. Only available if supports_snapshot returns True.
+
+        Returns:
+            the state of the device, to pass to restore
+
+        Raises:
+            NotImplementedError: if the launcher can not get the state of its device
+        """
+        raise NotImplementedError("{} can not take a snapshot of its device".format(type(self).__name__))
+
+    def restore(self, snapshot):
+        """
+        Put the device back into the state it was in when a snapshot was taken.
+
+        Args:
+            snapshot: the snapshot, from the snapshot method of this launcher
+
+        Raises:
+            NotImplementedError: if the launcher can not set the state of its device
+        """
+        raise NotImplementedError("{} can not restore a snapshot of its device".format(type(self).__name__))
+
     def backdoor_set_and_assert_set(self, variable, value, *args, **kwargs):
         """
         Sets a value on the emulator via the backdoor and gets it back to assert it's been set
@@ -269,6 +365,7 @@ class EmulatorLauncher(object):
         """
         start_time = time()
         current_time = start_time
+        interval = EMULATOR_POLL_INITIAL_INTERVAL
 
         if timeout is None:
             timeout = self._default_timeout
@@ -281,7 +378,8 @@ class EmulatorLauncher(object):
             except UnableToConnectToEmulatorException:
                 pass  # try again next loop maybe the emulator property will have changed
 
-            sleep(0.5)
+            sleep(max(0, min(interval, start_time + timeout - time())))
+            interval = min(2 * interval, EMULATOR_POLL_MAX_INTERVAL)
             current_time = time()
 
         # last try
@@ -326,6 +424,97 @@ class NullEmulatorLauncher(EmulatorLauncher):
 
     def backdoor_run_function_on_device(self, *args, **kwargs): pass
 
+    def supports_snapshot(self): return True
+
+    def snapshot(self): return None
+
+    def restore(self, snapshot): pass
+
+
+def _error_message(response):
+    """
+    :param response: a JSON-RPC response holding an error
+    :return: the message of the error
+    """
+    error = response["error"]
+    return error.get("data", {}).get("message", error.get("message"))
+
+
+class BatchingControlClient(ControlClient):
+    """
+    Lewis control client which can also send several calls in one JSON-RPC batch request.
+    """
+
+    def json_rpc_batch(self, calls):
+        """
+        Send calls to Lewis in one request and wait for the responses.
+
+        :param calls: list of (method, arguments) pairs, e.g. ("device.speed:set", [10])
+        :return: the response to each call, in the order of the calls
+        """
+        request_ids = [str(uuid.uuid4()) for _ in calls]
+        requests = [{"method": method, "params": list(arguments), "jsonrpc": "2.0", "id": request_id}
+                    for (method, arguments), request_id in zip(calls, request_ids)]
+        try:
+            self._socket.send_json(requests)
+            responses = self._socket.recv_json()
+        except zmq.error.Again:
+            raise ProtocolException("The ZMQ connection to {} timed out after {:.2f}s.".format(
+                self._connection_string, self.timeout / 1000))
+
+        if not isinstance(responses, list):
+            # The whole batch was rejected
+            raise ProtocolException(responses.get("error", {}).get("message", "Batch request failed"))
+        responses_by_id = {response.get("id"): response for response in responses}
+        return [responses_by_id.get(request_id) for request_id in request_ids]
+
+    def close(self):
+        """
+        Close the connection to Lewis and its ZMQ context.
+        """
+        context = self._socket.context
+        self._socket.close(linger=0)
+        context.term()
+
+
+class InProcessControlClient(BatchingControlClient):
+    """
+    Control client for a Lewis simulation running in this process, which calls the objects the simulation exposes
+    directly instead of sending requests over ZMQ. Calls are answered with the same JSON-RPC responses Lewis gives.
+    """
+
+    def __init__(self, exposed_object):
+        """
+        :param exposed_object: the collection of objects Lewis exposes on its control channel
+        """
+        # There is no socket to connect, so the ControlClient constructor is not called
+        self._exposed_object = exposed_object
+
+    def json_rpc(self, method, *args):
+        request_id = str(uuid.uuid4())
+        return self._call(method, args, request_id), request_id
+
+    def json_rpc_batch(self, calls):
+        return [self._call(method, arguments) for method, arguments in calls]
+
+    def close(self):
+        pass
+
+    def _call(self, method, arguments, request_id=None):
+        """
+        :return: the JSON-RPC response to calling the method
+        """
+        if method not in self._exposed_object:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32601, "message": "Method not found"}}
+        try:
+            result = self._exposed_object[method](*arguments)
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": request_id,
+                    "error": {"code": -32000, "message": "Server error",
+                              "data": {"type": type(e).__name__, "message": str(e)}}}
+        # A copy, as over the control channel, so that changing the result does not change the device
+        return {"jsonrpc": "2.0", "id": request_id, "result": copy.deepcopy(result)}
+
 
 class LewisLauncher(EmulatorLauncher):
     """
@@ -354,10 +543,17 @@ class LewisLauncher(EmulatorLauncher):
         self._lewis_package = options.get("lewis_package", "lewis_emulators")
         self._default_timeout = options.get("default_timeout", 5)
         self._speed = options.get("speed", 100)
+        self._startup_timeout = options.get("startup_timeout", LEWIS_STARTUP_TIMEOUT)
 
         self._process = None
         self._logFile = None
         self._connected = None
+        self._control_port = None
+        self.remote = None
+        self._remote_objects = None
+        self._read_only_properties = set()
+        # Prefix of the names of the objects of this emulator on the control channel
+        self._object_prefix = ""
 
     def _close(self):
         """
@@ -365,10 +561,11 @@ class LewisLauncher(EmulatorLauncher):
         """
         print("Terminating Lewis")
         if self._process is not None:
-            self._process.terminate()
+            ProcessRegister.stop([self._process.pid])
         if self._logFile is not None:
             self._logFile.close()
             print("Lewis log written to {0}".format(self._log_filename()))
+        self._disconnect_control_client()
 
     def _open(self):
         """
@@ -396,16 +593,80 @@ class LewisLauncher(EmulatorLauncher):
         self._logFile.write("Started Lewis with '{0}'\n".format(" ".join(lewis_command_line)))
 
         self._process = subprocess.Popen(lewis_command_line,
-                                         creationflags=subprocess.CREATE_NEW_CONSOLE,
                                          stdout=self._logFile,
-                                         stderr=subprocess.STDOUT)
+                                         stderr=subprocess.STDOUT,
+                                         **process_creation_options())
+        ProcessRegister.add_process(self._process.pid, "Lewis ({})".format(self._emulator_id))
         self._connected = True
 
-        self.remote = ControlClient("127.0.0.1", self._control_port)
+        self._connect_control_client()
+        try:
+            self._wait_until_ready()
+        except UnableToConnectToEmulatorException:
+            self._close()
+            raise
+
+    def _wait_until_ready(self):
+        """
+        Wait until Lewis answers on its control channel and accepts connections on its device port, returning as soon
+        as it does.
+
+        :raises UnableToConnectToEmulatorException: if Lewis exits or is not ready within the startup timeout
+        """
+        deadline = monotonic() + self._startup_timeout
+        while self._remote_objects is None:
+            if self._process.poll() is not None:
+                raise UnableToConnectToEmulatorException(
+                    self._emulator_id, "Lewis exited with code {}".format(self._process.poll()))
+            if monotonic() > deadline:
+                raise UnableToConnectToEmulatorException(self._emulator_id, "no answer on the control channel after {} "
+                                                                            "seconds".format(self._startup_timeout))
+            try:
+                # A request sent before Lewis is listening is delivered once it is, so this returns as soon as it can
+                self._remote_object("device")
+            except ProtocolException:
+                self._connect_control_client()
+
+        if wait_for_ports([self._port], max(0, deadline - monotonic()),
+                          stop_waiting=lambda: self.exit_code() is not None):
+            raise UnableToConnectToEmulatorException(
+                self._emulator_id, "device port {} not accepting connections after {} seconds".format(
+                    self._port, self._startup_timeout))
+
+    def _connect_control_client(self):
+        """
+        Connect a new control client to Lewis, dropping the object proxies fetched over the previous one.
+        """
+        self._disconnect_control_client()
+        self.remote = BatchingControlClient("127.0.0.1", self._control_port)
+
+    def _disconnect_control_client(self):
+        """
+        Close the control client, if connected, and drop the object proxies fetched over it.
+        """
+        if self.remote is not None:
+            self.remote.close()
+        self.remote = None
+        self._remote_objects = None
+
+    def _remote_object(self, object_name):
+        """
+        Get the proxy of an object Lewis exposes, e.g. the device or the simulation. The proxies are fetched once per
+        connection, which takes a call for each object, rather than on every backdoor command.
+
+        :param object_name: name of the object
+        :return: the proxy
+        """
+        if self._remote_objects is None:
+            self._remote_objects = self.remote.get_object_collection()
+        return self._remote_objects[object_name]
 
     def _log_filename(self):
         return log_filename(self._test_name, "lewis", self._emulator_id, False, self._var_dir)
 
+    def exit_code(self):
+        return self._process.poll() if self._process is not None else None
+
     def check(self):
         """
         Check that the lewis emulator is running.
@@ -465,10 +726,148 @@ class LewisLauncher(EmulatorLauncher):
         :return: lines from the command output
         """
         try:
-            return call_method(self.remote.get_object_collection(), lewis_command[0], lewis_command[1], lewis_command[2:])
+            return self._call_remote(lewis_command[0], lewis_command[1], lewis_command[2:])
+        except ProtocolException as e:
+            # The request may still be answered later, so reconnect rather than risk reading that answer next time
+            self._connect_control_client()
+            sys.stderr.write(f"Error using backdoor: {e}\n")
         except Exception as e:
             sys.stderr.write(f"Error using backdoor: {e}\n")
 
+    def _call_remote(self, object_name, member, arguments):
+        """
+        Get or set a property of, or call a method of, an object Lewis exposes. Unlike lewis-control, a property is
+        set without first being read, so each command is one call to Lewis.
+
+        :param object_name: name of the object, e.g. device
+        :param member: name of the property or method
+        :param arguments: arguments as strings of python literals; the value to set for a property
+        :return: the value of the property or the result of the method
+        """
+        remote_object = self._remote_object(object_name)
+        arguments = [convert_type(argument) for argument in arguments]
+        if isinstance(getattr(type(remote_object), member, None), property):
+            if not arguments:
+                return getattr(remote_object, member)
+            setattr(remote_object, member, arguments[0])
+            return None
+        return getattr(remote_object, member)(*arguments)
+
+    def _batch_call(self, operation):
+        """
+        :param operation: a backdoor operation (see EmulatorLauncher.backdoor_batch)
+        :return: the JSON-RPC method and arguments which carry out the operation
+        """
+        kind = operation[0]
+        if kind == BACKDOOR_CALL:
+            arguments = operation[2] if len(operation) > 2 and operation[2] is not None else []
+            method = "{}device.{}".format(self._object_prefix, operation[1])
+            return method, [self._convert_for_backdoor(argument) for argument in arguments]
+        if kind not in (BACKDOOR_SET, BACKDOOR_GET):
+            raise ValueError("Unknown backdoor operation '{}'".format(kind))
+
+        variable_name = str(operation[1])
+        method = "{}device.{}".format(self._object_prefix, variable_name)
+        if not isinstance(getattr(type(self._remote_object("device")), variable_name, None), property):
+            # A method, which the backdoor calls, with the value as its argument if one is given
+            return method, [self._convert_for_backdoor(value) for value in operation[2:]]
+        if kind == BACKDOOR_SET:
+            return method + ":set", [self._convert_for_backdoor(operation[2])]
+        return method + ":get", []
+
+    def _convert_for_backdoor(self, value):
+        """
+        Convert a value as it would be by passing it through the backdoor as a string.
+        """
+        return convert_type(self._convert_to_string_for_backdoor(value))
+
+    def _send_calls(self, calls):
+        """
+        Send calls to Lewis, keeping their order. Lewis stops answering on its control channel if it can not encode the
+        response to a batch request, which depends on the values returned, so only sets, whose result is always None,
+        are sent in batches; gets and function calls are sent on their own.
+
+        :param calls: list of (method, arguments) pairs
+        :return: the response to each call, in the order of the calls
+        :raises ProtocolException: if Lewis does not answer
+        """
+        responses = []
+        batch = []
+        for method, arguments in calls:
+            if method.endswith(":set"):
+                batch.append((method, arguments))
+                continue
+            if batch:
+                responses.extend(self.remote.json_rpc_batch(batch))
+                batch = []
+            response, _ = self.remote.json_rpc(method, *arguments)
+            responses.append(response)
+        if batch:
+            responses.extend(self.remote.json_rpc_batch(batch))
+        return responses
+
+    def backdoor_batch(self, operations):
+        """
+        Carry out several backdoor operations in order, sending each run of sets to Lewis in one JSON-RPC batch request
+        (see _send_calls).
+
+        :param operations: list of operations (see EmulatorLauncher.backdoor_batch)
+        :return: the result of each operation; None for a set or an operation which failed, whose error is printed
+        """
+        try:
+            calls = [self._batch_call(operation) for operation in operations]
+            responses = self._send_calls(calls)
+        except ProtocolException as e:
+            self._connect_control_client()
+            sys.stderr.write(f"Error using backdoor: {e}\n")
+            return [None] * len(operations)
+
+        results = []
+        for (method, _), response in zip(calls, responses):
+            if response is not None and "error" in response:
+                sys.stderr.write("Error using backdoor: {} failed: {}\n".format(method, _error_message(response)))
+            results.append(None if response is None else response.get("result"))
+        return results
+
+    def supports_snapshot(self):
+        return True
+
+    def snapshot(self):
+        """
+        Get the values of all the properties of the device which Lewis exposes, leaving out those whose values can
+        not be sent over the control channel.
+
+        :return: dictionary of property name to value
+        """
+        device_type = type(self._remote_object("device"))
+        names = sorted(name for name in dir(device_type) if isinstance(getattr(device_type, name), property))
+        responses = self._send_calls([("{}device.{}:get".format(self._object_prefix, name), []) for name in names])
+        return {name: response["result"] for name, response in zip(names, responses)
+                if response is not None and "result" in response}
+
+    def restore(self, snapshot):
+        """
+        Set the properties of the device to the values in a snapshot in one request, in the order of their names.
+        Properties which can not be set, such as those calculated from other properties, are left out from then on.
+
+        :param snapshot: the snapshot
+        """
+        names = [name for name in sorted(snapshot) if name not in self._read_only_properties]
+        try:
+            responses = self._send_calls(
+                [("{}device.{}:set".format(self._object_prefix, name), [snapshot[name]]) for name in names])
+        except ProtocolException as e:
+            self._connect_control_client()
+            sys.stderr.write(f"Error restoring emulator snapshot: {e}\n")
+            return
+        for name, response in zip(names, responses):
+            if response is None or "error" not in response:
+                continue
+            if response["error"].get("data", {}).get("type") == "AttributeError":
+                self._read_only_properties.add(name)
+            else:
+                sys.stderr.write("Error restoring emulator property {}: {}\n".format(name, _error_message(response)))
+
     def backdoor_emulator_disconnect_device(self):
         """
         Disconnect the emulated device.
@@ -499,6 +898,261 @@ class LewisLauncher(EmulatorLauncher):
         return self.backdoor_command(["device", str(variable_name)])
 
 
+class InProcessLewisLauncher(LewisLauncher):
+    """
+    Runs a Lewis emulator in the test process instead of starting Lewis in its own Python process. The simulation and
+    its stream adapter run on background threads and backdoor calls go straight to the objects Lewis exposes, so
+    starting the emulator takes no interpreter startup and backdoor calls take no round trip.
+    """
+
+    def __init__(self, test_name, device, var_dir, port, options):
+        super(InProcessLewisLauncher, self).__init__(test_name, device, var_dir, port, options)
+        self._simulation = None
+        self._exposed_object = None
+
+    def _open(self):
+        """
+        Create the Lewis simulation, run it on a background thread and return once the device is listening on its port.
+        """
+        if self._lewis_additional_path is not None and self._lewis_additional_path not in sys.path:
+            sys.path.append(self._lewis_additional_path)
+
+        print("Starting Lewis in process")
+        self._logFile = open(self._log_filename(), "w")
+        self._logFile.write("Started Lewis in process with device '{0}' from package '{1}'\n".format(
+            self._device, self._lewis_package))
+        try:
+            self._simulation = DeviceSimulation(self._lewis_package, self._device, self._lewis_protocol, self._port,
+                                                self._speed, "Lewis {}".format(self._emulator_id))
+        except LewisException as e:
+            self._close()
+            raise UnableToConnectToEmulatorException(self._emulator_id, str(e))
+
+        if not self._simulation.start(self._startup_timeout):
+            self._close()
+            raise UnableToConnectToEmulatorException(
+                self._emulator_id, "device port {} not accepting connections after {} seconds".format(
+                    self._port, self._startup_timeout))
+        self._exposed_object = self._simulation.exposed_object()
+        self._connected = True
+        self._connect_control_client()
+
+    def _close(self):
+        """
+        Stop the simulation and wait for its thread to finish.
+        """
+        print("Stopping Lewis in process")
+        if self._simulation is not None:
+            self._simulation.stop(self._default_timeout)
+        if self._logFile is not None:
+            if self._simulation is not None and self._simulation.error is not None:
+                self._logFile.write(self._simulation.error)
+            self._logFile.close()
+            print("Lewis log written to {0}".format(self._log_filename()))
+        self._disconnect_control_client()
+        self._simulation = None
+        self._exposed_object = None
+
+    def _connect_control_client(self):
+        self._disconnect_control_client()
+        self.remote = InProcessControlClient(self._exposed_object)
+
+    def exit_code(self):
+        """
+        Returns: 1 if the simulation has stopped with an error; None otherwise
+        """
+        simulation = self._simulation
+        return 1 if simulation is not None and simulation.error is not None else None
+
+    def check(self):
+        """
+        Check that the simulation is running.
+
+        :return: True if it is running; False otherwise
+        """
+        if self.exit_code() is None:
+            return True
+        print("Lewis has terminated! It said:")
+        sys.stderr.write(self._simulation.error)
+        return False
+
+
+class LewisHost(object):
+    """
+    A Lewis process which runs the devices of several Lewis emulators (see lewis_host.py). It is started when the first
+    of its emulators is opened and stopped when the last one is closed.
+    """
+
+    def __init__(self, test_name, var_dir, options):
+        """
+        Args:
+            test_name: name of the test module the host is for
+            var_dir: location of directory to write the log file to
+            options: the options of the first emulator to be hosted, which give the Python and additional path to run
+                Lewis with
+        """
+        self._test_name = test_name
+        self._var_dir = var_dir
+        self._python_path = options.get("python_path", os.path.join(LewisLauncher._DEFAULT_PY_PATH, "python.exe"))
+        self._lewis_additional_path = options.get("lewis_additional_path", DEVICE_EMULATOR_PATH)
+        self._startup_timeout = options.get("startup_timeout", LEWIS_STARTUP_TIMEOUT)
+
+        self._lock = threading.Lock()
+        self._emulators = 0
+        self._process = None
+        self._log_file = None
+        self.control_port = None
+
+    def acquire(self):
+        """
+        Start the host if it is not running and count another emulator as using it.
+
+        :return: the control port of the host
+        :raises UnableToConnectToEmulatorException: if the host does not start
+        """
+        with self._lock:
+            if self._emulators == 0:
+                self._start()
+            self._emulators += 1
+            return self.control_port
+
+    def release(self):
+        """
+        Count an emulator as no longer using the host, stopping it once none are.
+        """
+        with self._lock:
+            self._emulators -= 1
+            if self._emulators == 0:
+                self._stop()
+
+    def _start(self):
+        self.control_port = str(get_free_ports(1)[0])
+        command_line = [self._python_path, LEWIS_HOST_SCRIPT, "-r", "127.0.0.1:{}".format(self.control_port)]
+        if self._lewis_additional_path is not None:
+            command_line.extend(["-a", self._lewis_additional_path])
+
+        print("Starting Lewis host")
+        self._log_file = open(self._log_filename(), "w")
+        self._log_file.write("Started Lewis host with '{0}'\n".format(" ".join(command_line)))
+        self._log_file.flush()
+        self._process = subprocess.Popen(command_line,
+                                         stdout=self._log_file,
+                                         stderr=subprocess.STDOUT,
+                                         **process_creation_options())
+        ProcessRegister.add_process(self._process.pid, "Lewis host ({})".format(self._test_name))
+
+        if wait_for_ports([int(self.control_port)], self._startup_timeout,
+                          stop_waiting=lambda: self.exit_code() is not None):
+            self._stop()
+            raise UnableToConnectToEmulatorException(
+                "Lewis host", "no answer on the control channel after {} seconds".format(self._startup_timeout))
+
+    def _stop(self):
+        print("Terminating Lewis host")
+        if self._process is not None:
+            ProcessRegister.stop([self._process.pid])
+            self._process = None
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+            print("Lewis host log written to {0}".format(self._log_filename()))
+
+    def _log_filename(self):
+        return log_filename(self._test_name, "lewis", "host", False, self._var_dir)
+
+    def exit_code(self):
+        """
+        Returns: the exit code of the host if it has exited; None if it is running or has not been started
+        """
+        process = self._process
+        return process.poll() if process is not None else None
+
+
+class HostedLewisLauncher(LewisLauncher):
+    """
+    Runs the device of a Lewis emulator in a Lewis host shared with other emulators, instead of in a Lewis process of
+    its own. The backdoor uses the objects of the device on the host, which are named after its emulator ID.
+    """
+
+    def __init__(self, test_name, device, var_dir, port, options, host):
+        """
+        Args:
+            test_name: name of test we are creating device emulator for
+            device: device to start
+            var_dir: location of directory to write log file and macros directories
+            port: the port to use
+            options: the options of the emulator
+            host: the LewisHost to run the device in
+        """
+        super(HostedLewisLauncher, self).__init__(test_name, device, var_dir, port, options)
+        self._host = host
+        self._object_prefix = "{}.".format(self._emulator_id)
+        self._added = False
+
+    def _open(self):
+        """
+        Add the device to the host, starting the host if it is not running, and return once it is listening on its
+        port.
+        """
+        print("Starting {} in Lewis host".format(self._emulator_id))
+        self._control_port = self._host.acquire()
+        self._connect_control_client()
+        # The host answers once the device is listening on its port, which can take longer than a backdoor call
+        host_client = BatchingControlClient("127.0.0.1", self._control_port, timeout=self._startup_timeout * 1000)
+        try:
+            host_client.get_object(HOST_OBJECT_NAME).add_device(
+                self._emulator_id, self._device, self._lewis_package, self._lewis_protocol, self._port, self._speed)
+            self._added = True
+        except Exception as e:
+            self._close()
+            raise UnableToConnectToEmulatorException(self._emulator_id, "not added to Lewis host: {}".format(e))
+        finally:
+            host_client.close()
+        self._connected = True
+
+    def _close(self):
+        """
+        Remove the device from the host, stopping the host if no other emulators use it.
+        """
+        print("Stopping {} in Lewis host".format(self._emulator_id))
+        if self._control_port is None:
+            return
+        if self._added:
+            try:
+                self.remote.get_object(HOST_OBJECT_NAME).remove_device(self._emulator_id)
+            except Exception as e:
+                sys.stderr.write("Error removing {} from Lewis host: {}\n".format(self._emulator_id, e))
+            self._added = False
+        self._disconnect_control_client()
+        self._control_port = None
+        self._host.release()
+
+    def _remote_object(self, object_name):
+        """
+        Get the proxy of an object of the device on the host, e.g. its device or simulation, fetching it once per
+        connection.
+        """
+        if self._remote_objects is None:
+            self._remote_objects = {}
+        if object_name not in self._remote_objects:
+            self._remote_objects[object_name] = self.remote.get_object(self._object_prefix + object_name)
+        return self._remote_objects[object_name]
+
+    def exit_code(self):
+        return self._host.exit_code()
+
+    def check(self):
+        """
+        Check that the Lewis host is running.
+
+        :return: True if it is running; False otherwise
+        """
+        if self._host.exit_code() is None:
+            return True
+        print("Lewis host has terminated! See its log for what it said.")
+        return False
+
+
 class CommandLineEmulatorLauncher(EmulatorLauncher):
 
     def __init__(self, test_name, device, var_dir, port, options):
@@ -523,16 +1177,19 @@ class CommandLineEmulatorLauncher(EmulatorLauncher):
 
     def _call_command_line(self, command_line):
         self._process = subprocess.Popen(command_line,
-                                         creationflags=subprocess.CREATE_NEW_CONSOLE,
                                          stdout=self._log_file,
-                                         stderr=subprocess.STDOUT)
+                                         stderr=subprocess.STDOUT,
+                                         **process_creation_options())
+        ProcessRegister.add_process(self._process.pid, "Emulator {} ({})".format(self._device, command_line))
 
         if self.wait:
             self._process.wait()
+            # The command may start the emulator in the background, which must be left running
+            ProcessRegister.remove_process(self._process.pid)
 
     def _close(self):
         if self._process is not None:
-            self._process.terminate()
+            ProcessRegister.stop([self._process.pid])
         if self._log_file is not None:
             self._log_file.close()
 
@@ -1,4 +1,13 @@
 import socket
+from time import monotonic, sleep
+
+# Time between the first checks of whether ports accept connections, doubled after each check up to the maximum
+# (seconds)
+PORT_PROBE_INITIAL_INTERVAL = 0.005
+PORT_PROBE_MAX_INTERVAL = 0.5
+
+# Time to wait for a connection to a port to be accepted in a check (seconds)
+PORT_PROBE_CONNECT_TIMEOUT = 1
 
 
 def get_free_ports(n):
@@ -46,3 +55,38 @@ def get_free_ports_from_list(n, port_low, port_high):
     for s in socks:
         s.close()
     return tuple(ports)
+
+
+def _accepts_connection(host, port):
+    """
+    :return: True if a TCP connection to the port is accepted; False otherwise
+    """
+    try:
+        with socket.create_connection((host, port), timeout=PORT_PROBE_CONNECT_TIMEOUT):
+            return True
+    except (socket.error, OSError):
+        return False
+
+
+def wait_for_ports(ports, timeout, host="127.0.0.1", stop_waiting=None):
+    """
+    Wait until ports accept TCP connections. They are checked often at first and then less often, so that the wait
+    ends soon after a port is opened without a long wait using many checks.
+
+    :param ports: the port numbers
+    :param timeout: the time to wait (seconds)
+    :param host: the host the ports are on
+    :param stop_waiting: function which returns True to stop waiting early, e.g. once the process which should open
+        the ports has exited; None to wait until the timeout
+    :return: the ports which did not accept a connection; empty if all of them did
+    """
+    deadline = monotonic() + timeout
+    interval = PORT_PROBE_INITIAL_INTERVAL
+    waiting = list(ports)
+    while True:
+        waiting = [port for port in waiting if not _accepts_connection(host, port)]
+        remaining = deadline - monotonic()
+        if not waiting or remaining <= 0 or (stop_waiting is not None and stop_waiting()):
+            return waiting
+        sleep(min(interval, remaining))
+        interval = min(2 * interval, PORT_PROBE_MAX_INTERVAL)
@@ -3,22 +3,25 @@ Code that launches an IOC/application under test
 """
 import subprocess
 import os
+import threading
 import time
 from contextlib import contextmanager
 
 import psutil
-from time import sleep
 from abc import ABCMeta
 
 import six
 
+from utils.boot_supervisor import wait_for_boot, BootTimes, IocBootError, BOOT_TIMES_FILE_NAME, \
+    DEFAULT_FATAL_BOOT_PATTERNS
 from utils.channel_access import ChannelAccess
 from utils.free_ports import get_free_ports
 from utils.log_file import log_filename, LogFileManager
+from utils.phase_timing import timed_phase
+from utils.process_register import ProcessRegister, DaemonProcess, process_creation_options
 from utils.test_modes import TestModes
 from datetime import date
 import telnetlib
-from signal import SIGTERM
 
 APPS_BASE = os.path.join("C:\\", "Instrument", "Apps")
 EPICS_TOP = os.environ.get("KIT_ROOT", os.path.join(APPS_BASE, "EPICS"))
@@ -28,6 +31,13 @@ PYTHON3 = os.environ.get("PYTHON3", os.path.join(APPS_BASE, "Python3", "python.e
 DEFAULT_IOC_START_TEXT = "epics>"
 MAX_TIME_TO_WAIT_FOR_IOC_TO_START = 120
 
+# Time to wait for an IOC to exit after `exit` is sent to iocsh before stopping its process (seconds)
+MAX_TIME_TO_WAIT_FOR_IOC_TO_EXIT = 30
+
+# Number of times to try to replace the macros file, and the time between tries (seconds)
+MACROS_FILE_REPLACE_ATTEMPTS = 20
+MACROS_FILE_REPLACE_INTERVAL = 0.05
+
 EPICS_CASE_ENVIRONMENT_VARS = {
     "EPICS_CAS_INTF_ADDR_LIST": "127.0.0.1",
     "EPICS_CAS_BEACON_ADDR_LIST": "127.255.255.255"}
@@ -61,13 +71,17 @@ class check_existence_pv(object):
     def __enter__(self):
         try:
             print("Check that IOC is not running")
-            self.ca.assert_that_pv_does_not_exist(self.test_pv)
+            with timed_phase("IOC check not running", self.device):
+                self.ca.assert_that_pv_does_not_exist(self.test_pv)
         except AssertionError as ex:
             raise AssertionError("IOC '{}' appears to already be running: {}".format(self.device, ex))
 
     def __exit__(self, type, value, traceback):
+        if type is not None:
+            return  # the IOC failed to start, so there is no point waiting for the PV
         try:
-            self.ca.assert_that_pv_exists(self.test_pv)
+            with timed_phase("IOC check running", self.device):
+                self.ca.assert_that_pv_exists(self.test_pv)
         except AssertionError as ex:
             full_pv = self.ca.create_pv_with_prefix(self.test_pv)
             print("Warning, {} still does not exist after IOC start".format(full_pv))
@@ -111,6 +125,13 @@ class BaseLauncher(object):
     Launcher base, this is the base class for a launcher of application under test.
     """
 
+    # Whether the launched process writes the IOC output to the log file itself, so the log file is followed rather
+    # than the process's output pipe
+    _writes_own_log = False
+
+    # Held while the macros file is rewritten, as IOCs which are launched together share it
+    _macros_file_lock = threading.Lock()
+
     def __init__(self, test_name, ioc_config, test_mode, var_dir):
         """
         Constructor which picks some generic things out of the config.
@@ -131,6 +152,7 @@ class BaseLauncher(object):
         self._prefix = ioc_config.get('custom_prefix', self._device)
         self._ioc_started_text = ioc_config.get("started_text", DEFAULT_IOC_START_TEXT)
         self._pv_for_existence = ioc_config.get("pv_for_existence", "DISABLE")
+        self._fatal_boot_patterns = DEFAULT_FATAL_BOOT_PATTERNS + ioc_config.get("fatal_boot_patterns", [])
         self.macros = ioc_config.get("macros", {})
         self.emulator_port = int(self.macros['EMULATOR_PORT'])
         self._extra_environment_vars = ioc_config.get("environment_vars", {})
@@ -141,6 +163,7 @@ class BaseLauncher(object):
         self.command_line = []
         self.log_file_manager = None
         self._process = None
+        self._ioc_process = None
 
         if test_mode not in [TestModes.RECSIM, TestModes.DEVSIM]:
             raise ValueError("Invalid test mode provided")
@@ -170,28 +193,95 @@ class BaseLauncher(object):
 
             self.create_macros_file()
 
+            boot_times = BootTimes(os.path.join(self._var_dir, BOOT_TIMES_FILE_NAME))
+            boot_key = "{}_{}".format(self._device, "RECSIM" if self.use_rec_sim else "DEVSIM")
+            boot_start = time.time()
+
             self.log_file_manager = LogFileManager(self.log_file_name)
-            self.log_file_manager.log_file.write("Started IOC with '{0}'".format(" ".join(self.command_line)))
+            self.log_file_manager.write("Started IOC with '{0}'\n".format(" ".join(self.command_line)))
 
             # To be able to see the IOC output for debugging, remove the redirection of stdin, stdout and stderr.
             # This does mean that the IOC will need to be closed manually after the tests.
             # Make sure to revert before checking code in
-            self._process = subprocess.Popen(" ".join(self.command_line), creationflags=subprocess.CREATE_NEW_CONSOLE,
-                                             cwd=self._directory, stdin=subprocess.PIPE,
-                                             stdout=self.log_file_manager.log_file, stderr=subprocess.STDOUT,
-                                             env=settings)
+            self._process = subprocess.Popen(" ".join(self.command_line), cwd=self._directory, stdin=subprocess.PIPE,
+                                             stdout=self.log_file_manager.log_file if self._writes_own_log
+                                             else subprocess.PIPE, stderr=subprocess.STDOUT,
+                                             env=settings, **process_creation_options())
+            ProcessRegister.add_process(self._process.pid, "IOC {}".format(self._device))
+            self._ioc_process = self._watch(self._process)
+            self.log_file_manager.follow(None if self._writes_own_log else self._process.stdout)
 
             # Write a return so that an epics terminal will appear after boot
-            self._process.stdin.write("\n".encode("utf-8"))
-            self._process.stdin.flush()
-            self.log_file_manager.wait_for_console(MAX_TIME_TO_WAIT_FOR_IOC_TO_START, self._ioc_started_text)
+            try:
+                self._process.stdin.write("\n".encode("utf-8"))
+                self._process.stdin.flush()
+            except (IOError, OSError):
+                pass  # the process has already exited, which is reported while waiting for it to boot
+            with timed_phase("IOC wait for console", self._device):
+                try:
+                    wait_for_boot(self.log_file_manager, self._ioc_process, self._ioc_started_text,
+                                  boot_times.timeout(boot_key, MAX_TIME_TO_WAIT_FOR_IOC_TO_START),
+                                  self._fatal_boot_patterns)
+                except IocBootError:
+                    self._stop_failed_boot()
+                    raise
+            boot_times.record(boot_key, time.time() - boot_start)
 
-            for key, value in self._init_values.items():
-                print("Initialising PV {} to {}".format(key, value))
-                self.ca.set_pv_value(key, value)
+            with timed_phase("IOC inits", self._device):
+                self.initialise_pvs(self._init_values)
 
         IOCRegister.add_ioc(self._device, self)
 
+    def _watch(self, process):
+        """
+        Args:
+            process (subprocess.Popen): the launched process
+        Returns:
+            the process to watch for whether the IOC is running, with the poll method of subprocess.Popen; the launched
+                process unless it starts the IOC in the background and exits
+        """
+        return process
+
+    def _stop_failed_boot(self):
+        """
+        Stop the process of an IOC which failed to boot, with any processes it started, so it does not hold on to its
+        ports.
+        """
+        ProcessRegister.stop([self._process.pid], terminate_timeout=0)
+        self.log_file_manager.close()
+        print("IOC log written to {0}".format(self.log_file_name))
+
+    def initialise_pvs(self, init_values):
+        """
+        Set PVs of the IOC to their initial values.
+
+        :param init_values: dictionary of PV name (without the IOC prefix) to initial value
+        """
+        for key, value in init_values.items():
+            print("Initialising PV {} to {}".format(key, value))
+        if init_values:
+            self._get_channel_access().set_pv_values(init_values).assert_succeeded()
+
+    def exit_code(self):
+        """
+        :return: the exit code of the process running the IOC if it has exited; None if it is running or was not
+            launched. For procServ this is the procServ daemon, which keeps running while it restarts the IOC.
+        """
+        return self._ioc_process.poll() if self._ioc_process is not None else None
+
+    def is_responding(self, timeout=1):
+        """
+        Check whether the IOC is still running by looking for its existence PV.
+
+        :param timeout: time to wait for the existence PV to be found
+        :return: True if the existence PV was found; False otherwise
+        """
+        try:
+            self._get_channel_access().assert_that_pv_exists(self._pv_for_existence, timeout=timeout)
+            return True
+        except AssertionError:
+            return False
+
     def _command_line(self):
         """
         The command line used to start an IOC that a subclass is expected to provide.
@@ -209,7 +299,8 @@ class BaseLauncher(object):
         return self
 
     def __exit__(self, *args, **kwargs):
-        self.close()
+        with timed_phase("IOC close", self._device):
+            self.close()
 
     def _get_channel_access(self):
         """
@@ -222,16 +313,39 @@ class BaseLauncher(object):
 
     def create_macros_file(self):
         """
-        Creates a temporary file that sets the EPICS macros, this file is called when the IOC first starts
+        Sets the EPICS macros of this IOC in the temporary macros file, which the IOC reads when it starts. Each line
+        of the file is prefixed with the name of the IOC it is for, so the file keeps the macros of the other IOCs,
+        which may be starting at the same time, and only the lines of this IOC are replaced.
         """
         full_dir = os.path.join(self._var_dir, "tmp")
         if not os.path.exists(full_dir):
             os.makedirs(full_dir)
-
-        with open(os.path.join(full_dir, "test_macros.txt"), mode="w") as f:
+        macros_file_name = os.path.join(full_dir, "test_macros.txt")
+        ioc_prefix = "{}__".format(self._device_icp_config_name)
+
+        with self._macros_file_lock:
+            try:
+                with open(macros_file_name) as f:
+                    lines = [line for line in f if not line.startswith(ioc_prefix)]
+            except IOError:
+                lines = []
             for macro, value in self.macros.items():
-                f.write("{ioc_name}__{macro}=\"{value}\"\n".format(ioc_name=self._device_icp_config_name, macro=macro, value=value))
-          
+                lines.append("{}{}=\"{}\"\n".format(ioc_prefix, macro, value))
+
+            # Replace the file in one go so that an IOC which is reading it never sees it part written
+            temporary_file_name = "{}.{}".format(macros_file_name, os.getpid())
+            with open(temporary_file_name, mode="w") as f:
+                f.writelines(lines)
+            for attempt in range(MACROS_FILE_REPLACE_ATTEMPTS):
+                try:
+                    os.replace(temporary_file_name, macros_file_name)
+                    break
+                except OSError:
+                    # On Windows the file can not be replaced while an IOC has it open
+                    if attempt == MACROS_FILE_REPLACE_ATTEMPTS - 1:
+                        raise
+                    time.sleep(MACROS_FILE_REPLACE_INTERVAL)
+
     def get_environment_vars(self):
         """
         Get the current environment variables and add in the extra ones needed for starting the IOC in DEVSIM/RECSIM.
@@ -274,6 +388,9 @@ class ProcServLauncher(BaseLauncher):
 
     ICPTOOLS = os.path.join(EPICS_TOP, "tools", "master")
 
+    # procServ writes the IOC output to the log file given by --logfile
+    _writes_own_log = True
+
     def __init__(self, test_name, ioc, test_mode, var_dir):
         """
         Constructor which calls ProcServ to boot an IOC
@@ -294,9 +411,42 @@ class ProcServLauncher(BaseLauncher):
         self.procserv_port = get_free_ports(1)[0]
 
         self._telnet = None
+        self._procserv_pid = None
         self.autorestart = True
         self.original_macros = ioc.get("macros", {})
 
+    def _pid_file(self):
+        """
+        Returns:
+            the path of the file procServ writes its process id to
+        """
+        return os.path.join("C:\\", "windows", "temp", "EPICS_{}.pid".format(self._device))
+
+    def _find_procserv_pid(self):
+        """
+        Find the procServ process of this IOC from the process id in its pid file, only looking through all the
+        processes on the machine if the pid file does not give it.
+
+        Returns:
+            the process id of procServ; None if it is not running
+        """
+        try:
+            with open(self._pid_file()) as pid_file:
+                pid = int(pid_file.read().strip())
+            process = psutil.Process(pid)
+            if process.name() == "procServ.exe" and self.process_arguments_match_this_ioc(process.cmdline()):
+                return pid
+        except (IOError, OSError, ValueError, psutil.Error):
+            pass  # the pid file is missing or out of date
+
+        for process in psutil.process_iter(attrs=['pid', 'name']):
+            try:
+                if process.info['name'] == 'procServ.exe' and self.process_arguments_match_this_ioc(process.cmdline()):
+                    return process.pid
+            except psutil.Error:
+                pass
+        return None
+
     def get_environment_vars(self):
         settings = super(ProcServLauncher, self).get_environment_vars()
 
@@ -335,7 +485,7 @@ class ProcServLauncher(BaseLauncher):
                 '--timefmt="%Y-%m-%d %H:%M:%S"',
                 '--restrict', '--ignore="^D^C"', '--autorestart', '--wait',
                 '--name={}'.format(self._device.upper()),
-                '--pidfile="/cygdrive/c/windows/temp/EPICS_{}.pid"'.format(self._device),
+                '--pidfile="{}"'.format(self.to_cygwin_address(self._pid_file())),
                 '--logport={:d}'.format(self.logport), '--chdir="{}"'.format(cygwin_dir),
                 '{:d}'.format(self.procserv_port), '{}'.format(comspec), '/c', 'runIOC.bat', 'st.cmd']
 
@@ -349,6 +499,12 @@ class ProcServLauncher(BaseLauncher):
         """
         super(ProcServLauncher, self).open()
 
+        self._procserv_pid = self._ioc_process.pid
+        if self._procserv_pid is None:
+            self._procserv_pid = self._find_procserv_pid()
+        if self._procserv_pid is not None:
+            ProcessRegister.add_process(self._procserv_pid, "procServ ({})".format(self._device))
+
         print("IOC started, connecting to procserv")
 
         timeout = 20
@@ -361,6 +517,17 @@ class ProcServLauncher(BaseLauncher):
         if "Welcome to procServ" not in init_output:
             raise OSError("Cannot connect to procServ over telnet")
 
+    def _watch(self, process):
+        # procServ runs in the background without --foreground, so the launched process exits once it has started it
+        return DaemonProcess(process, self._find_procserv_pid)
+
+    def _stop_failed_boot(self):
+        procserv_pid = self._find_procserv_pid()
+        if procserv_pid is not None:
+            ProcessRegister.add_process(procserv_pid, "procServ ({})".format(self._device))
+            ProcessRegister.stop([procserv_pid], terminate_timeout=0)
+        super(ProcServLauncher, self)._stop_failed_boot()
+
     def send_telnet_command_and_retry_if_not_detected_condition_for_success(
             self, command, condition_for_success, retry_limit):
         """
@@ -445,26 +612,23 @@ class ProcServLauncher(BaseLauncher):
 
     def close(self):
         """
-        Shuts telnet connection and kills IOC. Identifies the spawned procServ processes and kills them
+        Shuts telnet connection and kills IOC. Stops the procServ process, found from its pid file, and the processes
+        it started, returning as soon as they have exited.
         """
 
         if self._telnet is not None:
             self._telnet.close()
 
-        at_least_one_killed = False
-        for process in psutil.process_iter(attrs=['pid', 'name']):
-            if process.info['name'] == 'procServ.exe' and self.process_arguments_match_this_ioc(process.cmdline()):
-                # Command line arguments match, kill procServ instance
-                pid = process.pid
-                os.kill(pid, SIGTERM)
-                time.sleep(10)
-                if psutil.pid_exists(pid):
-                    print("Process is still running try killing again!")
-                    os.kill(pid, SIGTERM)
-                at_least_one_killed = True
-
-        if not at_least_one_killed:
+        pids = [self._process.pid] if self._process is not None else []
+        procserv_pid = self._procserv_pid if self._procserv_pid is not None else self._find_procserv_pid()
+        if procserv_pid is None:
             print("No process with name procServ.exe found that matched command line {}".format(self.command_line))
+        else:
+            # procServ is not registered yet if it was only found now
+            ProcessRegister.add_process(procserv_pid, "procServ ({})".format(self._device))
+            pids.append(procserv_pid)
+        ProcessRegister.stop(pids)
+        self._procserv_pid = None
 
     def process_arguments_match_this_ioc(self, process_arguments):
         """
@@ -565,32 +729,22 @@ class IocLauncher(BaseLauncher):
 
         if self._process is not None:
             #  use write not communicate so that we don't wait for exit before continuing
-            self._process.stdin.write("exit\n".encode("utf-8"))
-            self._process.stdin.flush()
-
-            max_wait_for_ioc_to_die = 60
-            wait_per_loop = 0.1
-
-            for loop_count in range(int(max_wait_for_ioc_to_die/wait_per_loop)):
-                try:
-                    self._get_channel_access().assert_that_pv_does_not_exist(self._pv_for_existence)
-                    break
-                except AssertionError:
-                    sleep(wait_per_loop)
-                    if loop_count % 100 == 99:
-                        print("   waited {}".format(loop_count*wait_per_loop))
-            else:
-                print("IOC process did not die after {} seconds after killing with `exit` in iocsh. "
-                      "Killing process and waiting another {} seconds"
-                      .format(max_wait_for_ioc_to_die, max_wait_for_ioc_to_die))
-                self._process.kill()
-                sleep(max_wait_for_ioc_to_die)
-                try:
-                    self._get_channel_access().assert_that_pv_does_not_exist(self._pv_for_existence)
-                    print("After killing process forcibly and waiting, IOC died correctly.")
-                except AssertionError:
-                    print("After killing process forcibly and waiting, IOC was still up. Will continue anyway, but "
-                          "the next set of tests to use this IOC are likely to fail")
+            try:
+                self._process.stdin.write("exit\n".encode("utf-8"))
+                self._process.stdin.flush()
+            except (IOError, OSError):
+                pass  # the IOC has already exited
+
+            try:
+                self._process.wait(MAX_TIME_TO_WAIT_FOR_IOC_TO_EXIT)
+            except subprocess.TimeoutExpired:
+                print("IOC process did not exit within {} seconds of `exit` in iocsh, so stopping it"
+                      .format(MAX_TIME_TO_WAIT_FOR_IOC_TO_EXIT))
+
+            # Stops anything the IOC process left running, as well as the process if it did not exit
+            if ProcessRegister.stop([self._process.pid]):
+                print("IOC process could not be stopped. Will continue anyway, but the next set of tests to use this "
+                      "IOC are likely to fail")
 
         self._print_log_file_location()
 
@@ -633,6 +787,6 @@ class PythonIOCLauncher(IocLauncher):
 
         if self._process is not None:
             # just kill a process if this is the only way to stop it
-            self._process.kill()
+            ProcessRegister.stop([self._process.pid], terminate_timeout=0)
 
         self._print_log_file_location()
@@ -0,0 +1,148 @@
+"""
+History of how long test jobs took in earlier runs, used to schedule jobs and estimate when a run will finish.
+"""
+import datetime
+import json
+import os
+import time
+
+# Name of the history file, written to the var dir by default
+HISTORY_FILE_NAME = "ioc_test_job_history.json"
+
+# Duration assumed for a job when there is no history at all
+DEFAULT_JOB_DURATION = 60.0
+
+
+def job_key(module_name, mode_name):
+    """
+    Args:
+        module_name: name of the test module
+        mode_name: name of the mode the module was run in
+    Returns:
+        str: key of the job in the history
+    """
+    return "{}:{}".format(module_name, mode_name)
+
+
+def durations_of_tests(result):
+    """
+    Get the time each test took from the result of an xmlrunner run.
+
+    Args:
+        result: the result returned by XMLTestRunner.run
+    Returns:
+        dict: test id to the time the test took in seconds
+    """
+    durations = {}
+    for tests in (result.successes, result.failures, result.errors, result.skipped, result.expectedFailures,
+                  result.unexpectedSuccesses):
+        for test_info in tests:
+            if isinstance(test_info, tuple):
+                # This is a skipped, error or a failure test case
+                test_info = test_info[0]
+            durations[test_info.test_id] = test_info.elapsed_time
+    return durations
+
+
+class JobHistory(object):
+    """
+    Timings of each (module, mode) job from the most recent run of it, kept in a JSON file.
+
+    For each job the time to boot its IOCs and emulators, run its tests and tear them down are stored, along with the
+    time each of its tests took.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: path of the history file; it need not exist yet
+        """
+        self.path = path
+        self._jobs = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as history_file:
+                    self._jobs = json.load(history_file).get("jobs", {})
+            except (IOError, ValueError) as e:
+                print("Ignoring unreadable test history {}: {}".format(path, e))
+
+    def record(self, module_name, mode_name, timings):
+        """
+        Record the timings of a job, replacing those from earlier runs.
+
+        Args:
+            module_name: name of the test module
+            mode_name: name of the mode the module was run in
+            timings: dictionary of boot, tests and teardown times in seconds and test_durations, a dictionary of test
+                id to time taken
+        """
+        entry = {name: timings.get(name, 0.0) for name in ("boot", "tests", "teardown")}
+        entry["test_durations"] = timings.get("test_durations", {})
+        entry["last_run"] = datetime.datetime.now().isoformat()
+        self._jobs[job_key(module_name, mode_name)] = entry
+
+    def job_duration(self, module_name, mode_name):
+        """
+        Args:
+            module_name: name of the test module
+            mode_name: name of the mode
+        Returns:
+            float: total time the job took when it was last run; None if it has not been run before
+        """
+        entry = self._jobs.get(job_key(module_name, mode_name))
+        if entry is None:
+            return None
+        return entry["boot"] + entry["tests"] + entry["teardown"]
+
+    def estimate(self, module_name, mode_name):
+        """
+        Args:
+            module_name: name of the test module
+            mode_name: name of the mode
+        Returns:
+            float: expected time for the job; the mean time of all jobs in the history if it has not been run before
+        """
+        duration = self.job_duration(module_name, mode_name)
+        if duration is not None:
+            return duration
+        durations = [entry["boot"] + entry["tests"] + entry["teardown"] for entry in self._jobs.values()]
+        return sum(durations) / len(durations) if durations else DEFAULT_JOB_DURATION
+
+    def save(self):
+        """
+        Write the history to its file.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path, "w") as history_file:
+            json.dump({"jobs": self._jobs}, history_file, indent=1, sort_keys=True)
+
+
+class RemainingTimeEstimate(object):
+    """
+    Estimates the time left in a run from the expected durations of the jobs which have not finished.
+    """
+
+    def __init__(self, estimates, number_of_workers=1):
+        """
+        Args:
+            estimates: dictionary of job to its expected duration in seconds
+            number_of_workers: number of jobs run at the same time
+        """
+        self._remaining = dict(estimates)
+        self._number_of_workers = number_of_workers
+        self._total = len(estimates)
+
+    def job_finished(self, job):
+        """
+        Mark a job as finished and print how many jobs are left and the estimated time left.
+
+        Args:
+            job: the job which finished
+        """
+        self._remaining.pop(job, None)
+        time_left = sum(self._remaining.values()) / self._number_of_workers
+        print("Finished {} of {} jobs; estimated time remaining {} (finishing at {})".format(
+            self._total - len(self._remaining), self._total, datetime.timedelta(seconds=int(time_left)),
+            time.strftime("%H:%M:%S", time.localtime(time.time() + time_left))))
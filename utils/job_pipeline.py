@@ -0,0 +1,237 @@
+"""
+Pipelining of the jobs of a run in series: the IOCs and emulators of the next job are launched in the background while
+the tests of the current job run, as long as they do not clash with those of the current job, and the IOCs and
+emulators of finished jobs are stopped in the background, so that the run does not wait for either between jobs.
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from utils.phase_timing import collecting_phases, record_phases
+
+# Number of jobs whose devices can be stopped at the same time
+REAPER_THREADS = 2
+
+
+# Keys of an IOC dictionary which its claims depend on (see device_claims)
+CLAIM_KEYS = ["name", "custom_prefix", "pv_for_existence", "icpconfigname", "emulator_id", "emulator"]
+
+
+def device_claims(iocs):
+    """
+    Args:
+        iocs: the IOCS attribute of a test module
+    Returns:
+        set: what the IOCs and emulators of the module hold while they run: the IOC names, PV prefixes and existence
+            PVs, the names the IOC macros are set under in the shared macros file and the emulator ids. The devices of
+            two modules can run at the same time if their claims do not overlap.
+    """
+    claims = set()
+    for ioc in iocs:
+        prefix = ioc.get("custom_prefix", ioc["name"])
+        claims.add(("ioc", ioc["name"]))
+        claims.add(("prefix", prefix))
+        claims.add(("existence pv", "{}:{}".format(prefix, ioc.get("pv_for_existence", "DISABLE"))))
+        # An IOC restarted with other macros rewrites its lines of the macros file, which an IOC launched with the same
+        # name would read as it boots
+        claims.add(("macros", ioc.get("icpconfigname", ioc["name"])))
+        emulator_id = ioc.get("emulator_id", ioc.get("emulator"))
+        if emulator_id is not None:
+            claims.add(("emulator", emulator_id))
+    return claims
+
+
+class DeviceReaper(object):
+    """
+    Stops the devices of finished jobs in background threads. Launches wait for the devices being stopped whose claims
+    overlap theirs, so that a device is never launched while one with the same name or PVs is still stopping.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=REAPER_THREADS, thread_name_prefix="device reaper")
+        self._stopping = []
+        self._lock = threading.Lock()
+
+    def stop(self, claims, stop_devices, phases):
+        """
+        Stop devices in the background.
+
+        Args:
+            claims: claims of the devices (see device_claims)
+            stop_devices: function which stops the devices
+            phases: list to record the phases of stopping the devices in
+        """
+        def _stop():
+            with collecting_phases(phases):
+                try:
+                    stop_devices()
+                except Exception as e:
+                    print("Error stopping devices: {}".format(e))
+
+        future = self._executor.submit(contextvars.copy_context().run, _stop)
+        with self._lock:
+            self._stopping = [(stopping_claims, stopping) for stopping_claims, stopping in self._stopping
+                              if not stopping.done()]
+            self._stopping.append((claims, future))
+
+    def wait_for(self, claims):
+        """
+        Wait until the devices being stopped whose claims overlap the given claims have stopped.
+
+        Args:
+            claims: claims of the devices about to be launched
+        """
+        with self._lock:
+            futures = [future for stopping_claims, future in self._stopping if stopping_claims & claims]
+        wait(futures)
+
+    def close(self):
+        """
+        Wait until all the devices have stopped.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class PipelinedDevices(object):
+    """
+    Context manager for the devices of a job. The devices can be launched in the background before it is entered, in
+    which case entering it waits for the launch to finish; on exit the devices are handed to the reaper to stop.
+    """
+
+    def __init__(self, devices, claims, reaper, teardown_phases):
+        """
+        Args:
+            devices: context manager which launches the devices of the job
+            claims: claims of the devices (see device_claims)
+            reaper (DeviceReaper): reaper to stop the devices
+            teardown_phases: list to record the phases of stopping the devices in
+        """
+        self._devices = devices
+        self._claims = claims
+        self._reaper = reaper
+        self._teardown_phases = teardown_phases
+        self._launch_phases = []
+        self._launch_thread = None
+        self._launched = False
+        self._launch_error = None
+        self.on_launched = None
+
+    def _launch(self):
+        with collecting_phases(self._launch_phases):
+            self._reaper.wait_for(self._claims)
+            try:
+                self._devices.__enter__()
+                self._launched = True
+            except Exception as e:
+                self._launch_error = e
+
+    def launch_in_background(self):
+        """
+        Start launching the devices in a background thread.
+        """
+        self._launch_thread = threading.Thread(target=contextvars.copy_context().run, args=(self._launch,),
+                                               name="launch ahead", daemon=True)
+        self._launch_thread.start()
+
+    def __enter__(self):
+        if self._launch_thread is None:
+            self._launch()
+        else:
+            self._launch_thread.join()
+        # The launch phases are the job's, so they are recorded now that the job is running
+        record_phases(self._launch_phases)
+        if self._launch_error is not None:
+            raise self._launch_error
+        if self.on_launched is not None:
+            self.on_launched()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stop(self):
+        """
+        Hand the devices to the reaper to stop, once they have been launched. This also stops devices which were
+        launched in the background but never entered.
+        """
+        def _stop_devices():
+            if self._launch_thread is not None:
+                self._launch_thread.join()
+            if self._launched:
+                self._devices.__exit__(None, None, None)
+
+        self._reaper.stop(self._claims, _stop_devices, self._teardown_phases)
+
+
+class JobPipeline(object):
+    """
+    The jobs of a run in series whose devices have been launched ahead of them or are being stopped.
+    """
+
+    def __init__(self, make_devices):
+        """
+        Args:
+            make_devices: function which, given a job, returns a tuple of the context manager which launches the job's
+                devices and the claims of the devices; it raises if the devices of the job can not be made
+        """
+        self._make_devices = make_devices
+        self._reaper = DeviceReaper()
+        self._launched_ahead = {}
+        self.teardown_phases = {}
+
+    def _pipelined_devices(self, job):
+        devices, claims = self._make_devices(job)
+        return PipelinedDevices(devices, claims, self._reaper, self.teardown_phases.setdefault(job, []))
+
+    def devices(self, job, on_launched=None):
+        """
+        Args:
+            job: the job
+            on_launched: function to call once the job's devices are running; None for nothing
+        Returns:
+            PipelinedDevices: the devices of the job; those launched ahead if they were
+        """
+        devices = self._launched_ahead.pop(job, None)
+        if devices is None:
+            devices = self._pipelined_devices(job)
+        devices.on_launched = on_launched
+        return devices
+
+    def launch_ahead(self, job):
+        """
+        Start launching the devices of a job in the background.
+
+        Args:
+            job: the job
+        Returns:
+            bool: True if the devices are being launched; False if they could not be made, in which case the error is
+                reported when the job is run
+        """
+        try:
+            devices = self._pipelined_devices(job)
+        except Exception:
+            return False
+        self._launched_ahead[job] = devices
+        devices.launch_in_background()
+        return True
+
+    def stop_in_background(self, job, claims, stop_devices):
+        """
+        Stop devices of a job which were not stopped on leaving its devices' context, e.g. those released from the
+        running device pool.
+
+        Args:
+            job: the job the devices were running for
+            claims: claims of the devices (see device_claims)
+            stop_devices: function which stops the devices
+        """
+        self._reaper.stop(claims, stop_devices, self.teardown_phases.setdefault(job, []))
+
+    def close(self):
+        """
+        Stop the devices launched ahead of jobs which were not run, and wait until all the devices have stopped.
+        """
+        for devices in self._launched_ahead.values():
+            devices.stop()
+        self._launched_ahead = {}
+        self._reaper.close()
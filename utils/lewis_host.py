@@ -0,0 +1,209 @@
+"""
+A Lewis process which runs the devices of several emulators, each on its own port. Devices are added and removed over
+the control channel, on which the objects of each device are exposed under its emulator ID, e.g. kepco_01.device.
+
+This is run in the Python which Lewis is installed in, so it only imports Lewis and the standard library:
+
+    python lewis_host.py -r 127.0.0.1:10000 [-a additional_path]
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import traceback
+from time import monotonic, sleep
+
+from lewis.core.control_server import ControlServer, ExposedObject, ExposedObjectCollection
+from lewis.core.devices import DeviceRegistry
+from lewis.core.logging import default_log_format
+from lewis.core.simulation import Simulation
+
+# Name the host itself is exposed under on the control channel
+HOST_OBJECT_NAME = "host"
+
+# Time to wait for the interface of a device to start listening once its simulation is started (seconds)
+SIMULATION_START_TIMEOUT = 2
+
+# Time to wait for the simulation of a device to stop once it has been told to (seconds)
+SIMULATION_STOP_TIMEOUT = 5
+
+# Time between the first checks of whether a simulation has started, doubled after each check up to the maximum
+# (seconds)
+SIMULATION_START_POLL_INITIAL_INTERVAL = 0.001
+SIMULATION_START_POLL_MAX_INTERVAL = 0.05
+
+
+class DeviceSimulation(object):
+    """
+    The Lewis simulation of a device run on a thread of its own, as a Lewis process runs it.
+    """
+
+    def __init__(self, package, device, protocol, port, speed, name):
+        """
+        :param package: package containing the device
+        :param device: name of the device
+        :param protocol: protocol of the device interface to use
+        :param port: port for the device to listen on
+        :param speed: speed of the simulation
+        :param name: name of the thread to run the simulation on
+        :raises LewisException: if the device or its interface can not be created
+        """
+        device_builder = DeviceRegistry(package).device_builder(device)
+        self.device = device_builder.create_device()
+        interface = device_builder.create_interface(protocol)
+        interface.device = self.device
+        self._adapter = interface.adapter(options={"bind_address": "127.0.0.1", "port": port})
+        self._adapter.interface = interface
+
+        self.simulation = Simulation(device=self.device, adapters=[self._adapter], device_builder=device_builder)
+        self.simulation.speed = speed
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def _run(self):
+        try:
+            self.simulation.start()
+        except Exception:
+            self.error = traceback.format_exc()
+            sys.stderr.write(self.error)
+
+    @property
+    def is_running(self):
+        """
+        True once the simulation has started and its device interface is listening, until it is stopped.
+        """
+        return self.simulation.is_started and self._adapter.is_running
+
+    def start(self, timeout=SIMULATION_START_TIMEOUT):
+        """
+        Start the simulation and wait until its device interface is listening.
+
+        :param timeout: time to wait (seconds)
+        :return: True if the interface is listening; False if the simulation stopped or it is not listening in time
+        """
+        self._thread.start()
+        return self._wait_until(lambda: self.is_running, timeout)
+
+    def _wait_until(self, condition, timeout):
+        """
+        Wait until a condition holds, the simulation thread ends or the timeout passes.
+
+        :return: True if the condition holds; False otherwise
+        """
+        deadline = monotonic() + timeout
+        interval = SIMULATION_START_POLL_INITIAL_INTERVAL
+        while not condition():
+            if not self._thread.is_alive() or monotonic() > deadline:
+                return False
+            sleep(interval)
+            interval = min(2 * interval, SIMULATION_START_POLL_MAX_INTERVAL)
+        return True
+
+    def exposed_object(self):
+        """
+        Get the objects of the simulation which a Lewis process exposes on its control channel. Call this once the
+        simulation is running, so that calls to the device take the lock the simulation processes it under.
+
+        :return: collection of the device and the simulation
+        """
+        return ExposedObjectCollection({
+            "device": ExposedObject(self.device, exclude_inherited=True, lock=self._adapter.device_lock),
+            "simulation": ExposedObject(self.simulation, exclude=("start", "control_server", "log"),
+                                        exclude_inherited=True),
+        })
+
+    def stop(self, timeout=SIMULATION_STOP_TIMEOUT):
+        """
+        Stop the simulation once it has finished starting and wait for its thread to end.
+
+        :param timeout: time to wait for each of the simulation to start and its thread to end (seconds)
+        """
+        if self._thread.ident is None:
+            return
+        # Stopping a simulation while it connects its interface breaks the connection, so wait until it has finished
+        # connecting, which it has by the first cycle
+        self._wait_until(lambda: self.simulation.cycles > 0 or self.simulation.is_paused, timeout)
+        if self.simulation.is_started:
+            self.simulation.stop()
+        self._thread.join(timeout)
+
+
+class DeviceHost(object):
+    """
+    Creates, runs and stops the Lewis simulations of devices, exposing each one on the control server.
+    """
+
+    def __init__(self, control_server):
+        """
+        :param control_server: the control server to expose the devices on
+        """
+        self._control_server = control_server
+        self._simulations = {}
+
+    def add_device(self, emulator_id, device, package, protocol, port, speed):
+        """
+        Create a device and start its simulation on a thread of its own, returning once the device is listening on its
+        port.
+
+        :param emulator_id: ID of the emulator, which its objects are exposed under
+        :param device: name of the device
+        :param package: package containing the device
+        :param protocol: protocol of the device interface to use
+        :param port: port for the device to listen on
+        :param speed: speed of the simulation
+        """
+        if emulator_id in self._simulations:
+            raise RuntimeError("An emulator with ID {} is already running".format(emulator_id))
+
+        simulation = DeviceSimulation(package, device, protocol, port, speed, emulator_id)
+        if not simulation.start():
+            simulation.stop()
+            raise RuntimeError("The simulation of {} did not start listening on port {}: {}".format(
+                emulator_id, port, simulation.error))
+
+        self._control_server.exposed_object.add_object(simulation.exposed_object(), emulator_id)
+        self._simulations[emulator_id] = simulation
+
+    def remove_device(self, emulator_id):
+        """
+        Stop the simulation of a device and stop exposing it.
+
+        :param emulator_id: ID of the emulator
+        """
+        simulation = self._simulations.pop(emulator_id)
+        self._control_server.exposed_object.remove_object(emulator_id)
+        simulation.stop()
+
+    def remove_all_devices(self):
+        for emulator_id in list(self._simulations):
+            self.remove_device(emulator_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the devices of several Lewis emulators in one process")
+    parser.add_argument("-r", "--rpc-host", required=True, help="host:port to run the control server on")
+    parser.add_argument("-a", "--add-path", default=None, help="path to add to the Python path to find devices")
+    arguments = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format=default_log_format)
+    if arguments.add_path is not None:
+        sys.path.append(os.path.abspath(arguments.add_path))
+
+    control_server = ControlServer({}, arguments.rpc_host)
+    host = DeviceHost(control_server)
+    control_server.exposed_object.add_object(
+        ExposedObject(host, members=("add_device", "remove_device")), HOST_OBJECT_NAME)
+    control_server.start_server()
+
+    try:
+        while True:
+            control_server.process(blocking=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        host.remove_all_devices()
+
+
+if __name__ == "__main__":
+    main()
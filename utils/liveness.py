@@ -0,0 +1,116 @@
+"""
+A circuit breaker for the tests of a module: the IOCs and emulators of the module are watched while its tests run, and
+once one of them has gone the remaining tests error straight away with the cause rather than each waiting out its
+timeouts.
+"""
+import threading
+
+from utils.emulator_launcher import EmulatorRegister
+from utils.ioc_launcher import IOCRegister
+
+# How often the IOCs and emulators of a module are checked while its tests run (seconds)
+LIVENESS_CHECK_INTERVAL = 3
+
+# Number of checks in a row in which an IOC's existence PV is not found after which the IOC is taken to have gone. This
+# is long enough for tests which restart an IOC in procServ on purpose.
+DEFAULT_CA_FAILURE_LIMIT = 20
+
+
+class DeviceGoneError(Exception):
+    """
+    An IOC or emulator of the module has gone, so the test can not be run.
+    """
+
+
+class LivenessWatcher(object):
+    """
+    Context manager which checks the IOCs and emulators of a module in a background thread. An IOC or emulator has gone
+    if its process has exited or, for an IOC, its existence PV has not been found in a given number of checks in a
+    row.
+    """
+
+    def __init__(self, iocs, interval=LIVENESS_CHECK_INTERVAL, ca_failure_limit=DEFAULT_CA_FAILURE_LIMIT):
+        """
+        Args:
+            iocs: the IOCS attribute of the test module; the launchers are looked up when the watcher is entered
+            interval: time between checks (seconds)
+            ca_failure_limit: number of failed existence PV checks in a row after which an IOC has gone; 0 to not
+                check over channel access
+        """
+        self._iocs = iocs
+        self._interval = interval
+        self._ca_failure_limit = ca_failure_limit
+        self._ca_failures = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.cause = None
+
+    def __enter__(self):
+        devices = []
+        for ioc in self._iocs:
+            emulator_id = ioc.get("emulator_id", ioc.get("emulator"))
+            devices.append((ioc["name"], IOCRegister.get_running(ioc["name"]),
+                            EmulatorRegister.get_running(emulator_id) if emulator_id is not None else None))
+        self._thread = threading.Thread(target=self._watch, args=(devices,), name="liveness watcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+
+    def _watch(self, devices):
+        while not self._stop.wait(self._interval):
+            for name, ioc_launcher, emulator_launcher in devices:
+                cause = self._check(name, ioc_launcher, emulator_launcher)
+                if cause is not None:
+                    self.cause = cause
+                    print("{}; the remaining tests of the module will not be run".format(cause))
+                    return
+
+    def _check(self, name, ioc_launcher, emulator_launcher):
+        """
+        Returns:
+            str: why the device has gone; None if it is still running
+        """
+        if emulator_launcher is not None and emulator_launcher.exit_code() is not None:
+            return "Emulator for {} exited with code {}".format(name, emulator_launcher.exit_code())
+        if ioc_launcher is None:
+            return None
+        if ioc_launcher.exit_code() is not None:
+            return "IOC {} exited with code {}".format(name, ioc_launcher.exit_code())
+        if self._ca_failure_limit > 0:
+            if ioc_launcher.is_responding():
+                self._ca_failures[name] = 0
+            else:
+                self._ca_failures[name] = self._ca_failures.get(name, 0) + 1
+                if self._ca_failures[name] >= self._ca_failure_limit:
+                    return "IOC {} has not responded over channel access in {} checks in a row".format(
+                        name, self._ca_failures[name])
+        return None
+
+
+def _raise_device_gone(cause):
+    def _device_gone():
+        raise DeviceGoneError(cause)
+    return _device_gone
+
+
+def short_circuiting(result_class, watcher):
+    """
+    Make a test result class whose tests error in setUp, without running, once the watcher has found that a device has
+    gone.
+
+    Args:
+        result_class: the test result class to extend
+        watcher (LivenessWatcher): the watcher of the module's devices
+    Returns:
+        the test result class
+    """
+    class _ShortCircuitingTestResult(result_class):
+        def startTest(self, test):
+            if watcher.cause is not None:
+                test.setUp = _raise_device_gone(watcher.cause)
+            super(_ShortCircuitingTestResult, self).startTest(test)
+
+    return _ShortCircuitingTestResult
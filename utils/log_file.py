@@ -1,10 +1,20 @@
+import codecs
 import os
-from time import sleep
 import threading
+import time
 
 # Directory for log files
 LOG_FILES_DIRECTORY = os.path.join("logs", "IOCTestFramework")
 
+# Number of characters of the most recent output of a process kept in memory for waiting on and checking
+LOG_BUFFER_SIZE = 1024 * 1024
+
+# How often a log file written by another process is checked for new output (seconds)
+LOG_FILE_POLL_INTERVAL = 0.005
+
+# How long to wait for the thread following the output to finish when the log is closed (seconds)
+LOG_TAILER_JOIN_TIMEOUT = 1
+
 
 def log_filename(test_name, what, device, uses_rec_sim, var_dir):
     """
@@ -32,11 +42,160 @@ def log_filename(test_name, what, device, uses_rec_sim, var_dir):
 class LogFileManager(object):
     """
     Class to manage the access of log files
+
+    Output is followed by a background thread, either from the process's output pipe, which it also writes to the log
+    file, or from the log file as another process writes it. The most recent output is kept in a bounded buffer which
+    readers take new lines from by position, and readers waiting for output are woken as soon as it arrives.
     """
 
-    def __init__(self, filename):
-        self.log_file = open(filename, "w+")
+    def __init__(self, filename, buffer_size=LOG_BUFFER_SIZE):
+        """
+        Args:
+            filename: path of the log file, which is created or truncated
+            buffer_size: number of characters of the most recent output to keep in memory
+        """
+        # IOC output is not always valid UTF-8, and may hold characters the locale's encoding can not write
+        self.log_file = open(filename, "w+", encoding="utf-8", errors="replace")
         self.reading_from = 0
+        self._filename = filename
+        self._buffer_size = buffer_size
+        self._buffer = ""
+        self._buffer_start = 0
+        self._output_ended = False
+        self._new_output = threading.Condition()
+        self._stop = threading.Event()
+        self._tailer = None
+
+    def write(self, text):
+        """
+        Write text of the test framework's own to the log file.
+
+        Args:
+            text: the text to write
+        """
+        with self._new_output:
+            self.log_file.write(text)
+            self.log_file.flush()
+
+    def follow(self, stream=None):
+        """
+        Start following the output in a background thread.
+
+        Args:
+            stream: the output pipe of the process, which is read and written to the log file; None to follow the log
+                file as another process writes it
+        """
+        if stream is None:
+            target, args = self._follow_file, ()
+        else:
+            target, args = self._follow_stream, (stream,)
+        self._tailer = threading.Thread(target=target, args=args, name="log tailer {}".format(self._filename),
+                                        daemon=True)
+        self._tailer.start()
+
+    def _follow_stream(self, stream):
+        # The pipe is read until the process closes it, even once the log file is closed or can not be written to, so
+        # that the process never blocks writing its output
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        read = getattr(stream, "read1", stream.read)
+        write_failed = False
+        try:
+            while True:
+                try:
+                    data = read(4096)
+                except (IOError, OSError, ValueError):
+                    break  # the pipe was closed
+                if not data:
+                    break
+                text = decoder.decode(data).replace("\r\n", "\n")
+                with self._new_output:
+                    if not self.log_file.closed and not write_failed:
+                        try:
+                            self.log_file.write(text)
+                            self.log_file.flush()
+                        except (IOError, OSError, ValueError) as e:
+                            write_failed = True
+                            print("Unable to write output to log file {}, it is no longer logged: {}".format(
+                                self._filename, e))
+                self._add_output(text)
+        finally:
+            with self._new_output:
+                self._output_ended = True
+                self._new_output.notify_all()
+
+    def _follow_file(self):
+        with open(self._filename, "r", encoding="utf-8", errors="replace") as log_file:
+            while not self._stop.is_set():
+                text = log_file.read()
+                if text:
+                    self._add_output(text)
+                else:
+                    self._stop.wait(LOG_FILE_POLL_INTERVAL)
+
+    def _add_output(self, text):
+        with self._new_output:
+            self._buffer += text
+            # Trim only when the buffer is well over size so that the whole buffer is not copied for every output
+            if len(self._buffer) > 2 * self._buffer_size:
+                trimmed = len(self._buffer) - self._buffer_size
+                self._buffer = self._buffer[trimmed:]
+                self._buffer_start += trimmed
+            self._new_output.notify_all()
+
+    def _output_since(self, position):
+        """
+        Must be called holding the lock of the new output condition.
+
+        Returns:
+            tuple: the buffered output after position (or after the start of the buffer if that has been dropped) and
+                the position it starts at
+        """
+        start = max(position, self._buffer_start)
+        return self._buffer[start - self._buffer_start:], start
+
+    @property
+    def output_ended(self):
+        """
+        Returns:
+            bool: True if the output being followed has ended, i.e. the process has closed its output pipe
+        """
+        with self._new_output:
+            return self._output_ended
+
+    def position(self):
+        """
+        Returns:
+            int: the position of the end of the output so far
+        """
+        with self._new_output:
+            return self._buffer_start + len(self._buffer)
+
+    def lines_since(self, position):
+        """
+        Args:
+            position: position to read from
+        Returns:
+            tuple: the complete lines of output after the position and the position after them
+        """
+        with self._new_output:
+            output, start = self._output_since(position)
+            end = len(output) if self._output_ended else output.rfind("\n") + 1
+        return output[:end].splitlines(True), start + end
+
+    def wait_for_output(self, position, timeout):
+        """
+        Wait until there is output after a position, or the output has ended.
+
+        Args:
+            position: position to wait for output after
+            timeout: time to wait for at most (seconds)
+        Returns:
+            bool: True if there is output after the position
+        """
+        with self._new_output:
+            self._new_output.wait_for(
+                lambda: self._buffer_start + len(self._buffer) > position or self._output_ended, timeout)
+            return self._buffer_start + len(self._buffer) > position
 
     def read_log(self):
         """
@@ -45,11 +204,37 @@ class LogFileManager(object):
         Returns:
             new_messages (list): list of any new messages that have been received
         """
-        self.log_file.seek(self.reading_from)
-        new_messages = list(self.log_file)
-        self.reading_from = self.log_file.tell()
+        new_messages, self.reading_from = self.lines_since(self.reading_from)
         return new_messages
 
+    def wait_for_text(self, text, timeout):
+        """
+        Wait for text to appear in the output after what has been read. The output is read up to the end of the line
+        the text is found in.
+
+        Args:
+            text: the text to wait for
+            timeout: time to wait for at most (seconds)
+        Returns:
+            bool: True if the text appeared; False if it did not appear in time or the output ended without it
+        """
+        deadline = time.monotonic() + timeout
+        searched_to = self.reading_from
+        with self._new_output:
+            while True:
+                output, start = self._output_since(self.reading_from)
+                index = output.find(text, max(searched_to - start, 0))
+                if index >= 0:
+                    line_end = output.find("\n", index)
+                    self.reading_from = start + (line_end + 1 if line_end >= 0 else len(output))
+                    return True
+                # The text may be split between this output and the next
+                searched_to = start + max(len(output) - len(text) + 1, 0)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._output_ended:
+                    return False
+                self._new_output.wait(remaining)
+
     def wait_for_console(self, timeout, ioc_started_text):
         """
         Waits until the ioc has started.
@@ -58,18 +243,7 @@ class LogFileManager(object):
             timeout (int): How long to wait before we assume the ioc has not started. (seconds)
             ioc_started_text (str): Text to look for in ioc log to indicate that the ioc has started
         """
-        for i in range(timeout):
-            new_messages = self.read_log()
-
-            # uncomment for extra diagnostics
-            # message_with_newline = [new_message.rstrip("\r\n") for new_message in new_messages]
-            # print("    {}s: '{}'".format(i, "'\n       '".join(message_with_newline)))
-
-            if any(ioc_started_text in line for line in new_messages):
-                break
-
-            sleep(1)
-        else:
+        if not self.wait_for_text(ioc_started_text, timeout):
             raise AssertionError("IOC appears not to have started after {} seconds. Looking for '{}'"
                                  .format(timeout, ioc_started_text))
 
@@ -77,4 +251,8 @@ class LogFileManager(object):
         """
         Returns: close the log file
         """
-        self.log_file.close()
+        self._stop.set()
+        if self._tailer is not None:
+            self._tailer.join(LOG_TAILER_JOIN_TIMEOUT)
+        with self._new_output:
+            self.log_file.close()
@@ -0,0 +1,210 @@
+"""
+A manifest of the test modules in a package, read from their source with ast so that no test module is imported.
+
+For each module the manifest holds its TEST_MODES and each entry in IOCS, so that runs can be planned without importing
+the test modules. Values which are not literals (or names bound to literals at module level) are given as their source
+text, and the keys of each IOC with such values are listed so that they are not taken for the values the module would
+have when imported; anything which can not be worked out statically is None. The manifest is cached in the package's __pycache__ directory and
+a module is only parsed again when its modification time and contents have changed.
+"""
+import ast
+import hashlib
+import json
+import os
+
+# Name of the manifest cache file, in the __pycache__ directory of the tests package
+MANIFEST_CACHE_FILE_NAME = "ioc_test_manifest.json"
+
+# Version of the manifest format; cached entries of another version are ignored
+MANIFEST_VERSION = 2
+
+
+class _NotLiteral(object):
+    """
+    A value which is not a literal, represented by its source text.
+    """
+    def __init__(self, node):
+        self.source = ast.unparse(node)
+
+
+def _evaluate(node, names):
+    """
+    Evaluate an expression as far as can be done without running it.
+
+    Args:
+        node: the expression node
+        names: dictionary of module level names to their values
+    Returns:
+        the value of the expression, with parts which are not literals replaced by _NotLiteral
+    """
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_evaluate(element, names) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        result = {}
+        for key, value in zip(node.keys, node.values):
+            key = _evaluate(key, names) if key is not None else None
+            if isinstance(key, str):
+                result[key] = _evaluate(value, names)
+        return result
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "TestModes":
+        return node.attr
+    return _NotLiteral(node)
+
+
+def _as_text(value):
+    """
+    Args:
+        value: an evaluated value
+    Returns:
+        the value if it is a string; the source text if it is not a literal; otherwise None
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, _NotLiteral):
+        return value.source
+    return None
+
+
+def _as_json(value):
+    """
+    Args:
+        value: an evaluated value
+    Returns:
+        the value with the parts which are not literals replaced by their source text, and constants which JSON can not
+            hold (e.g. bytes) by their repr
+    """
+    if isinstance(value, list):
+        return [_as_json(element) for element in value]
+    if isinstance(value, dict):
+        return {key: _as_json(element) for key, element in value.items()}
+    if isinstance(value, _NotLiteral):
+        return value.source
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def _is_literal(value):
+    """
+    Args:
+        value: an evaluated value
+    Returns:
+        True if no part of the value is replaced by its source text in the manifest
+    """
+    if isinstance(value, list):
+        return all(_is_literal(element) for element in value)
+    if isinstance(value, dict):
+        return all(_is_literal(element) for element in value.values())
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def parse_module(source):
+    """
+    Read the test modes and IOCs of a test module from its source.
+
+    Args:
+        source: the source of the module
+    Returns:
+        dict: test_modes, a list of mode names (e.g. "DEVSIM") or None if they could not be read; iocs, a list of the
+            dictionaries in IOCS, each with at least name, directory and emulator, or None if they could not be read;
+            and unresolved_ioc_keys, a list of the keys of each IOC whose values are given as source text
+    """
+    names = {}
+    for statement in ast.parse(source).body:
+        if isinstance(statement, ast.Assign):
+            value = _evaluate(statement.value, names)
+            for target in statement.targets:
+                if isinstance(target, ast.Name):
+                    names[target.id] = value
+        elif isinstance(statement, ast.AnnAssign) and statement.value is not None \
+                and isinstance(statement.target, ast.Name):
+            names[statement.target.id] = _evaluate(statement.value, names)
+
+    test_modes = names.get("TEST_MODES")
+    if not isinstance(test_modes, list) or not all(isinstance(mode, str) for mode in test_modes):
+        test_modes = None
+
+    iocs = names.get("IOCS")
+    if isinstance(iocs, list) and all(isinstance(ioc, dict) for ioc in iocs):
+        unresolved_ioc_keys = [sorted(key for key, value in ioc.items() if not _is_literal(value)) for ioc in iocs]
+        entries = []
+        for ioc in iocs:
+            entry = {key: _as_json(value) for key, value in ioc.items()}
+            entry.update({key: _as_text(ioc.get(key)) for key in ("name", "directory", "emulator")})
+            entries.append(entry)
+        iocs = entries
+    else:
+        iocs = None
+        unresolved_ioc_keys = None
+
+    return {"test_modes": test_modes, "iocs": iocs, "unresolved_ioc_keys": unresolved_ioc_keys}
+
+
+def _file_hash(path):
+    with open(path, "rb") as module_file:
+        return hashlib.sha1(module_file.read()).hexdigest()
+
+
+def build_manifest(package_directory):
+    """
+    Build the manifest of the test modules in a package, reusing cached entries of modules which have not changed.
+
+    Args:
+        package_directory: directory of the tests package
+    Returns:
+        dict: module name to its manifest entry (see parse_module); the entry has an error instead if the module
+            could not be parsed
+    """
+    cache_path = os.path.join(package_directory, "__pycache__", MANIFEST_CACHE_FILE_NAME)
+    try:
+        with open(cache_path) as cache_file:
+            cache = json.load(cache_file)
+        if cache.get("version") != MANIFEST_VERSION:
+            cache = {}
+    except (IOError, ValueError):
+        cache = {}
+    cached_modules = cache.get("modules", {})
+
+    modules = {}
+    changed = set(cached_modules) != {os.path.splitext(file_name)[0] for file_name in os.listdir(package_directory)
+                                      if file_name.endswith(".py") and not file_name.startswith("__init__")}
+    for file_name in sorted(os.listdir(package_directory)):
+        if not file_name.endswith(".py") or file_name.startswith("__init__"):
+            continue
+        module_name = os.path.splitext(file_name)[0]
+        path = os.path.join(package_directory, file_name)
+        mtime = os.path.getmtime(path)
+        cached = cached_modules.get(module_name)
+        if cached is not None and cached["mtime"] == mtime:
+            modules[module_name] = cached
+            continue
+
+        file_hash = _file_hash(path)
+        if cached is not None and cached["hash"] == file_hash:
+            cached["mtime"] = mtime
+            modules[module_name] = cached
+            changed = True
+            continue
+
+        try:
+            with open(path, "rb") as module_file:
+                entry = parse_module(module_file.read())
+        except (SyntaxError, ValueError) as e:
+            entry = {"error": "Unable to parse {}: {}".format(path, e)}
+        entry.update({"mtime": mtime, "hash": file_hash})
+        modules[module_name] = entry
+        changed = True
+
+    if changed:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(cache_path, "w") as cache_file:
+                json.dump({"version": MANIFEST_VERSION, "modules": modules}, cache_file, indent=1, sort_keys=True)
+        except (IOError, OSError) as e:
+            print("Unable to write test manifest cache {}: {}".format(cache_path, e))
+
+    return modules
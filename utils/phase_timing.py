@@ -0,0 +1,151 @@
+"""
+Timing of the phases of running a test module: starting emulators and IOCs, setting up, running and tearing down each
+test and stopping the IOCs and emulators again.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from xmlrunner.result import _XMLTestResult
+
+# Name of the phase timing report, written to the reports directory
+PHASE_REPORT_FILE_NAME = "phase_timings.json"
+
+_phases_lock = threading.Lock()
+_phases = []
+
+# List to record phases in instead of the phases of the run; set by collecting_phases
+_phase_collector = contextvars.ContextVar("phase_collector", default=None)
+
+
+@contextmanager
+def timed_phase(phase, subject):
+    """
+    Context manager which records how long its body took as a phase.
+
+    Args:
+        phase: name of the phase, e.g. "IOC wait for console"
+        subject: what the phase was for, e.g. the IOC name or test id
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        collector = _phase_collector.get()
+        with _phases_lock:
+            (_phases if collector is None else collector).append(
+                {"phase": phase, "subject": subject, "seconds": time.monotonic() - start})
+
+
+@contextmanager
+def collecting_phases(phases):
+    """
+    Context manager which records the phases timed in its body in a list of its own rather than in the phases of the
+    run, so that the phases of a job which are timed while another job runs are not taken as that job's. Threads only
+    record into the list if they are run in a copy of the context (contextvars.copy_context).
+
+    Args:
+        phases: list to add the phases to
+    """
+    token = _phase_collector.set(phases)
+    try:
+        yield
+    finally:
+        _phase_collector.reset(token)
+
+
+def record_phases(phases):
+    """
+    Add phases collected apart (see collecting_phases) to the phases of the run.
+
+    Args:
+        phases: list of phases, as dictionaries of phase, subject and seconds
+    """
+    with _phases_lock:
+        _phases.extend(phases)
+
+
+def take_phases():
+    """
+    Returns:
+        list: the phases recorded since this was last called, as dictionaries of phase, subject and seconds
+    """
+    global _phases
+    with _phases_lock:
+        phases, _phases = _phases, []
+    return phases
+
+
+def _timed_method(method, phase, subject):
+    @functools.wraps(method)
+    def _wrapper(*args, **kwargs):
+        with timed_phase(phase, subject):
+            return method(*args, **kwargs)
+    return _wrapper
+
+
+class PhaseTimingTestResult(_XMLTestResult):
+    """
+    XML test result which times the setUp, test method and tearDown of each test as separate phases and writes the
+    phases recorded before the report is generated (so not those of stopping the IOCs and emulators) into the report
+    as properties of the test suite, in seconds.
+    """
+
+    def startTest(self, test):
+        # TestCase.run looks these up on the instance, so wrapping them there times each call
+        test_id = test.id()
+        test.setUp = _timed_method(test.setUp, "setUp", test_id)
+        test.tearDown = _timed_method(test.tearDown, "tearDown", test_id)
+        method_name = getattr(test, "_testMethodName", None)
+        if method_name is not None and hasattr(test, method_name):
+            setattr(test, method_name, _timed_method(getattr(test, method_name), "test", test_id))
+        super(PhaseTimingTestResult, self).startTest(test)
+
+    def generate_reports(self, test_runner):
+        with _phases_lock:
+            phases = list(_phases)
+        self.properties = self.properties or {}
+        for phase in phases:
+            self.properties["phase {} {}".format(phase["phase"], phase["subject"])] = "{:.3f}".format(phase["seconds"])
+        super(PhaseTimingTestResult, self).generate_reports(test_runner)
+
+
+def write_phase_report(job_phases, report_directory):
+    """
+    Write the phases of every job in the run to a JSON report.
+
+    Args:
+        job_phases: dictionary of job name to the list of phases recorded while running it
+        report_directory: directory to write the report to
+    Returns:
+        str: path of the report
+    """
+    if not os.path.isdir(report_directory):
+        os.makedirs(report_directory)
+    path = os.path.join(report_directory, PHASE_REPORT_FILE_NAME)
+    with open(path, "w") as report_file:
+        json.dump(job_phases, report_file, indent=1, sort_keys=True)
+    return path
+
+
+def print_slowest_phases(job_phases, number_of_phases=20):
+    """
+    Print a table of the phases which took longest in the run.
+
+    Args:
+        job_phases: dictionary of job name to the list of phases recorded while running it
+        number_of_phases: number of phases to print
+    """
+    phases = [(phase["seconds"], job, phase["phase"], phase["subject"])
+              for job, phases_of_job in job_phases.items() for phase in phases_of_job]
+    if not phases:
+        return
+    phases.sort(reverse=True)
+    print("Slowest {} phases of the run:".format(min(number_of_phases, len(phases))))
+    print("{:>10}  {:<30}  {:<22}  {}".format("Seconds", "Job", "Phase", "Subject"))
+    for seconds, job, phase, subject in phases[:number_of_phases]:
+        print("{:>10.3f}  {:<30}  {:<22}  {}".format(seconds, job, phase, subject))
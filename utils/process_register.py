@@ -0,0 +1,207 @@
+"""
+A register of the processes launched for the tests (IOCs, procServ, Lewis and command line emulators), so that they can
+be stopped by waiting on them rather than by polling or fixed sleeps, and so that any still running when the test run
+exits are stopped.
+"""
+import atexit
+import os
+import signal
+import subprocess
+import threading
+
+import psutil
+
+# Time to wait for processes to exit after asking them to terminate before killing them (seconds)
+TERMINATE_TIMEOUT = 5
+
+# Time to wait for processes to exit after killing them (seconds)
+KILL_TIMEOUT = 5
+
+
+def process_creation_options():
+    """
+    Returns:
+        dict: keyword arguments for subprocess.Popen which start a process in a console or process group of its own, so
+            it can be stopped together with the processes it starts
+    """
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_CONSOLE}
+    return {"start_new_session": True}
+
+
+def _leads_process_group(pid):
+    """
+    :return: True if the process leads a process group of its own (always False on Windows)
+    """
+    try:
+        return os.name == "posix" and os.getpgid(pid) == pid
+    except OSError:
+        return False
+
+
+def _signal(process, kill):
+    try:
+        if kill:
+            process.kill()
+        else:
+            process.terminate()
+    except psutil.NoSuchProcess:
+        pass
+
+
+def _signal_group(group_id, kill):
+    try:
+        os.killpg(group_id, signal.SIGKILL if kill else signal.SIGTERM)
+    except OSError:
+        pass  # every process in the group has exited
+
+
+class DaemonProcess(object):
+    """
+    A process which runs itself in the background, e.g. procServ without --foreground, so the process which was launched
+    starts it and exits. It has the poll method of subprocess.Popen so that it can be watched in the same way as a
+    process which stays in the foreground.
+    """
+
+    # Exit code given once the background process has exited, as its own is only known to its parent
+    EXITED_CODE = 1
+
+    def __init__(self, launched_process, find_pid):
+        """
+        :param launched_process: the subprocess.Popen of the process which was launched
+        :param find_pid: function returning the process id of the background process, e.g. from its pid file; None if
+            it is not running
+        """
+        self._launched_process = launched_process
+        self._find_pid = find_pid
+        self._process = None
+
+    @property
+    def pid(self):
+        """
+        :return: process id of the background process; None if it has not been found
+        """
+        return self._process.pid if self._process is not None else None
+
+    def poll(self):
+        """
+        :return: None while the launched process or the background process is running; the exit code of the launched
+            process if it failed; EXITED_CODE once the background process has exited
+        """
+        if self._process is None:
+            exit_code = self._launched_process.poll()
+            if exit_code is None:
+                return None
+            if exit_code != 0:
+                return exit_code
+            pid = self._find_pid()
+            if pid is None:
+                return None  # the background process has not written its pid file yet
+            try:
+                self._process = psutil.Process(pid)
+            except psutil.NoSuchProcess:
+                return self.EXITED_CODE
+
+        try:
+            if self._process.is_running() and self._process.status() != psutil.STATUS_ZOMBIE:
+                return None
+        except psutil.NoSuchProcess:
+            pass
+        return self.EXITED_CODE
+
+
+class ProcessRegister(object):
+    """
+    A way of registering launched processes.
+    """
+
+    # Static dictionary of pid to (description, psutil.Process, whether it leads its own process group) of the
+    # registered processes
+    RegisteredProcesses = {}
+
+    _lock = threading.Lock()
+
+    @classmethod
+    def add_process(cls, pid, description):
+        """
+        Register a launched process.
+
+        :param pid: process id of the process
+        :param description: what the process is, for messages, e.g. "Lewis (chtobisr)"
+        """
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return
+        with cls._lock:
+            cls.RegisteredProcesses[pid] = (description, process, _leads_process_group(pid))
+
+    @classmethod
+    def remove_process(cls, pid):
+        """
+        Unregister a process without stopping it, e.g. one which has finished and may have left processes running on
+        purpose.
+
+        :param pid: process id of the process
+        """
+        with cls._lock:
+            cls.RegisteredProcesses.pop(pid, None)
+
+    @classmethod
+    def stop(cls, pids, terminate_timeout=TERMINATE_TIMEOUT, kill_timeout=KILL_TIMEOUT):
+        """
+        Stop registered processes, with the processes they started, and unregister them. The processes are asked to
+        terminate, then killed if they are still running after the terminate timeout. Returns as soon as they have all
+        exited.
+
+        :param pids: process ids of the processes to stop; ids which are not registered are ignored
+        :param terminate_timeout: time to wait for the processes to exit after asking them to terminate
+        :param kill_timeout: time to wait for the processes to exit after killing them
+        :return: descriptions of the processes which were still running after being killed
+        """
+        with cls._lock:
+            registered = [cls.RegisteredProcesses.pop(pid) for pid in pids if pid in cls.RegisteredProcesses]
+        if not registered:
+            return []
+
+        processes = []
+        groups = []
+        for _, process, leads_group in registered:
+            processes.append(process)
+            try:
+                processes.extend(process.children(recursive=True))
+            except psutil.NoSuchProcess:
+                pass
+            if leads_group:
+                # The group is signalled even if its leader has exited, to reach processes it left behind
+                groups.append(process.pid)
+
+        for kill, timeout in ((False, terminate_timeout), (True, kill_timeout)):
+            for group_id in groups:
+                _signal_group(group_id, kill)
+            for process in processes:
+                _signal(process, kill)
+            _, processes = psutil.wait_procs(processes, timeout=timeout)
+            if not processes:
+                break
+
+        alive_pids = {process.pid for process in processes}
+        still_running = [description for description, process, _ in registered if process.pid in alive_pids]
+        for description in still_running:
+            print("{} is still running after being killed".format(description))
+        return still_running
+
+    @classmethod
+    def stop_all(cls):
+        """
+        Stop every registered process which is still running.
+        """
+        with cls._lock:
+            pids = list(cls.RegisteredProcesses)
+            descriptions = [description for description, _, _ in cls.RegisteredProcesses.values()]
+        if pids:
+            print("Stopping processes left running: {}".format(", ".join(descriptions)))
+            cls.stop(pids)
+
+
+atexit.register(ProcessRegister.stop_all)
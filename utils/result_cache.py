@@ -0,0 +1,348 @@
+"""
+A cache of the reports of test jobs which passed, keyed on a hash of everything the job depends on, so that a job whose
+inputs have not changed since it last passed need not be run again.
+
+The inputs of a job are the test module, the common_tests and utils modules it imports (and those they import), the
+files under test_config and test_data that it names, the tree of each IOC it launches (the directory above iocBoot,
+which holds the db, proto and st.cmd files and the built IOC) and the package of each Lewis emulator it launches.
+"""
+import ast
+import datetime
+import hashlib
+import json
+import os
+import shutil
+from xml.dom import minidom
+
+from utils.emulator_launcher import DEVICE_EMULATOR_PATH
+
+# Name of the directory in the var dir that cached reports are kept in
+RESULT_CACHE_DIRECTORY_NAME = "ioc_test_result_cache"
+
+# Packages in this repository whose modules are inputs of the tests that import them
+LOCAL_PACKAGES = ["common_tests", "utils"]
+
+# Directories in this repository whose files are inputs of the tests that name them
+DATA_DIRECTORIES = ["test_config", "test_data"]
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _module_path(dotted_name):
+    """
+    Args:
+        dotted_name: dotted name of a module in this repository
+    Returns:
+        the path of the module's file; None if it is not a module in this repository
+    """
+    path = os.path.join(REPOSITORY_ROOT, *dotted_name.split("."))
+    for candidate in (path + ".py", os.path.join(path, "__init__.py")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _local_imports(tree):
+    """
+    Args:
+        tree: parsed module
+    Returns:
+        set: paths of the modules in the local packages which the module imports
+    """
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module is not None and node.level == 0:
+            names.add(node.module)
+            # "from package import module" imports a module as well as names
+            names.update("{}.{}".format(node.module, alias.name) for alias in node.names)
+    paths = {_module_path(name) for name in names if name.split(".")[0] in LOCAL_PACKAGES}
+    paths.discard(None)
+    return paths
+
+
+def _data_paths(tree):
+    """
+    Find the paths under the data directories that a module names, either as a path in one string or as consecutive
+    string arguments of a call such as os.path.join.
+
+    Args:
+        tree: parsed module
+    Returns:
+        set: the longest existing path named for each reference to a data directory
+    """
+    references = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            parts = [arg.value if isinstance(arg, ast.Constant) and isinstance(arg.value, str) else None
+                     for arg in node.args]
+            for index, part in enumerate(parts):
+                if part in DATA_DIRECTORIES:
+                    reference = []
+                    for following in parts[index:]:
+                        if following is None:
+                            break
+                        reference.append(following)
+                    references.append(reference)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            parts = node.value.replace("\\", "/").split("/")
+            if parts[0] in DATA_DIRECTORIES and len(parts) > 1:
+                references.append(parts)
+
+    paths = set()
+    for reference in references:
+        for length in range(len(reference), 0, -1):
+            path = os.path.join(REPOSITORY_ROOT, *reference[:length])
+            if os.path.exists(path):
+                paths.add(path)
+                break
+    return paths
+
+
+def _ioc_top(directory):
+    """
+    Args:
+        directory: the directory of an IOC's st.cmd
+    Returns:
+        the top directory of the IOC (above iocBoot); the directory itself if it is not in an iocBoot directory
+    """
+    parts = os.path.normpath(directory).split(os.sep)
+    if "iocBoot" in parts:
+        return os.sep.join(parts[:parts.index("iocBoot")])
+    return directory
+
+
+def _files_in(path):
+    """
+    Args:
+        path: a file or directory
+    Returns:
+        list: the path if it is a file, otherwise the files in the tree below it, leaving out build and git directories
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for root, directories, file_names in os.walk(path):
+        directories[:] = sorted(directory for directory in directories
+                                if not directory.startswith("O.") and directory not in (".git", "__pycache__"))
+        files.extend(os.path.join(root, file_name) for file_name in sorted(file_names))
+    return files
+
+
+def job_inputs(module_path, iocs):
+    """
+    Find the files a test job depends on.
+
+    Args:
+        module_path: path of the test module
+        iocs: the IOCS attribute of the test module
+    Returns:
+        list: sorted paths of the input files
+    """
+    sources = set()
+    data_paths = set()
+    to_parse = [module_path]
+    while to_parse:
+        path = to_parse.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        with open(path, "rb") as source_file:
+            tree = ast.parse(source_file.read())
+        to_parse.extend(_local_imports(tree) - sources)
+        data_paths.update(_data_paths(tree))
+
+    trees = set(data_paths)
+    for ioc in iocs:
+        trees.add(_ioc_top(ioc["directory"]))
+        if "emulator" in ioc:
+            trees.add(os.path.join(ioc.get("lewis_additional_path", DEVICE_EMULATOR_PATH),
+                                   ioc.get("lewis_package", "lewis_emulators"), ioc["emulator"]))
+
+    files = set(sources)
+    for tree in trees:
+        if os.path.exists(tree):
+            files.update(_files_in(tree))
+    return sorted(files)
+
+
+def _mark_as_cached(report_path, run_time):
+    """
+    Mark each test suite in a JUnit XML report as a result reused from an earlier run.
+
+    Args:
+        report_path: path of the report
+        run_time: when the tests in the report were run
+    """
+    document = minidom.parse(report_path)
+    for testsuite in document.getElementsByTagName("testsuite"):
+        testsuite.setAttribute("name", "{} (cached)".format(testsuite.getAttribute("name")))
+        properties = testsuite.getElementsByTagName("properties")
+        if properties:
+            properties = properties[0]
+        else:
+            properties = document.createElement("properties")
+            testsuite.insertBefore(properties, testsuite.firstChild)
+        cached_property = document.createElement("property")
+        cached_property.setAttribute("name", "cached_result_of_run_at")
+        cached_property.setAttribute("value", run_time)
+        properties.appendChild(cached_property)
+    with open(report_path, "wb") as report_file:
+        report_file.write(document.toxml(encoding="UTF-8"))
+
+
+class ResultCache(object):
+    """
+    Reports of jobs which passed, stored under the var dir with the hash of the job's inputs.
+
+    The hash of each input file is kept with its size and modification time so that unchanged files are not read
+    again.
+    """
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory: directory to keep the cache in
+        """
+        self._directory = directory
+        self._file_hashes_path = os.path.join(directory, "file_hashes.json")
+        try:
+            with open(self._file_hashes_path) as file_hashes:
+                self._file_hashes = json.load(file_hashes)
+        except (IOError, ValueError):
+            self._file_hashes = {}
+        # Input files of each job whose inputs were hashed, to store with its reports
+        self._job_inputs = {}
+
+    def _file_hash(self, path):
+        stat = os.stat(path)
+        cached = self._file_hashes.get(path)
+        if cached is not None and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime:
+            return cached["hash"]
+        file_hash = hashlib.sha1()
+        with open(path, "rb") as input_file:
+            for block in iter(lambda: input_file.read(1024 * 1024), b""):
+                file_hash.update(block)
+        self._file_hashes[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": file_hash.hexdigest()}
+        return file_hash.hexdigest()
+
+    def inputs_hash(self, key, module_path, iocs):
+        """
+        Args:
+            key: key of the job, including its mode and the tests it runs
+            module_path: path of the test module
+            iocs: the IOCS attribute of the test module
+        Returns:
+            str: hash of the job key and the names and contents of the job's input files
+        """
+        paths = job_inputs(module_path, iocs)
+        self._job_inputs[key] = paths
+        return self._hash_inputs(key, paths)
+
+    def _hash_inputs(self, key, paths):
+        inputs_hash = hashlib.sha1(key.encode("utf-8"))
+        for path in paths:
+            inputs_hash.update(os.path.relpath(path, REPOSITORY_ROOT).encode("utf-8"))
+            inputs_hash.update(self._file_hash(path).encode("utf-8"))
+        return inputs_hash.hexdigest()
+
+    def _entry_directory(self, key):
+        return os.path.join(self._directory, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+    def _entry(self, key, inputs_hash):
+        """
+        Returns:
+            dict: the cache entry of the job if it passed when its inputs were the same; None otherwise
+        """
+        try:
+            with open(os.path.join(self._entry_directory(key), "entry.json")) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, ValueError):
+            return None
+        if entry.get("key") != key or entry.get("inputs_hash") != inputs_hash:
+            return None
+        return entry
+
+    def holds(self, key, inputs_hash):
+        """
+        Args:
+            key: key of the job
+            inputs_hash: hash of the job's inputs now
+        Returns:
+            bool: True if the job passed when its inputs were the same, so its reports would be restored
+        """
+        return self._entry(key, inputs_hash) is not None
+
+    def holds_unchanged(self, key):
+        """
+        Check whether a job is likely to be restored rather than run, without importing its module: whether it passed
+        when the input files it had then were as they are now. Files added to its IOC and emulator trees since are not
+        noticed, so this is only for planning a run; use holds to decide whether to run the job.
+
+        Args:
+            key: key of the job
+        Returns:
+            bool: True if the job passed when the files it depended on then were the same as they are now
+        """
+        try:
+            with open(os.path.join(self._entry_directory(key), "entry.json")) as entry_file:
+                entry = json.load(entry_file)
+            return entry.get("key") == key and entry.get("inputs") is not None \
+                and entry["inputs_hash"] == self._hash_inputs(key, entry["inputs"])
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+
+    def restore(self, key, inputs_hash, report_directory):
+        """
+        Copy the cached reports of a job into a report directory if the job passed when its inputs were the same.
+
+        Args:
+            key: key of the job
+            inputs_hash: hash of the job's inputs now
+            report_directory: directory to copy the reports to
+        Returns:
+            bool: True if cached reports were copied; False if the job needs to be run
+        """
+        entry = self._entry(key, inputs_hash)
+        if entry is None:
+            return False
+
+        entry_directory = self._entry_directory(key)
+        if not os.path.isdir(report_directory):
+            os.makedirs(report_directory)
+        for report in entry["reports"]:
+            target = os.path.join(report_directory, report)
+            shutil.copyfile(os.path.join(entry_directory, report), target)
+            _mark_as_cached(target, entry["run_time"])
+        return True
+
+    def store(self, key, inputs_hash, report_directory):
+        """
+        Store the reports of a job which passed.
+
+        Args:
+            key: key of the job
+            inputs_hash: hash of the job's inputs when it was run
+            report_directory: directory holding only the job's reports
+        """
+        entry_directory = self._entry_directory(key)
+        shutil.rmtree(entry_directory, ignore_errors=True)
+        os.makedirs(entry_directory)
+        reports = [report for report in os.listdir(report_directory) if report.endswith(".xml")]
+        for report in reports:
+            shutil.copyfile(os.path.join(report_directory, report), os.path.join(entry_directory, report))
+        with open(os.path.join(entry_directory, "entry.json"), "w") as entry_file:
+            json.dump({"key": key, "inputs_hash": inputs_hash, "inputs": self._job_inputs.get(key), "reports": reports,
+                       "run_time": datetime.datetime.now().isoformat()}, entry_file, indent=1)
+
+    def save(self):
+        """
+        Save the hashes of the input files, replacing the file in one step as other processes may be saving too.
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+        temporary_path = "{}.{}".format(self._file_hashes_path, os.getpid())
+        with open(temporary_path, "w") as file_hashes:
+            json.dump(self._file_hashes, file_hashes)
+        os.replace(temporary_path, self._file_hashes_path)
@@ -0,0 +1,53 @@
+"""
+Splitting test jobs between several agents (shards) so that each runs part of the suite.
+
+Every shard works out the split for itself, so the split only depends on the jobs and the timings it is given.
+"""
+import zlib
+
+
+def parse_shard(shard):
+    """
+    Parse a shard given as "i/n", meaning the i-th of n shards counting from 1.
+
+    Args:
+        shard: the shard text
+    Returns:
+        tuple: the shard index and the number of shards
+    Raises:
+        ValueError: if the text is not of the form i/n with 1 <= i <= n
+    """
+    try:
+        index, count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError("Shard must be given as i/n, e.g. 1/4, not '{}'".format(shard))
+    if not 1 <= index <= count:
+        raise ValueError("Shard index must be between 1 and the number of shards, not '{}'".format(shard))
+    return index, count
+
+
+def assign_shards(job_keys, shard_count, durations=None):
+    """
+    Assign jobs to shards.
+
+    With durations the jobs are balanced by time: longest first, each job goes to the shard with the least time
+    assigned so far. Without them each job goes to the shard given by a hash of its key, which does not depend on the
+    other jobs, so adding a module only moves that module.
+
+    Args:
+        job_keys: keys of the jobs
+        shard_count: number of shards
+        durations: dictionary of job key to expected duration; None to assign by hash
+    Returns:
+        dict: job key to the shard it is assigned to, counting from 1
+    """
+    if durations is None:
+        return {key: zlib.crc32(key.encode("utf-8")) % shard_count + 1 for key in job_keys}
+
+    shard_totals = [0.0] * shard_count
+    shards = {}
+    for key in sorted(job_keys, key=lambda job_key: (-durations[job_key], job_key)):
+        shard = min(range(shard_count), key=lambda index: (shard_totals[index], index))
+        shard_totals[shard] += durations[key]
+        shards[key] = shard + 1
+    return shards
@@ -1,6 +1,6 @@
 import functools
 import unittest
-from time import sleep
+from time import sleep, monotonic
 
 import six
 
@@ -52,16 +52,35 @@ class _AssertLogContext(object):
         self.log_manager.read_log()  # Read any excess log
         return self
 
-    def __exit__(self, *args):
-        sleep(self.in_time)
-        self.messages = self.log_manager.read_log()
-
+    def _filter(self, messages):
         if self.ignore_log_client_failures:
-            self.messages = [message for message in self.messages if "log client: " not in message]
+            messages = [message for message in messages if "log client: " not in message]
 
         if self.ignore_autosave:
-            self.messages = [
-                message for message in self.messages if "autosave" not in message and "save_restore" not in message]
+            messages = [message for message in messages if "autosave" not in message and "save_restore" not in message]
+
+        return messages
+
+    def _has_answer(self):
+        """
+        Returns:
+            bool: True if the messages so far decide the assertion, so there is no need to wait for more
+        """
+        if self.exp_num_of_messages is not None:
+            # Passing depends on no more messages arriving, so only failing is decided early
+            return len(self.messages) > self.exp_num_of_messages
+        return self.must_contain is not None and any(self.must_contain in message for message in self.messages)
+
+    def __exit__(self, *args):
+        deadline = monotonic() + self.in_time
+        self.messages = []
+        while True:
+            seen_to = self.log_manager.position()
+            self.messages.extend(self._filter(self.log_manager.read_log()))
+            remaining = deadline - monotonic()
+            if self._has_answer() or remaining <= 0:
+                break
+            self.log_manager.wait_for_output(seen_to, remaining)
 
         actual_num_of_messages = len(self.messages)
 
@@ -118,7 +137,9 @@ def assert_log_messages(ioc, number_of_messages=None, in_time=1, must_contain=No
     Args:
         ioc (IocLauncher): The IOC that we are checking the logs for.
         number_of_messages (int): The maximum number of messages that are expected (None to not check number of messages)
-        in_time (int): The number of seconds to wait for messages
+        in_time (int): The number of seconds to wait for messages at most. The assertion fails as soon as there are
+            more than number_of_messages messages, and passes as soon as the must_contain string appears if the number
+            of messages is not checked; otherwise it waits the whole time.
         must_contain (str): a string which must be contained in at least one of the messages (None to not check)
         ignore_log_client_failures (bool): Whether to ignore messages about not being able to connect to logserver
         ignore_autosave (bool): Whether to ignore messages coming from autosave
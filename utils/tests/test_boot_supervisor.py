@@ -0,0 +1,110 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from time import monotonic
+from hamcrest import assert_that, is_, equal_to, calling, raises, less_than
+import psutil
+from ..boot_supervisor import wait_for_boot, BootTimes, IocBootError, MINIMUM_BOOT_TIMEOUT
+from ..log_file import LogFileManager
+from ..process_register import DaemonProcess
+
+_BACKGROUND_IOC = ("import sys, time; time.sleep(0.5); log = open(sys.argv[1], 'a'); log.write('iocInit\\nepics> '); "
+                   "log.flush(); time.sleep(60)")
+
+# Starts an IOC in the background which writes its output to a log file and its process id to a pid file, then exits,
+# as procServ does
+_STARTS_IOC_IN_BACKGROUND = ("import subprocess, sys; "
+                             "ioc = subprocess.Popen([sys.executable, '-c', {!r}, sys.argv[1]], "
+                             "start_new_session=True); "
+                             "open(sys.argv[2], 'w').write(str(ioc.pid))").format(_BACKGROUND_IOC)
+
+
+def _read_pid(path):
+    try:
+        with open(path) as pid_file:
+            return int(pid_file.read())
+    except (IOError, ValueError):
+        return None
+
+
+class BootSupervisorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file_manager = LogFileManager(os.path.join(self.directory, "ioc.log"))
+
+    def tearDown(self):
+        self.log_file_manager.close()
+        shutil.rmtree(self.directory)
+
+    def _start_ioc(self, script):
+        process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.log_file_manager.follow(process.stdout)
+        return process
+
+    def test_that_GIVEN_an_ioc_which_boots_THEN_waiting_for_boot_returns(self):
+        process = self._start_ioc("import sys; sys.stdout.write('iocInit\\nepics> '); sys.stdout.flush(); input()")
+
+        wait_for_boot(self.log_file_manager, process, "epics>", 10)
+
+        process.kill()
+
+    def test_that_GIVEN_an_ioc_which_exits_THEN_boot_fails_before_the_timeout(self):
+        process = self._start_ioc("import sys; sys.exit(3)")
+        start = monotonic()
+
+        assert_that(calling(wait_for_boot).with_args(self.log_file_manager, process, "epics>", 60),
+                    raises(IocBootError, "exited"))
+        assert_that(monotonic() - start, is_(less_than(10)))
+
+    def test_that_GIVEN_a_fatal_error_in_the_output_THEN_boot_fails_before_the_timeout(self):
+        process = self._start_ioc("import time; print(\"Can't open st.cmd: No such file or directory\", flush=True); "
+                                  "time.sleep(60)")
+
+        assert_that(calling(wait_for_boot).with_args(self.log_file_manager, process, "epics>", 60),
+                    raises(IocBootError, "fatal pattern"))
+
+        process.kill()
+
+    def test_that_GIVEN_an_ioc_started_in_the_background_WHEN_the_launched_process_exits_THEN_waiting_for_boot_returns(
+            self):
+        log_path = os.path.join(self.directory, "ioc.log")
+        pid_path = os.path.join(self.directory, "ioc.pid")
+        launched = subprocess.Popen([sys.executable, "-c", _STARTS_IOC_IN_BACKGROUND, log_path, pid_path])
+        self.log_file_manager.follow()
+        ioc = DaemonProcess(launched, lambda: _read_pid(pid_path))
+
+        try:
+            wait_for_boot(self.log_file_manager, ioc, "epics>", 10)
+
+            assert_that(ioc.poll(), is_(None))
+        finally:
+            launched.wait()
+            psutil.Process(_read_pid(pid_path)).kill()
+
+
+class BootTimesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.boot_times = BootTimes(os.path.join(self.directory, "boot_times.json"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_that_GIVEN_no_boot_times_THEN_the_timeout_is_the_maximum(self):
+        assert_that(self.boot_times.timeout("IOC_01_DEVSIM", 120), is_(equal_to(120)))
+
+    def test_that_GIVEN_fast_boots_THEN_the_timeout_is_the_minimum(self):
+        self.boot_times.record("IOC_01_DEVSIM", 2.0)
+
+        assert_that(self.boot_times.timeout("IOC_01_DEVSIM", 120), is_(equal_to(MINIMUM_BOOT_TIMEOUT)))
+
+    def test_that_GIVEN_slow_boots_THEN_the_timeout_is_a_multiple_of_the_longest(self):
+        self.boot_times.record("IOC_01_DEVSIM", 20.0)
+        self.boot_times.record("IOC_01_DEVSIM", 15.0)
+
+        assert_that(self.boot_times.timeout("IOC_01_DEVSIM", 120), is_(equal_to(60.0)))
@@ -0,0 +1,85 @@
+import unittest
+from hamcrest import assert_that, is_, equal_to, is_not, same_instance, contains_string
+from CaChannel import ca
+from ..channel_pool import ChannelPool
+
+# Names of pvs which no IOC serves, so the channels only connect when a test says they have
+PV_NAMES = ["TEST_CHANNEL_POOL:{}".format(index) for index in range(2)]
+
+
+def _set_connected(channel, connected):
+    # As channel access calls the connection callback
+    channel._on_connection_change((None, ca.CA_OP_CONN_UP if connected else ca.CA_OP_CONN_DOWN), None)
+
+
+class ChannelPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        ChannelPool.take_statistics()
+
+    def tearDown(self):
+        with ChannelPool._channels_lock:
+            for pv_name in PV_NAMES:
+                if pv_name in ChannelPool._channels:
+                    ChannelPool._release(pv_name)
+        ChannelPool.take_statistics()
+
+    def test_that_GIVEN_a_pv_WHEN_its_channel_is_got_twice_THEN_one_channel_is_created_and_counted(self):
+        first = ChannelPool.get(PV_NAMES[0])
+        second = ChannelPool.get(PV_NAMES[0])
+
+        assert_that(second, is_(same_instance(first)))
+        assert_that(ChannelPool.created, is_(equal_to(1)))
+
+    def test_that_GIVEN_a_connected_and_a_searching_pv_WHEN_checked_THEN_a_hit_and_a_miss_are_counted(self):
+        # Given:
+        _set_connected(ChannelPool.get(PV_NAMES[0]), True)
+        ChannelPool.get(PV_NAMES[1])
+
+        # When:
+        results = [ChannelPool.is_connected(pv_name, 0) for pv_name in PV_NAMES]
+
+        # Then:
+        assert_that(results, is_(equal_to([True, False])))
+        assert_that((ChannelPool.hits, ChannelPool.misses), is_(equal_to((1, 1))))
+
+    def test_that_GIVEN_a_channel_which_lost_its_connection_WHEN_the_pv_is_got_THEN_a_new_channel_replaces_it(self):
+        # Given:
+        channel = ChannelPool.get(PV_NAMES[0])
+        _set_connected(channel, True)
+        _set_connected(channel, False)
+
+        # When:
+        replacement = ChannelPool.get(PV_NAMES[0])
+
+        # Then:
+        assert_that(replacement, is_not(same_instance(channel)))
+        assert_that((ChannelPool.created, ChannelPool.released), is_(equal_to((2, 1))))
+
+    def test_that_GIVEN_a_disconnected_and_a_searching_channel_WHEN_released_THEN_only_the_disconnected_one_goes(self):
+        # Given:
+        disconnected = ChannelPool.get(PV_NAMES[0])
+        _set_connected(disconnected, True)
+        _set_connected(disconnected, False)
+        searching = ChannelPool.get(PV_NAMES[1])
+
+        # When:
+        ChannelPool.release_disconnected()
+
+        # Then:
+        assert_that(ChannelPool.get(PV_NAMES[1]), is_(same_instance(searching)))
+        assert_that(PV_NAMES[0] in ChannelPool._channels, is_(False))
+        assert_that(ChannelPool.take_statistics(), contains_string("(2 new, 1 released)"))
+
+    def test_that_GIVEN_a_subscribed_channel_WHEN_events_arrive_THEN_the_first_is_not_counted_as_an_update(self):
+        # Given:
+        channel = ChannelPool.get(PV_NAMES[0])
+        channel.subscribe()
+        update_count = channel.update_count
+
+        # When:
+        channel._on_update()
+        channel._on_update()
+
+        # Then:
+        assert_that(channel.update_count - update_count, is_(equal_to(1)))
@@ -0,0 +1,76 @@
+import unittest
+from hamcrest import assert_that, is_, equal_to, calling, raises, not_
+from ..device_launcher import launch_waves, launch_dependencies, device_fingerprint
+
+
+class LaunchWavesTests(unittest.TestCase):
+
+    def test_that_GIVEN_no_dependencies_THEN_all_devices_are_in_one_wave(self):
+        # When:
+        result = launch_waves(["a", "b", "c"], {})
+
+        # Then:
+        assert_that(result, is_(equal_to([["a", "b", "c"]])))
+
+    def test_that_GIVEN_a_chain_of_dependencies_THEN_each_device_is_after_the_devices_it_depends_on(self):
+        # Given:
+        depends_on = {"d": ["c"], "c": ["a", "b"]}
+
+        # When:
+        result = launch_waves(["d", "c", "b", "a"], depends_on)
+
+        # Then:
+        assert_that(result, is_(equal_to([["b", "a"], ["c"], ["d"]])))
+
+    def test_that_GIVEN_a_dependency_on_an_unknown_device_THEN_error_is_raised(self):
+        assert_that(calling(launch_waves).with_args(["a"], {"a": ["b"]}), raises(ValueError))
+
+    def test_that_GIVEN_circular_dependencies_THEN_error_is_raised(self):
+        assert_that(calling(launch_waves).with_args(["a", "b"], {"a": ["b"], "b": ["a"]}), raises(ValueError))
+
+
+class LaunchDependenciesTests(unittest.TestCase):
+
+    def test_that_GIVEN_iocs_without_depends_on_THEN_they_are_launched_one_at_a_time_in_the_order_listed(self):
+        dependencies = launch_dependencies([{"name": "ZFCNTRL_01"}, {"name": "KEPCO_01"}, {"name": "KEPCO_02"}])
+
+        assert_that(launch_waves(["ZFCNTRL_01", "KEPCO_01", "KEPCO_02"], dependencies),
+                    is_(equal_to([["ZFCNTRL_01"], ["KEPCO_01"], ["KEPCO_02"]])))
+
+    def test_that_GIVEN_iocs_with_depends_on_THEN_they_are_launched_once_their_dependencies_are_running(self):
+        dependencies = launch_dependencies([{"name": "GALIL_01"}, {"name": "REFL_01", "depends_on": ["GALIL_01"]},
+                                            {"name": "INSTETC_01", "depends_on": []}])
+
+        assert_that(launch_waves(["GALIL_01", "REFL_01", "INSTETC_01"], dependencies),
+                    is_(equal_to([["GALIL_01", "INSTETC_01"], ["REFL_01"]])))
+
+
+class DeviceFingerprintTests(unittest.TestCase):
+
+    def setUp(self):
+        self.ioc = {"name": "GALIL_01", "directory": "dir", "macros": {"MTRCTRL": "1", "EMULATOR_PORT": 1234},
+                    "inits": {"MTR0101.VMAX": 1}}
+
+    def test_that_GIVEN_iocs_which_differ_only_in_ports_and_inits_THEN_fingerprints_are_equal(self):
+        # Given:
+        other = {"name": "GALIL_01", "directory": "dir", "macros": {"MTRCTRL": "1", "EMULATOR_PORT": 5678}}
+
+        # Then:
+        assert_that(device_fingerprint(self.ioc, 1), is_(equal_to(device_fingerprint(other, 1))))
+
+    def test_that_GIVEN_iocs_with_different_macros_THEN_fingerprints_differ(self):
+        # Given:
+        other = {"name": "GALIL_01", "directory": "dir", "macros": {"MTRCTRL": "2"}}
+
+        # Then:
+        assert_that(device_fingerprint(self.ioc, 1), is_(not_(equal_to(device_fingerprint(other, 1)))))
+
+    def test_that_GIVEN_different_modes_THEN_fingerprints_differ(self):
+        assert_that(device_fingerprint(self.ioc, 1), is_(not_(equal_to(device_fingerprint(self.ioc, 2)))))
+
+    def test_that_GIVEN_an_ioc_with_a_pre_launch_hook_THEN_it_has_no_fingerprint(self):
+        # Given:
+        self.ioc["pre_ioc_launch_hook"] = lambda: None
+
+        # Then:
+        assert_that(device_fingerprint(self.ioc, 1), is_(None))
@@ -0,0 +1,105 @@
+import enum
+import socket
+import tempfile
+import threading
+import unittest
+from hamcrest import assert_that, is_, equal_to
+from lewis.core.control_server import ControlServer
+from ..emulator_launcher import LewisLauncher, InProcessLewisLauncher, BACKDOOR_GET, BACKDOOR_SET
+
+
+class _Mode(enum.Enum):
+    FAST = 1
+
+
+class _Device(object):
+    def __init__(self):
+        self.speed = 1.0
+        self.name = "chopper"
+        self.mode = _Mode.FAST
+
+    @property
+    def double_speed(self):
+        return 2 * self.speed
+
+
+class LewisLauncherBackdoorTests(unittest.TestCase):
+    """
+    Tests of the backdoor of the Lewis launcher against a Lewis control server in this process.
+    """
+
+    def setUp(self):
+        self.device = _Device()
+        with socket.socket() as free_port:
+            free_port.bind(("127.0.0.1", 0))
+            port = free_port.getsockname()[1]
+        self.server = ControlServer({"device": self.device}, "127.0.0.1:{}".format(port))
+        self.server.start_server()
+        self.stop = threading.Event()
+        self.server_thread = threading.Thread(target=self._serve)
+        self.server_thread.start()
+
+        self.launcher = LewisLauncher("test", "device", tempfile.gettempdir(), None, {})
+        self.launcher._control_port = port
+        self.launcher._connect_control_client()
+
+    def _serve(self):
+        while not self.stop.is_set():
+            self.server.process(blocking=True)
+
+    def tearDown(self):
+        self.launcher._disconnect_control_client()
+        self.stop.set()
+        self.server_thread.join()
+
+    def test_that_GIVEN_a_property_which_can_not_be_sent_WHEN_it_is_got_in_a_batch_THEN_the_backdoor_still_works(self):
+        self.launcher.backdoor_batch([(BACKDOOR_GET, "mode"), (BACKDOOR_GET, "mode")])
+
+        assert_that(self.launcher.backdoor_batch([(BACKDOOR_SET, "speed", 3.0), (BACKDOOR_GET, "speed")]),
+                    is_(equal_to([None, 3.0])))
+
+    def test_that_GIVEN_a_property_which_can_be_sent_at_first_WHEN_it_can_no_longer_be_sent_THEN_the_backdoor_still_works(
+            self):
+        self.device.mode = None
+        self.launcher.backdoor_batch([(BACKDOOR_GET, "mode"), (BACKDOOR_GET, "mode")])
+
+        self.device.mode = _Mode.FAST
+        self.launcher.backdoor_batch([(BACKDOOR_GET, "mode"), (BACKDOOR_GET, "mode")])
+
+        assert_that(self.launcher.backdoor_batch([(BACKDOOR_SET, "speed", 3.0), (BACKDOOR_GET, "speed")]),
+                    is_(equal_to([None, 3.0])))
+
+    def test_that_GIVEN_a_snapshot_WHEN_the_device_changes_and_it_is_restored_THEN_the_values_are_put_back(self):
+        # Given:
+        snapshot = self.launcher.snapshot()
+
+        # When:
+        self.device.speed = 5.0
+        self.device.name = "changed"
+        self.launcher.restore(snapshot)
+
+        # Then:
+        assert_that(self.launcher.supports_snapshot(), is_(True))
+        assert_that(snapshot, is_(equal_to({"speed": 1.0, "name": "chopper", "double_speed": 2.0})))
+        assert_that((self.device.speed, self.device.name), is_(equal_to((1.0, "chopper"))))
+
+
+class InProcessLewisLauncherTests(unittest.TestCase):
+
+    def setUp(self):
+        with socket.socket() as free_port:
+            free_port.bind(("127.0.0.1", 0))
+            self.port = free_port.getsockname()[1]
+        self.launcher = InProcessLewisLauncher("test", "example_motor", tempfile.gettempdir(), self.port,
+                                               {"lewis_package": "lewis.examples", "lewis_additional_path": None})
+
+    def test_that_GIVEN_a_value_set_through_the_backdoor_THEN_the_device_reports_it_on_its_port(self):
+        with self.launcher:
+            self.launcher.backdoor_set_on_device("target", 5.0)
+
+            with socket.create_connection(("127.0.0.1", self.port), timeout=5) as connection:
+                connection.sendall(b"T?\r\n")
+                reply = connection.recv(100)
+
+            assert_that(reply, is_(equal_to(b"5.0\r\n")))
+            assert_that(self.launcher.backdoor_get_from_device("target"), is_(equal_to(5.0)))
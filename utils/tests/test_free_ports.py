@@ -0,0 +1,39 @@
+import socket
+import threading
+import unittest
+from time import monotonic
+from hamcrest import assert_that, is_, equal_to, less_than
+from ..free_ports import wait_for_ports
+
+
+class WaitForPortsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_that_GIVEN_a_port_which_starts_listening_WHEN_waiting_for_it_THEN_the_wait_ends_soon_after(self):
+        # Given:
+        listen = threading.Timer(0.2, self.server.listen)
+        listen.start()
+        start = monotonic()
+
+        # When:
+        not_ready = wait_for_ports([self.port], 5)
+
+        # Then:
+        assert_that(not_ready, is_(equal_to([])))
+        assert_that(monotonic() - start, is_(less_than(1)))
+        listen.join()
+
+    def test_that_GIVEN_a_port_which_does_not_listen_WHEN_told_to_stop_waiting_THEN_the_port_is_returned(self):
+        start = monotonic()
+
+        not_ready = wait_for_ports([self.port], 5, stop_waiting=lambda: monotonic() - start > 0.2)
+
+        assert_that(not_ready, is_(equal_to([self.port])))
+        assert_that(monotonic() - start, is_(less_than(1)))
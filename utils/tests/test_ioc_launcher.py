@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import assert_that, is_, equal_to
+from .. import ioc_launcher
+
+
+class MacrosFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.var_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.var_dir)
+
+    def _launcher(self, name, macros):
+        return ioc_launcher.BaseLauncher("test", {"name": name, "directory": self.var_dir, "macros": macros},
+                                         ioc_launcher.TestModes.DEVSIM, self.var_dir)
+
+    def _macros_file_lines(self):
+        with open(os.path.join(self.var_dir, "tmp", "test_macros.txt")) as macros_file:
+            return sorted(macros_file.read().splitlines())
+
+    def test_that_GIVEN_two_iocs_started_together_WHEN_one_is_restarted_with_other_macros_THEN_both_have_theirs(self):
+        # Given:
+        first = self._launcher("FIRST_01", {"EMULATOR_PORT": "1", "MODE": "A"})
+        second = self._launcher("SECOND_01", {"EMULATOR_PORT": "2"})
+        first.create_macros_file()
+        second.create_macros_file()
+
+        # When:
+        first.macros = {"EMULATOR_PORT": "1"}
+        first.create_macros_file()
+
+        # Then:
+        assert_that(self._macros_file_lines(), is_(equal_to(
+            ['FIRST_01__EMULATOR_PORT="1"', 'SECOND_01__EMULATOR_PORT="2"'])))
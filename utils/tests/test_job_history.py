@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import assert_that, is_, equal_to, close_to
+from ..job_history import JobHistory, DEFAULT_JOB_DURATION
+
+
+class JobHistoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "history.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_that_GIVEN_no_history_THEN_job_is_estimated_to_take_the_default_time(self):
+        assert_that(JobHistory(self.path).estimate("module", "DEVSIM"), is_(equal_to(DEFAULT_JOB_DURATION)))
+
+    def test_that_GIVEN_a_saved_history_WHEN_loaded_THEN_job_is_estimated_to_take_its_recorded_time(self):
+        # Given:
+        history = JobHistory(self.path)
+        history.record("module", "DEVSIM", {"boot": 1.0, "tests": 2.0, "teardown": 3.0})
+        history.save()
+
+        # When:
+        result = JobHistory(self.path).estimate("module", "DEVSIM")
+
+        # Then:
+        assert_that(result, is_(close_to(6.0, 1e-9)))
+
+    def test_that_GIVEN_a_history_WHEN_job_has_not_been_run_THEN_it_is_estimated_to_take_the_mean_time(self):
+        # Given:
+        history = JobHistory(self.path)
+        history.record("module_1", "DEVSIM", {"boot": 1.0, "tests": 1.0, "teardown": 0.0})
+        history.record("module_2", "DEVSIM", {"boot": 2.0, "tests": 2.0, "teardown": 0.0})
+
+        # Then:
+        assert_that(history.estimate("module_3", "DEVSIM"), is_(close_to(3.0, 1e-9)))
@@ -0,0 +1,72 @@
+import threading
+import unittest
+from contextlib import contextmanager
+from time import sleep
+from hamcrest import assert_that, is_, equal_to, empty
+from ..job_pipeline import JobPipeline, device_claims
+
+
+class JobPipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.stopped = threading.Event()
+
+    @contextmanager
+    def _devices(self, name, error=None):
+        if error is not None:
+            raise error
+        self.events.append("launched {}".format(name))
+        yield
+        self.events.append("stopped {}".format(name))
+        self.stopped.set()
+
+    def test_that_GIVEN_modules_with_different_iocs_THEN_their_claims_do_not_overlap(self):
+        claims = device_claims([{"name": "GALIL_01", "emulator": "galil"}])
+
+        assert_that(claims & device_claims([{"name": "GALIL_02", "emulator_id": "galil_02"}]), is_(empty()))
+        assert_that(claims & device_claims([{"name": "SIMPLE", "custom_prefix": "GALIL_01"}]),
+                    is_(equal_to({("prefix", "GALIL_01"), ("existence pv", "GALIL_01:DISABLE")})))
+        assert_that(claims & device_claims([{"name": "GALIL_02", "icpconfigname": "GALIL_01"}]),
+                    is_(equal_to({("macros", "GALIL_01")})))
+
+    def test_that_GIVEN_a_job_launched_ahead_WHEN_it_is_run_THEN_its_devices_are_stopped_in_the_background(self):
+        # Given:
+        pipeline = JobPipeline(lambda job: (self._devices(job), {("ioc", job)}))
+        pipeline.launch_ahead("job")
+
+        # When:
+        with pipeline.devices("job"):
+            events_while_running = list(self.events)
+        self.stopped.wait(5)
+        pipeline.close()
+
+        # Then:
+        assert_that(events_while_running, is_(equal_to(["launched job"])))
+        assert_that(self.events, is_(equal_to(["launched job", "stopped job"])))
+
+    def test_that_GIVEN_a_job_whose_launch_fails_WHEN_its_devices_are_used_THEN_the_error_is_raised(self):
+        pipeline = JobPipeline(lambda job: (self._devices(job, ValueError("no IOC")), {("ioc", job)}))
+        pipeline.launch_ahead("job")
+
+        with self.assertRaises(ValueError):
+            with pipeline.devices("job"):
+                pass
+        pipeline.close()
+
+    def test_that_GIVEN_devices_stopping_WHEN_a_job_with_the_same_claims_is_launched_THEN_it_waits_for_them(self):
+        # Given:
+        def _stop_first():
+            sleep(0.5)
+            self.events.append("stopped first")
+
+        pipeline = JobPipeline(lambda job: (self._devices(job), {("ioc", "GALIL_01")}))
+        pipeline.stop_in_background("first", {("ioc", "GALIL_01")}, _stop_first)
+
+        # When:
+        with pipeline.devices("second"):
+            pass
+        pipeline.close()
+
+        # Then:
+        assert_that(self.events[:2], is_(equal_to(["stopped first", "launched second"])))
@@ -0,0 +1,41 @@
+import socket
+import unittest
+from hamcrest import assert_that, is_, equal_to, not_
+from lewis.core.control_server import ControlServer
+from ..lewis_host import DeviceHost
+
+
+def _free_port():
+    with socket.socket() as free_port:
+        free_port.bind(("127.0.0.1", 0))
+        return free_port.getsockname()[1]
+
+
+class DeviceHostTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ControlServer({}, "127.0.0.1:{}".format(_free_port()))
+        self.host = DeviceHost(self.server)
+
+    def tearDown(self):
+        self.host.remove_all_devices()
+
+    def test_that_GIVEN_two_devices_WHEN_a_value_is_set_on_one_THEN_only_that_device_has_it(self):
+        # Given:
+        for emulator_id in ("motor_1", "motor_2"):
+            self.host.add_device(emulator_id, "example_motor", "lewis.examples", "stream", _free_port(), 100)
+        exposed = self.server.exposed_object
+
+        # When:
+        exposed["motor_1.device.target:set"](5.0)
+
+        # Then:
+        assert_that(exposed["motor_1.device.target:get"](), is_(equal_to(5.0)))
+        assert_that(exposed["motor_2.device.target:get"](), is_(not_(equal_to(5.0))))
+
+    def test_that_GIVEN_a_device_WHEN_it_is_removed_THEN_it_is_no_longer_exposed(self):
+        self.host.add_device("motor_1", "example_motor", "lewis.examples", "stream", _free_port(), 100)
+
+        self.host.remove_device("motor_1")
+
+        assert_that(self.server.exposed_object.get_objects(), is_(equal_to([])))
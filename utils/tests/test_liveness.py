@@ -0,0 +1,33 @@
+import unittest
+from hamcrest import assert_that, is_, equal_to, contains_string
+from ..liveness import short_circuiting, DeviceGoneError
+
+
+class _Watcher(object):
+    cause = None
+
+
+class ShortCircuitingTests(unittest.TestCase):
+
+    def test_that_GIVEN_a_device_has_gone_THEN_the_remaining_tests_error_without_running(self):
+        # Given:
+        watcher = _Watcher()
+        ran = []
+
+        class DeviceTests(unittest.TestCase):
+            def test_first(self):
+                ran.append("first")
+                watcher.cause = "IOC DEVICE_01 exited with code 1"
+
+            def test_second(self):
+                ran.append("second")
+
+        result = short_circuiting(unittest.TestResult, watcher)()
+
+        # When:
+        unittest.TestSuite([DeviceTests("test_first"), DeviceTests("test_second")]).run(result)
+
+        # Then:
+        assert_that(ran, is_(equal_to(["first"])))
+        assert_that(len(result.errors), is_(equal_to(1)))
+        assert_that(result.errors[0][1], contains_string(DeviceGoneError.__name__))
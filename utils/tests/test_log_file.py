@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from hamcrest import assert_that, is_, equal_to
+from ..log_file import LogFileManager
+
+
+class LogFileManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file_name = os.path.join(self.directory, "ioc.log")
+        self.log_file_manager = LogFileManager(self.log_file_name)
+
+    def tearDown(self):
+        self.log_file_manager.close()
+        shutil.rmtree(self.directory)
+
+    def _follow_process_printing(self, text):
+        process = subprocess.Popen([sys.executable, "-c", "import sys; sys.stdout.write({!r})".format(text)],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.log_file_manager.follow(process.stdout)
+        return process
+
+    def test_that_GIVEN_a_prompt_without_a_newline_THEN_the_console_is_found(self):
+        process = self._follow_process_printing("iocInit\nepics> ")
+
+        self.log_file_manager.wait_for_console(5, "epics>")
+
+        process.wait()
+
+    def test_that_GIVEN_output_THEN_new_lines_are_read_and_written_to_the_log_file(self):
+        # Given:
+        process = self._follow_process_printing("first\nsecond\n")
+        process.wait()
+        self.log_file_manager.wait_for_text("second", 5)
+
+        # When:
+        self.log_file_manager.reading_from = 0
+        messages = self.log_file_manager.read_log()
+
+        # Then:
+        assert_that(messages, is_(equal_to(["first\n", "second\n"])))
+        assert_that(self.log_file_manager.read_log(), is_(equal_to([])))
+        with open(self.log_file_name) as log_file:
+            assert_that(log_file.read(), is_(equal_to("first\nsecond\n")))
+
+    def test_that_GIVEN_output_ended_without_the_text_THEN_waiting_for_it_returns_before_the_timeout(self):
+        process = self._follow_process_printing("Can't open st.cmd\n")
+        process.wait()
+
+        assert_that(self.log_file_manager.wait_for_text("epics>", 60), is_(False))
+
+    def test_that_GIVEN_output_which_is_not_all_utf_8_THEN_it_is_all_followed_and_written_to_the_log_file(self):
+        process = subprocess.Popen(
+            [sys.executable, "-c", r"import sys; sys.stdout.buffer.write(b'\xff caf\xc3\xa9 \xe2\x86\x92\nepics> ')"],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.log_file_manager.follow(process.stdout)
+
+        self.log_file_manager.wait_for_console(5, "epics>")
+
+        process.wait()
+        with open(self.log_file_name, encoding="utf-8") as log_file:
+            assert_that(log_file.read(), is_(equal_to("\ufffd caf\u00e9 \u2192\nepics> ")))
@@ -0,0 +1,31 @@
+import unittest
+from hamcrest import assert_that, is_, equal_to
+from ..module_manifest import parse_module
+
+MODULE_SOURCE = '''
+DEVICE_PREFIX = "DH2000_01"
+
+IOCS = [
+    {
+        "name": DEVICE_PREFIX,
+        "directory": get_default_ioc_dir("DH2000"),
+        "macros": {"MODE": "SIM", "PORT": EMULATOR_PORT},
+        "emulator": "dh2000",
+    },
+]
+
+TEST_MODES = [TestModes.DEVSIM]
+'''
+
+
+class ParseModuleTests(unittest.TestCase):
+
+    def test_that_GIVEN_iocs_with_values_which_are_not_literals_THEN_they_are_given_as_source_and_listed(self):
+        manifest_entry = parse_module(MODULE_SOURCE)
+
+        assert_that(manifest_entry, is_(equal_to({
+            "test_modes": ["DEVSIM"],
+            "iocs": [{"name": "DH2000_01", "directory": "get_default_ioc_dir('DH2000')",
+                      "macros": {"MODE": "SIM", "PORT": "EMULATOR_PORT"}, "emulator": "dh2000"}],
+            "unresolved_ioc_keys": [["directory", "macros"]],
+        })))
@@ -0,0 +1,63 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+import xmlrunner
+from hamcrest import assert_that, is_, equal_to, has_items, has_entries
+from ..phase_timing import PhaseTimingTestResult, take_phases
+
+
+def _device_tests(test_name):
+    # Made here rather than at module level so that the test runner does not collect it
+    class DeviceTests(unittest.TestCase):
+
+        def test_passes(self):
+            pass
+
+        def test_fails(self):
+            self.fail("failed")
+
+        def test_errors(self):
+            raise RuntimeError("errored")
+
+    return DeviceTests(test_name)
+
+
+class PhaseTimingTestResultTests(unittest.TestCase):
+
+    def setUp(self):
+        self.report_directory = tempfile.mkdtemp()
+        take_phases()
+
+    def tearDown(self):
+        take_phases()
+        shutil.rmtree(self.report_directory)
+
+    def _run(self, *test_names):
+        runner = xmlrunner.XMLTestRunner(output=self.report_directory, stream=io.StringIO(),
+                                         resultclass=PhaseTimingTestResult)
+        return runner.run(unittest.TestSuite([_device_tests(name) for name in test_names]))
+
+    def _report(self):
+        report_files = os.listdir(self.report_directory)
+        assert_that(len(report_files), is_(equal_to(1)))
+        return ElementTree.parse(os.path.join(self.report_directory, report_files[0])).getroot()
+
+    def test_that_GIVEN_a_test_WHEN_it_is_run_THEN_its_set_up_test_method_and_tear_down_are_recorded_as_phases(self):
+        self._run("test_passes")
+
+        test_id = _device_tests("test_passes").id()
+        assert_that([(phase["phase"], phase["subject"]) for phase in take_phases()],
+                    is_(equal_to([("setUp", test_id), ("test", test_id), ("tearDown", test_id)])))
+
+    def test_that_GIVEN_failing_and_erroring_tests_WHEN_they_are_run_THEN_the_report_has_them_and_the_phases(self):
+        result = self._run("test_passes", "test_fails", "test_errors")
+
+        report = self._report()
+        assert_that((len(result.failures), len(result.errors)), is_(equal_to((1, 1))))
+        assert_that([element.tag for element in report.iter() if element.tag in ("failure", "error")],
+                    has_items("failure", "error"))
+        properties = {element.get("name"): element.get("value") for element in report.iter("property")}
+        assert_that(properties, has_entries({"phase test {}".format(_device_tests("test_fails").id()): is_(str)}))
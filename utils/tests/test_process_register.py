@@ -0,0 +1,101 @@
+import subprocess
+import sys
+import unittest
+from time import monotonic, sleep
+from hamcrest import assert_that, is_, equal_to, less_than
+import psutil
+from ..process_register import ProcessRegister, DaemonProcess, process_creation_options
+
+_PARENT_OF_SLEEPING_CHILD = ("import subprocess, sys, time; "
+                             "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']); "
+                             "print('started', flush=True); time.sleep(60)")
+
+_STARTS_SLEEPING_CHILD_AND_EXITS = ("import subprocess, sys; "
+                                    "child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']); "
+                                    "print(child.pid, flush=True)")
+
+# Restarts a child which exits straight away, as procServ restarts an IOC with --autorestart
+_RESTARTS_CHILD = ("import subprocess, sys, time\n"
+                   "print('started', flush=True)\n"
+                   "while True:\n"
+                   "    subprocess.call([sys.executable, '-c', 'pass'])\n"
+                   "    time.sleep(0.1)\n")
+
+_IGNORES_TERMINATE = ("import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+                      "print('started', flush=True); time.sleep(60)")
+
+
+class ProcessRegisterTests(unittest.TestCase):
+
+    def _start(self, script):
+        process = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE,
+                                   **process_creation_options())
+        process.stdout.readline()
+        ProcessRegister.add_process(process.pid, "test process")
+        return process
+
+    def test_that_GIVEN_a_process_with_a_child_WHEN_stopped_THEN_both_have_exited(self):
+        # Given:
+        process = self._start(_PARENT_OF_SLEEPING_CHILD)
+        children = psutil.Process(process.pid).children(recursive=True)
+
+        # When:
+        still_running = ProcessRegister.stop([process.pid])
+
+        # Then:
+        assert_that(still_running, is_(equal_to([])))
+        assert_that(any(child.is_running() and child.status() != psutil.STATUS_ZOMBIE for child in children),
+                    is_(False))
+        process.wait()
+
+    def test_that_GIVEN_a_process_which_ignores_terminate_WHEN_stopped_THEN_it_is_killed_after_the_timeout(self):
+        process = self._start(_IGNORES_TERMINATE)
+        start = monotonic()
+
+        ProcessRegister.stop([process.pid], terminate_timeout=0.5)
+
+        assert_that(monotonic() - start, is_(less_than(5)))
+        assert_that(process.poll() is not None, is_(True))
+
+    def test_that_GIVEN_a_stopped_process_THEN_it_is_no_longer_registered(self):
+        process = self._start(_IGNORES_TERMINATE)
+
+        ProcessRegister.stop([process.pid], terminate_timeout=0)
+
+        assert_that(process.pid in ProcessRegister.RegisteredProcesses, is_(False))
+        process.wait()
+
+
+class DaemonProcessTests(unittest.TestCase):
+
+    def test_that_GIVEN_a_process_started_in_the_background_WHEN_it_exits_THEN_it_is_seen_to_have_exited(self):
+        # Given:
+        launched = subprocess.Popen([sys.executable, "-c", _STARTS_SLEEPING_CHILD_AND_EXITS], stdout=subprocess.PIPE)
+        background = psutil.Process(int(launched.stdout.readline()))
+        launched.wait()
+        launched.stdout.close()
+        daemon = DaemonProcess(launched, lambda: background.pid)
+        assert_that(daemon.poll(), is_(None))
+
+        # When:
+        background.kill()
+        background.wait()
+
+        # Then:
+        assert_that(daemon.poll(), is_(equal_to(DaemonProcess.EXITED_CODE)))
+
+    def test_that_GIVEN_a_process_in_the_background_WHEN_its_child_is_restarted_THEN_it_is_still_running(self):
+        launched = subprocess.Popen([sys.executable, "-c", "pass"])
+        launched.wait()
+        background = subprocess.Popen([sys.executable, "-c", _RESTARTS_CHILD], stdout=subprocess.PIPE)
+        background.stdout.readline()
+        daemon = DaemonProcess(launched, lambda: background.pid)
+
+        try:
+            for _ in range(5):
+                assert_that(daemon.poll(), is_(None))
+                sleep(0.1)
+        finally:
+            background.kill()
+            background.wait()
+            background.stdout.close()
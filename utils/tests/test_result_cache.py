@@ -0,0 +1,68 @@
+import ast
+import os
+import shutil
+import tempfile
+import unittest
+from hamcrest import assert_that, is_, equal_to, has_item
+from ..result_cache import ResultCache, _data_paths, _ioc_top, REPOSITORY_ROOT
+
+
+class ResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.reports = os.path.join(self.directory, "reports")
+        os.makedirs(self.reports)
+        with open(os.path.join(self.reports, "TEST-module.xml"), "w") as report:
+            report.write('<?xml version="1.0" ?><testsuite name="module"><testcase name="test"/></testsuite>')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_that_GIVEN_an_ioc_boot_directory_THEN_the_ioc_top_is_above_it(self):
+        directory = os.path.join("ioc", "master", "AMINT2L", "iocBoot", "iocAMINT2L-IOC-01")
+
+        assert_that(_ioc_top(directory), is_(equal_to(os.path.join("ioc", "master", "AMINT2L"))))
+
+    def test_that_GIVEN_a_joined_path_into_test_config_THEN_it_is_an_input(self):
+        tree = ast.parse('CONFIG = os.path.join("test_config", "good_for_refl")')
+
+        assert_that(_data_paths(tree), has_item(os.path.join(REPOSITORY_ROOT, "test_config", "good_for_refl")))
+
+    def test_that_GIVEN_stored_reports_WHEN_inputs_are_unchanged_THEN_they_are_restored(self):
+        # Given:
+        ResultCache(self.directory).store("module:Device sim:module", "hash", self.reports)
+        destination = os.path.join(self.directory, "restored")
+
+        # When:
+        result = ResultCache(self.directory).restore("module:Device sim:module", "hash", destination)
+
+        # Then:
+        assert_that(result, is_(True))
+        assert_that(os.listdir(destination), is_(equal_to(["TEST-module.xml"])))
+
+    def test_that_GIVEN_stored_reports_WHEN_inputs_have_changed_THEN_they_are_not_restored(self):
+        ResultCache(self.directory).store("module:Device sim:module", "hash", self.reports)
+
+        result = ResultCache(self.directory).restore("module:Device sim:module", "other hash",
+                                                     os.path.join(self.directory, "restored"))
+
+        assert_that(result, is_(False))
+
+    def test_that_GIVEN_stored_reports_WHEN_an_input_changes_THEN_the_job_is_no_longer_held_unchanged(self):
+        # Given:
+        module_path = os.path.join(self.directory, "module.py")
+        with open(module_path, "w") as module_file:
+            module_file.write("IOCS = []\n")
+        cache = ResultCache(self.directory)
+        cache.store("module:Device sim:module", cache.inputs_hash("module:Device sim:module", module_path, []),
+                    self.reports)
+        held_before = ResultCache(self.directory).holds_unchanged("module:Device sim:module")
+
+        # When:
+        with open(module_path, "w") as module_file:
+            module_file.write("IOCS = [{}]\n")
+
+        # Then:
+        assert_that((held_before, ResultCache(self.directory).holds_unchanged("module:Device sim:module")),
+                    is_(equal_to((True, False))))
@@ -0,0 +1,33 @@
+import unittest
+from hamcrest import assert_that, is_, equal_to, calling, raises
+from ..sharding import parse_shard, assign_shards
+
+
+class ShardingTests(unittest.TestCase):
+
+    def test_that_GIVEN_a_shard_THEN_it_is_parsed(self):
+        assert_that(parse_shard("2/4"), is_(equal_to((2, 4))))
+
+    def test_that_GIVEN_a_shard_index_out_of_range_THEN_error_is_raised(self):
+        assert_that(calling(parse_shard).with_args("5/4"), raises(ValueError))
+
+    def test_that_GIVEN_no_durations_THEN_every_job_is_assigned_to_a_shard(self):
+        # Given:
+        keys = ["module_{}:Device sim".format(index) for index in range(20)]
+
+        # When:
+        result = assign_shards(keys, 3)
+
+        # Then:
+        assert_that(sorted(result.keys()), is_(equal_to(sorted(keys))))
+        assert_that(set(result.values()) <= {1, 2, 3}, is_(True))
+
+    def test_that_GIVEN_durations_THEN_jobs_are_balanced_by_time(self):
+        # Given:
+        durations = {"a": 10.0, "b": 6.0, "c": 5.0, "d": 4.0}
+
+        # When:
+        result = assign_shards(durations.keys(), 2, durations)
+
+        # Then:
+        assert_that(result, is_(equal_to({"a": 1, "b": 2, "c": 2, "d": 1})))